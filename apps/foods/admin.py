@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.contrib.postgres.fields import ArrayField
 from django import forms
 
+from .costing import refresh_food_costs
 from .models import Food, Dessert, FoodIngredient, MEAL_TYPE_CHOICES
 
 
@@ -41,12 +42,17 @@ class FoodAdminForm(forms.ModelForm):
 @admin.register(Food)
 class FoodAdmin(admin.ModelAdmin):
     form = FoodAdminForm
-    list_display = ('title', 'category', 'meal_types_display', 'preparation_time', 'unit_price', 'created_at', 'updated_at')
+    list_display = ('title', 'category', 'meal_types_display', 'preparation_time', 'unit_price', 'recipe_cost', 'created_at', 'updated_at')
     list_filter = ('category',)
     search_fields = ('title',)
     ordering = ('title',)
     inlines = (FoodIngredientInline,)
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('recipe_cost', 'created_at', 'updated_at')
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # The inline may have changed the recipe
+        refresh_food_costs([form.instance.id])
     
     def meal_types_display(self, obj):
         """Display meal types as comma-separated Persian labels"""
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_migrate
 
 
 class FoodsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.foods"
+
+    def ready(self):
+        from .upgrade import merge_duplicate_recipe_lines
+        # Runs before the generated migrations add the unique constraint
+        pre_migrate.connect(merge_duplicate_recipe_lines, sender=self)
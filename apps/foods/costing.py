@@ -0,0 +1,79 @@
+"""
+بهای تمام‌شده غذا
+Food.recipe_cost is the cost of one serving: the sum over its recipe
+lines of amount_per_serving, converted to the ingredient's unit, times the
+ingredient's unit_price. It is stored so listings and the margin report
+never add up recipes. A recipe line whose unit cannot be converted to the
+ingredient's makes the cost unknown (NULL) rather than a guess.
+
+Only affected foods are recomputed: those whose recipe changed
+(refresh_food_costs), or those using a repriced ingredient, found through
+the (ingredient, food) index on FoodIngredient (reprice_ingredients).
+"""
+from django.db import connection
+
+from apps.ingredients.models import Ingredient
+from apps.ingredients.units import factors_sql
+
+from .models import Food, FoodIngredient
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _refresh(affected_sql, params, restrict=True):
+    """
+    Recompute recipe_cost of the foods selected by affected_sql (a query
+    of food ids), writing only the ones that change. Returns the number of
+    foods written.
+    """
+    factors = factors_sql('ARRAY(SELECT ingredient_id FROM line)' if restrict else None)
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            WITH affected AS ({affected_sql}), line AS (
+                SELECT usage.food_id, usage.ingredient_id, usage.unit, usage.amount_per_serving
+                FROM {_table(FoodIngredient)} AS usage
+                WHERE usage.food_id IN (SELECT id FROM affected)
+            ), factor AS ({factors}), cost AS (
+                SELECT affected.id, CASE
+                    WHEN bool_or(line.food_id IS NOT NULL AND factor.factor IS NULL) THEN NULL
+                    ELSE round(COALESCE(SUM(line.amount_per_serving * factor.factor * ingredient.unit_price), 0), 4)
+                END AS cost
+                FROM affected
+                LEFT JOIN line ON line.food_id = affected.id
+                LEFT JOIN {_table(Ingredient)} AS ingredient ON ingredient.id = line.ingredient_id
+                LEFT JOIN factor ON factor.ingredient_id = line.ingredient_id AND factor.unit = line.unit
+                GROUP BY affected.id
+            )
+            UPDATE {_table(Food)} AS food
+            SET recipe_cost = cost.cost
+            FROM cost
+            WHERE food.id = cost.id AND food.recipe_cost IS DISTINCT FROM cost.cost
+        """, params)
+        return cursor.rowcount
+
+
+def refresh_food_costs(food_ids=None):
+    """Recompute the recipe cost of food_ids, or of every food when None"""
+    if food_ids is None:
+        return _refresh(f'SELECT id FROM {_table(Food)}', {}, restrict=False)
+    food_ids = list(set(food_ids))
+    if not food_ids:
+        return 0
+    return _refresh('SELECT unnest(%(ids)s::bigint[]) AS id', {'ids': food_ids})
+
+
+def reprice_ingredients(ingredient_ids):
+    """
+    Recompute the recipe cost of the foods using ingredient_ids, after
+    their price (or unit, density, piece weight) changed.
+    """
+    ingredient_ids = list(set(ingredient_ids))
+    if not ingredient_ids:
+        return 0
+    return _refresh(f"""
+        SELECT DISTINCT food_id AS id
+        FROM {_table(FoodIngredient)}
+        WHERE ingredient_id = ANY(%(ids)s)
+    """, {'ids': ingredient_ids})
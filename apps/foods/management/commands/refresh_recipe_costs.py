@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.foods.costing import refresh_food_costs
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the stored per-serving recipe cost of every food. Edits keep the costs current; '
+        'run this once after the column is added, or after changing prices outside the API.'
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        changed = refresh_food_costs()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'changed={changed} elapsed={elapsed:.3f}s'))
@@ -8,8 +8,10 @@ from apps.ingredients.models import (
     Ingredient, 
     CATEGORY_TYPE_CHOICES, 
     SUBCATEGORY_CHOICES,
-    CATEGORY_SUBCATEGORY_MAP
+    CATEGORY_SUBCATEGORY_MAP,
+    UNIT_CHOICES,
 )
+from apps.ingredients.units import UnitConversionError, ingredient_factor
 
 
 MEAL_TYPE_CHOICES = [
@@ -55,6 +57,15 @@ class Food(models.Model):
         verbose_name='قیمت واحد',
         validators=[MinValueValidator(0)],
     )
+    # Per serving, from the recipe and ingredient prices; maintained by apps.foods.costing
+    recipe_cost = models.DecimalField(
+        max_digits=12,
+        decimal_places=4,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='بهای تمام‌شده هر سرو',
+    )
     created_at = jmodels.jDateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
     updated_at = jmodels.jDateTimeField(auto_now=True, verbose_name='تاریخ به‌روزرسانی')
 
@@ -101,6 +112,14 @@ class FoodIngredient(models.Model):
         decimal_places=2,
         validators=[MinValueValidator(0)],
     )
+    unit = models.CharField(
+        max_length=150,
+        choices=UNIT_CHOICES,
+        blank=True,
+        default='',
+        verbose_name='واحد',
+        help_text='خالی یعنی واحد ماده اولیه',
+    )
     created_at = jmodels.jDateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
     updated_at = jmodels.jDateTimeField(auto_now=True, verbose_name='تاریخ به‌روزرسانی')
 
@@ -108,6 +127,13 @@ class FoodIngredient(models.Model):
         verbose_name = 'مواد اولیه غذا'
         verbose_name_plural = 'مواد اولیه غذاها'
         ordering = ['food']
+        constraints = [
+            models.UniqueConstraint(fields=['food', 'ingredient'], name='foodingredient_food_ingredient_uniq'),
+        ]
+        indexes = [
+            # Reverse index: the foods using an ingredient, read index-only when it is repriced
+            models.Index(fields=['ingredient', 'food'], name='foodingredient_ingr_food_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"{self.food.title} - {self.ingredient.name}"
@@ -133,6 +159,12 @@ class FoodIngredient(models.Model):
                     'ingredient': f'زیر دسته‌بندی ماده اولیه {ingredient_subcategory_label} هست که با زیر دسته‌بندی غذا مطابقت نداره'
                 })
 
+            # Check the unit converts to the ingredient's unit
+            try:
+                ingredient_factor(ingredient, self.unit)
+            except UnitConversionError as e:
+                raise ValidationError({'unit': str(e)})
+
     def save(self, *args, **kwargs):
         self.full_clean()
         return super().save(*args, **kwargs)
@@ -1,16 +1,27 @@
+from django.db import transaction
 from rest_framework import serializers
 
-from apps.ingredients.models import Ingredient, CATEGORY_TYPE_CHOICES, SUBCATEGORY_CHOICES
+from apps.ingredients.models import Ingredient, CATEGORY_TYPE_CHOICES, SUBCATEGORY_CHOICES, UNIT_CHOICES
+from apps.ingredients.units import UnitConversionError, ingredient_factor
+from .costing import refresh_food_costs
 from .models import Dessert, Food, FoodIngredient
 
 
 class FoodIngredientWriteSerializer(serializers.Serializer):
-    ingredient = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    # An id; FoodManagementSerializer.validate loads the whole batch in one query
+    ingredient = serializers.IntegerField(min_value=1)
     amount_per_serving = serializers.DecimalField(
         max_digits=10,
         decimal_places=2,
         min_value=0
     )
+    unit = serializers.ChoiceField(
+        choices=UNIT_CHOICES,
+        required=False,
+        allow_blank=True,
+        default='',
+        help_text='واحد مقدار هر سرو؛ خالی یعنی واحد ماده اولیه',
+    )
 
 
 
@@ -21,7 +32,7 @@ class FoodIngredientReadSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = FoodIngredient
-        fields = ['id', 'ingredient', 'ingredient_name', 'ingredient_category', 'ingredient_subcategory', 'amount_per_serving']
+        fields = ['id', 'ingredient', 'ingredient_name', 'ingredient_category', 'ingredient_subcategory', 'amount_per_serving', 'unit']
         read_only_fields = ['id', 'ingredient_name', 'ingredient_category', 'ingredient_subcategory']
 
     def get_ingredient_category(self, obj):
@@ -65,12 +76,13 @@ class FoodManagementSerializer(serializers.ModelSerializer):
             'meal_types_display',
             'preparation_time',
             'unit_price',
+            'recipe_cost',
             'ingredients',
             'ingredients_detail',
             'created_at',
             'updated_at',
         ]
-        read_only_fields = ['id', 'ingredients_detail', 'created_at', 'updated_at', 'category', 'subcategory', 'meal_types_display']
+        read_only_fields = ['id', 'recipe_cost', 'ingredients_detail', 'created_at', 'updated_at', 'category', 'subcategory', 'meal_types_display']
 
     def get_category(self, obj):
         """Return Persian label for category"""
@@ -122,8 +134,20 @@ class FoodManagementSerializer(serializers.ModelSerializer):
                 })
 
         if ingredients:
+            ingredient_ids = [item['ingredient'] for item in ingredients]
+            if len(set(ingredient_ids)) != len(ingredient_ids):
+                raise serializers.ValidationError({
+                    'ingredients': 'هر ماده اولیه فقط یک بار می‌تواند برای غذا ثبت شود.'
+                })
+            # The whole batch in one query, checked in memory
+            found = Ingredient.objects.in_bulk(ingredient_ids)
+            missing = [str(pk) for pk in ingredient_ids if pk not in found]
+            if missing:
+                raise serializers.ValidationError({
+                    'ingredients': f"ماده اولیه با شناسه {', '.join(missing)} یافت نشد."
+                })
             for item in ingredients:
-                ingredient = item['ingredient']
+                ingredient = item['ingredient'] = found[item['ingredient']]
                 # Check category match
                 if ingredient.category != category:
                     category_dict = dict(CATEGORY_TYPE_CHOICES)
@@ -138,6 +162,13 @@ class FoodManagementSerializer(serializers.ModelSerializer):
                     raise serializers.ValidationError({
                         'ingredients': f"ماده اولیه «{ingredient.name}» زیر دسته‌بندی {ingredient_subcategory_label} هست که با زیر دسته‌بندی غذا مطابقت نداره"
                     })
+                # Check the unit converts to the ingredient's unit
+                try:
+                    ingredient_factor(ingredient, item.get('unit'))
+                except UnitConversionError as e:
+                    raise serializers.ValidationError({
+                        'ingredients': f"ماده اولیه «{ingredient.name}»: {e}"
+                    })
         elif category and subcategory and self.instance:
             # Check if existing ingredients match new category/subcategory
             category_mismatch = self.instance.ingredients.exclude(
@@ -175,24 +206,53 @@ class FoodManagementSerializer(serializers.ModelSerializer):
         return attrs
 
     def _sync_ingredients(self, food: Food, ingredients_data):
+        """
+        Bring the food's recipe lines to ingredients_data (validated above, so
+        FoodIngredient.clean is not run again): removed lines are deleted, and
+        new or changed ones upserted on (food, ingredient) in one statement.
+        Unchanged lines are not written and every line keeps its id.
+        """
         if ingredients_data is None:
             return
-        food.ingredients.all().delete()
-        FoodIngredient.objects.bulk_create([
-            FoodIngredient(
-                food=food,
-                ingredient=item['ingredient'],
-                amount_per_serving=item['amount_per_serving'],
-            )
+        line_ids = {}
+        current = {}
+        for pk, ingredient_id, amount, unit in FoodIngredient.objects.filter(food=food).values_list(
+            'id', 'ingredient_id', 'amount_per_serving', 'unit'
+        ):
+            line_ids[ingredient_id] = pk
+            current[ingredient_id] = (amount, unit)
+        wanted = {
+            item['ingredient'].id: (item['amount_per_serving'], item.get('unit', ''))
             for item in ingredients_data
-        ])
+        }
+
+        removed = [pk for ingredient_id, pk in line_ids.items() if ingredient_id not in wanted]
+        upserts = [
+            FoodIngredient(food=food, ingredient_id=ingredient_id, amount_per_serving=amount, unit=unit)
+            for ingredient_id, (amount, unit) in wanted.items()
+            if current.get(ingredient_id) != (amount, unit)
+        ]
+        if removed:
+            FoodIngredient.objects.filter(id__in=removed).delete()
+        if upserts:
+            FoodIngredient.objects.bulk_create(
+                upserts,
+                update_conflicts=True,
+                unique_fields=['food', 'ingredient'],
+                update_fields=['amount_per_serving', 'unit', 'updated_at'],
+            )
+        if removed or upserts:
+            refresh_food_costs([food.id])
+            food.refresh_from_db(fields=['recipe_cost'])
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients', [])
         food = Food.objects.create(**validated_data)
         self._sync_ingredients(food, ingredients_data)
         return food
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('ingredients', None)
         for attr, value in validated_data.items():
@@ -263,3 +323,23 @@ class DessertSerializer(serializers.ModelSerializer):
         
         return attrs
 
+
+class FoodMarginSerializer(serializers.ModelSerializer):
+    """Serializer for the margin report (حاشیه سود غذاها)"""
+    category = serializers.SerializerMethodField()
+    subcategory = serializers.SerializerMethodField()
+    margin = serializers.DecimalField(max_digits=14, decimal_places=4, read_only=True)
+    margin_percent = serializers.DecimalField(max_digits=8, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Food
+        fields = ['id', 'title', 'category', 'subcategory', 'unit_price', 'recipe_cost', 'margin', 'margin_percent']
+        read_only_fields = fields
+
+    def get_category(self, obj):
+        """Return Persian label for category"""
+        return dict(CATEGORY_TYPE_CHOICES).get(obj.category, obj.category)
+
+    def get_subcategory(self, obj):
+        """Return Persian label for subcategory"""
+        return dict(SUBCATEGORY_CHOICES).get(obj.subcategory, obj.subcategory)
@@ -0,0 +1,42 @@
+from rest_framework.test import APITestCase
+
+from apps.accounts.models import User
+from apps.ingredients.models import Ingredient
+
+from .costing import reprice_ingredients
+from .models import Food, FoodIngredient
+
+
+class RecipeCostTest(APITestCase):
+    """A recipe line that cannot be converted makes the cost unknown, not a 1:1 guess"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='kitchen', roles=['kitchen_manager'])
+        cls.ingredient = Ingredient.objects.create(
+            name='ماده', code='ING-1', unit='kg', category='normal', subcategory='staff',
+            unit_price=1000, warning_amount=10,
+        )
+        cls.food = Food.objects.create(
+            title='غذا', category='normal', subcategory='staff',
+            meal_types=['lunch'], preparation_time=10, unit_price=500,
+        )
+        FoodIngredient.objects.create(food=cls.food, ingredient=cls.ingredient, amount_per_serving=200, unit='g')
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def _margin(self):
+        response = self.client.get('/api/foods/margins/')
+        self.assertEqual(response.status_code, 200)
+        [row] = response.data
+        return row['recipe_cost'], row['margin']
+
+    def test_unconvertible_line(self):
+        reprice_ingredients([self.ingredient.id])
+        self.assertEqual(self._margin(), ('200.0000', '300.0000'))
+
+        # Without a density, grams cannot become litres
+        Ingredient.objects.filter(id=self.ingredient.id).update(unit='l')
+        reprice_ingredients([self.ingredient.id])
+        self.assertEqual(self._margin(), (None, None))
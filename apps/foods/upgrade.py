@@ -0,0 +1,33 @@
+"""
+مهاجرت داده‌های موجود
+Data steps that accompany schema changes; see apps.ingredients.upgrade.
+"""
+from django.db import connections
+
+from .models import FoodIngredient
+
+
+def merge_duplicate_recipe_lines(using='default', **kwargs):
+    """
+    pre_migrate: merge a food's duplicate lines of one ingredient into the
+    oldest one before foodingredient_food_ingredient_uniq is added, summing
+    amount_per_serving. Lines predating the constraint have no unit column
+    (it came later), so all of them are in the ingredient's own unit.
+    """
+    connection = connections[using]
+    table = FoodIngredient._meta.db_table
+    quoted = connection.ops.quote_name(table)
+    with connection.cursor() as cursor:
+        if table not in connection.introspection.table_names(cursor):
+            return
+        if 'foodingredient_food_ingredient_uniq' in connection.introspection.get_constraints(cursor, table):
+            return
+        cursor.execute(f"""
+            SELECT array_agg(id ORDER BY id), SUM(amount_per_serving)
+            FROM {quoted}
+            GROUP BY food_id, ingredient_id
+            HAVING COUNT(*) > 1
+        """)
+        for ids, amount in cursor.fetchall():
+            cursor.execute(f'UPDATE {quoted} SET amount_per_serving = %s WHERE id = %s', [amount, ids[0]])
+            cursor.execute(f'DELETE FROM {quoted} WHERE id = ANY(%s)', [ids[1:]])
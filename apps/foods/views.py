@@ -1,7 +1,7 @@
 from rest_framework import mixins, permissions, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Count, Q, Sum
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Q, Sum, When
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
@@ -9,7 +9,7 @@ from drf_yasg import openapi
 from apps.accounts.permissions import KitchenAccess, RestaurantOrKitchenAccess, RestaurantOrTokenIssuerAccess
 
 from .models import Dessert, Food
-from .serializers import DessertSerializer, FoodManagementSerializer
+from .serializers import DessertSerializer, FoodManagementSerializer, FoodMarginSerializer
 from apps.ingredients.models import CATEGORY_TYPE_CHOICES, SUBCATEGORY_CHOICES
 from apps.menu.models import MenuPlan
 
@@ -119,6 +119,32 @@ class FoodManagementViewSet(
     )
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
+
+    @action(detail=False, methods=['get'], url_path='margins')
+    @swagger_auto_schema(
+        operation_summary="Food margin report",
+        operation_description="Price, stored per-serving recipe cost and margin of each food, lowest margin first. recipe_cost, margin and margin_percent are null when the cost is unknown (a recipe line's unit cannot be converted to its ingredient's unit); those foods come last. Accessible to restaurant managers and kitchen managers.",
+        manual_parameters=[
+            openapi.Parameter('category', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False),
+            openapi.Parameter('subcategory', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False),
+        ],
+        responses={200: FoodMarginSerializer(many=True)},
+    )
+    def margins(self, request):
+        """Margins from the stored recipe costs; no recipe is added up here"""
+        margin = ExpressionWrapper(F('unit_price') - F('recipe_cost'), output_field=DecimalField())
+        foods = Food.objects.annotate(
+            margin=margin,
+            margin_percent=Case(
+                When(unit_price__gt=0, then=ExpressionWrapper(margin * 100 / F('unit_price'), output_field=DecimalField()))
+            ),
+        )
+        for field in ('category', 'subcategory'):
+            value = request.query_params.get(field)
+            if value:
+                foods = foods.filter(**{field: value})
+        foods = foods.order_by(F('margin_percent').asc(nulls_last=True), 'title')
+        return Response(FoodMarginSerializer(foods, many=True).data)
     
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     @swagger_auto_schema(
@@ -1,6 +1,11 @@
 from django.contrib import admin
 
-from .models import Ingredient, InventoryStock, InventoryLog, MaterialConsumption, InventoryStockUpdate
+from apps.foods.costing import reprice_ingredients
+
+from .models import (
+    Ingredient, InventoryStock, InventoryLog, MaterialConsumption, InventoryStockUpdate, StockMovement, StockSnapshot,
+)
+from .reorder import refresh_reorder_points
 
 
 
@@ -12,13 +17,20 @@ class IngredientAdmin(admin.ModelAdmin):
     ordering = ('name',)
     readonly_fields = ('created_at', 'updated_at')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            reprice_ingredients([obj.id])
+            refresh_reorder_points([obj.id])
+
 
 @admin.register(InventoryStock)
 class InventoryStockAdmin(admin.ModelAdmin):
-    list_display = ('ingredient', 'total_amount', 'last_received_date', 'created_at', 'updated_at')
+    list_display = ('ingredient', 'total_amount', 'reorder_point', 'is_low', 'last_received_date', 'created_at', 'updated_at')
+    list_filter = ('is_low',)
     search_fields = ('ingredient__name',)
     autocomplete_fields = ('ingredient',)
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('daily_usage', 'reorder_point', 'is_low', 'created_at', 'updated_at')
 
 
 @admin.register(InventoryLog)
@@ -48,3 +60,30 @@ class InventoryStockUpdateAdmin(admin.ModelAdmin):
     autocomplete_fields = ('ingredient', 'created_by')
     readonly_fields = ('created_at', 'updated_at')
     raw_id_fields = ('ingredient',)
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('ingredient', 'kind', 'amount', 'balance', 'date', 'created_at')
+    list_filter = ('kind', 'date')
+    search_fields = ('ingredient__name', 'ingredient__code')
+    raw_id_fields = ('ingredient', 'inventory_log', 'material_consumption', 'stock_update')
+
+    # The ledger is append-only and written by apps.ingredients.stock
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('ingredient', 'date', 'balance', 'created_at')
+    list_filter = ('date',)
+    search_fields = ('ingredient__name', 'ingredient__code')
+    raw_id_fields = ('ingredient',)
+    readonly_fields = ('created_at',)
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class IngredientsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.ingredients"
+
+    def ready(self):
+        from .upgrade import compute_reorder_points, merge_duplicate_stocks
+        # Runs before the generated migrations add the unique constraint
+        pre_migrate.connect(merge_duplicate_stocks, sender=self)
+        # Runs once the generated migrations have added the reorder columns
+        post_migrate.connect(compute_reorder_points, sender=self)
@@ -0,0 +1,334 @@
+"""
+مقایسه پیش‌بینی، مصرف واقعی و موجودی مواد اولیه
+Set-based computation of the inventory comparison: each figure is one
+grouped query over all ingredients instead of a query per ingredient and
+per menu plan.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+import jdatetime
+
+from apps.foods.models import FoodIngredient
+from apps.menu.models import MenuPlan
+
+from .models import Ingredient, InventoryStockUpdate, MaterialConsumption
+from .units import factors_sql
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _jalali(value):
+    # jManager only accepts Jalali values for lookups through a __date field
+    return jdatetime.date.fromgregorian(date=value)
+
+
+def _by_ingredient(queryset, ingredient_ids):
+    if ingredient_ids is not None:
+        queryset = queryset.filter(ingredient_id__in=ingredient_ids)
+    return queryset
+
+
+def predicted_amounts(until, ingredient_ids=None):
+    """
+    ({ingredient id: sum of amount_per_serving * capacity of plans up to
+    until, in the ingredient's unit}, {ingredient id: recipe units left out
+    of that sum because they cannot be converted to the ingredient's unit})
+    """
+    # Capacities are summed per food first, so the join to FoodIngredient
+    # multiplies foods rather than plans
+    usage_filter = plan_filter = ''
+    factors = factors_sql()
+    params = [until]
+    if ingredient_ids is not None:
+        plan_filter = f'AND food_id IN (SELECT food_id FROM {_table(FoodIngredient)} WHERE ingredient_id = ANY(%s))'
+        factors = factors_sql('%s')
+        usage_filter = 'WHERE usage.ingredient_id = ANY(%s)'
+        params += [list(ingredient_ids)] * 4
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT usage.ingredient_id,
+                   SUM(usage.amount_per_serving * factor.factor * plan.capacity),
+                   array_agg(DISTINCT usage.unit) FILTER (WHERE factor.factor IS NULL)
+            FROM (
+                SELECT food_id, SUM(capacity) AS capacity
+                FROM {_table(MenuPlan)}
+                WHERE date <= %s {plan_filter}
+                GROUP BY food_id
+            ) AS plan
+            JOIN {_table(FoodIngredient)} AS usage ON usage.food_id = plan.food_id
+            LEFT JOIN ({factors}) AS factor
+                ON factor.ingredient_id = usage.ingredient_id AND factor.unit = usage.unit
+            {usage_filter}
+            GROUP BY usage.ingredient_id
+        """, params)
+        return _split(cursor.fetchall())
+
+
+def consumed_amounts(until, ingredient_ids=None):
+    """
+    ({ingredient id: consumed amount recorded for plans up to until, in the
+    ingredient's unit}, {ingredient id: units left out of that amount})
+    """
+    # Summed per unit first, so each (ingredient, unit) is converted once
+    usage_filter = ''
+    factors = factors_sql()
+    params = [until]
+    if ingredient_ids is not None:
+        usage_filter = 'AND consumption.ingredient_id = ANY(%s)'
+        factors = factors_sql('%s')
+        params += [list(ingredient_ids)] * 3
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT consumed.ingredient_id, SUM(consumed.amount * factor.factor),
+                   array_agg(consumed.unit) FILTER (WHERE factor.factor IS NULL)
+            FROM (
+                SELECT consumption.ingredient_id, consumption.unit, SUM(consumption.consumed_amount) AS amount
+                FROM {_table(MaterialConsumption)} AS consumption
+                JOIN {_table(MenuPlan)} AS plan ON plan.id = consumption.menu_plan_id
+                WHERE plan.date <= %s {usage_filter}
+                GROUP BY 1, 2
+            ) AS consumed
+            LEFT JOIN ({factors}) AS factor
+                ON factor.ingredient_id = consumed.ingredient_id AND factor.unit = consumed.unit
+            GROUP BY consumed.ingredient_id
+        """, params)
+        return _split(cursor.fetchall())
+
+
+def _split(rows):
+    # (ingredient id, amount, unconverted units) rows into the two mappings
+    amounts, unconverted = {}, {}
+    for pk, amount, units in rows:
+        amounts[pk] = amount
+        if units:
+            unconverted[pk] = units
+    return amounts, unconverted
+
+
+def latest_stock_amounts(until, ingredient_ids=None):
+    """{ingredient id: actual amount of the last inspection up to until}"""
+    rows = _by_ingredient(InventoryStockUpdate.objects.filter(inspection_date__lte=until), ingredient_ids)
+    # DISTINCT ON keeps the first row of each ingredient in this ordering
+    rows = rows.order_by('ingredient_id', '-inspection_date', '-created_at').distinct('ingredient_id')
+    return dict(rows.values_list('ingredient_id', 'actual_amount'))
+
+
+def compare_inventory(comparison_date, previous_date=None, ingredient_id=None):
+    """
+    Rows of the comparison view, ordered like Ingredient: predicted
+    consumption of the menu plans, recorded consumption, current stock and,
+    with a previous_date, the stock of that date and the differences.
+    Recipe lines and consumptions in a unit that cannot be converted to the
+    ingredient's are left out of the figures and their units listed in
+    unconverted_units.
+    """
+    ingredients = Ingredient.objects.all()
+    if ingredient_id:
+        ingredients = ingredients.filter(id=ingredient_id)
+    ingredients = list(ingredients.values('id', 'name', 'code', 'unit'))
+    ingredient_ids = [ingredient['id'] for ingredient in ingredients] if ingredient_id else None
+
+    predicted, predicted_unconverted = predicted_amounts(comparison_date, ingredient_ids)
+    consumed, consumed_unconverted = consumed_amounts(comparison_date, ingredient_ids)
+    current = latest_stock_amounts(comparison_date, ingredient_ids)
+    previous = latest_stock_amounts(previous_date, ingredient_ids) if previous_date else {}
+
+    zero = Decimal('0')
+    results = []
+    for ingredient in ingredients:
+        pk = ingredient['id']
+        predicted_amount = predicted.get(pk) or zero
+        actual_consumption = consumed.get(pk) or zero
+        current_stock = current.get(pk, zero)
+        previous_stock = previous.get(pk, zero)
+
+        consumption_difference = predicted_amount - actual_consumption
+        stock_difference = current_stock - previous_stock if previous_date else zero
+        actual_consumed = previous_stock - current_stock if previous_date and previous_stock > 0 else zero
+
+        results.append({
+            'ingredient': ingredient,
+            'predicted_amount': float(predicted_amount),
+            'actual_consumption': float(actual_consumption),
+            'current_stock': float(current_stock),
+            'previous_stock': float(previous_stock) if previous_date else None,
+            'consumption_difference': float(consumption_difference),
+            'stock_difference': float(stock_difference) if previous_date else None,
+            'actual_consumed': float(actual_consumed) if previous_date else None,
+            'unconverted_units': sorted(
+                set(predicted_unconverted.get(pk, ())) | set(consumed_unconverted.get(pk, ()))
+            ),
+        })
+    return results
+
+
+BUCKET_CHOICES = [
+    ('day', 'روزانه'),
+    ('week', 'هفتگی'),
+    ('jalali_month', 'ماه شمسی'),
+]
+
+# Saturday, the first day of the Iranian week, as date.weekday()
+_WEEK_START = 5
+
+
+def bucket_starts(start, end, bucket):
+    """
+    Sorted first days of the buckets covering start..end (Gregorian dates).
+    The first bucket starts at start even when it is a partial week or month.
+    """
+    starts = [start]
+    if bucket == 'day':
+        current = start + timedelta(days=1)
+        while current <= end:
+            starts.append(current)
+            current += timedelta(days=1)
+    elif bucket == 'week':
+        current = start + timedelta(days=(_WEEK_START - start.weekday()) % 7 or 7)
+        while current <= end:
+            starts.append(current)
+            current += timedelta(days=7)
+    else:
+        month = jdatetime.date.fromgregorian(date=start).replace(day=1)
+        while True:
+            month = (month + timedelta(days=32)).replace(day=1)
+            current = month.togregorian()
+            if current > end:
+                break
+            starts.append(current)
+    return starts
+
+
+def compare_inventory_range(start, end, bucket, ingredient_id=None):
+    """
+    Yield one row per ingredient (ordered like Ingredient) with its buckets
+    between start and end: predicted and recorded consumption of the plans
+    dated in the bucket, and the stock of the last inspection up to the end
+    of the bucket. Units that cannot be converted to the ingredient's are
+    left out of the figures and listed in unconverted_units.
+
+    Every figure comes from a single query that tags rows with their bucket
+    (width_bucket over the bucket starts) and collects them into one row of
+    arrays per ingredient. The rows are read through a server-side cursor
+    and the stock is carried forward while each one is built, so memory
+    stays flat however many ingredients there are.
+    """
+    starts = bucket_starts(start, end, bucket)
+    bounds = [
+        (bucket_start, (starts[i + 1] - timedelta(days=1)) if i + 1 < len(starts) else end)
+        for i, bucket_start in enumerate(starts)
+    ]
+    bounds = [(_jalali(first).strftime('%Y-%m-%d'), _jalali(last).strftime('%Y-%m-%d')) for first, last in bounds]
+    params = {'starts': starts, 'start': start, 'end': end, 'ingredient_id': ingredient_id}
+    ingredient_filter = 'WHERE ingredient.id = %(ingredient_id)s' if ingredient_id else ''
+    factors = factors_sql('ARRAY[%(ingredient_id)s]::bigint[]' if ingredient_id else None)
+    # Inspections before start fall in bucket 0 and seed the carried stock
+    sql = f"""
+        WITH factor AS ({factors}), usage AS (
+            SELECT usage.food_id, usage.ingredient_id, usage.unit,
+                   usage.amount_per_serving * factor.factor AS amount_per_serving
+            FROM {_table(FoodIngredient)} AS usage
+            LEFT JOIN factor ON factor.ingredient_id = usage.ingredient_id AND factor.unit = usage.unit
+        ), plan AS (
+            SELECT food_id, width_bucket(date, %(starts)s::date[]) AS bucket, SUM(capacity) AS capacity
+            FROM {_table(MenuPlan)}
+            WHERE date BETWEEN %(start)s AND %(end)s
+            GROUP BY 1, 2
+        ), predicted AS (
+            SELECT usage.ingredient_id, plan.bucket, SUM(usage.amount_per_serving * plan.capacity) AS amount
+            FROM plan
+            JOIN usage ON usage.food_id = plan.food_id
+            WHERE usage.amount_per_serving IS NOT NULL
+            GROUP BY 1, 2
+        ), recorded AS (
+            SELECT consumption.ingredient_id, width_bucket(plan.date, %(starts)s::date[]) AS bucket,
+                   consumption.unit, SUM(consumption.consumed_amount) AS amount
+            FROM {_table(MaterialConsumption)} AS consumption
+            JOIN {_table(MenuPlan)} AS plan ON plan.id = consumption.menu_plan_id
+            WHERE plan.date BETWEEN %(start)s AND %(end)s
+            GROUP BY 1, 2, 3
+        ), consumed AS (
+            SELECT recorded.ingredient_id, recorded.bucket, SUM(recorded.amount * factor.factor) AS amount
+            FROM recorded
+            JOIN factor ON factor.ingredient_id = recorded.ingredient_id AND factor.unit = recorded.unit
+            GROUP BY 1, 2
+        ), unconverted AS (
+            SELECT ingredient_id, array_agg(DISTINCT unit ORDER BY unit) AS units
+            FROM (
+                SELECT usage.ingredient_id, usage.unit
+                FROM usage
+                WHERE usage.amount_per_serving IS NULL AND usage.food_id IN (SELECT food_id FROM plan)
+                UNION ALL
+                SELECT recorded.ingredient_id, recorded.unit
+                FROM recorded
+                LEFT JOIN factor ON factor.ingredient_id = recorded.ingredient_id AND factor.unit = recorded.unit
+                WHERE factor.factor IS NULL
+            ) AS line
+            GROUP BY ingredient_id
+        ), stock AS (
+            SELECT DISTINCT ON (ingredient_id, bucket) ingredient_id, bucket, actual_amount AS amount
+            FROM (
+                SELECT ingredient_id, width_bucket(inspection_date, %(starts)s::date[]) AS bucket,
+                       actual_amount, inspection_date, created_at
+                FROM {_table(InventoryStockUpdate)}
+                WHERE inspection_date <= %(end)s
+            ) AS inspection
+            ORDER BY ingredient_id, bucket, inspection_date DESC, created_at DESC
+        ), figures AS (
+            SELECT ingredient_id, bucket, 0 AS kind, amount FROM predicted
+            UNION ALL
+            SELECT ingredient_id, bucket, 1, amount FROM consumed
+            UNION ALL
+            SELECT ingredient_id, bucket, 2, amount FROM stock
+        )
+        SELECT ingredient.id, ingredient.name, ingredient.code, ingredient.unit,
+               figures.buckets, figures.kinds, figures.amounts, unconverted.units
+        FROM {_table(Ingredient)} AS ingredient
+        LEFT JOIN (
+            SELECT ingredient_id, array_agg(bucket) AS buckets, array_agg(kind) AS kinds,
+                   array_agg(amount) AS amounts
+            FROM figures
+            GROUP BY ingredient_id
+        ) AS figures ON figures.ingredient_id = ingredient.id
+        LEFT JOIN unconverted ON unconverted.ingredient_id = ingredient.id
+        {ingredient_filter}
+        ORDER BY ingredient.name, ingredient.id
+    """
+
+    def build(ingredient, bucket_indexes, kinds, amounts, unconverted_units):
+        # Most buckets are empty, so only the figures present are converted
+        predicted, consumed, stock = {}, {}, {}
+        figures = (predicted, consumed, stock)
+        for bucket_index, kind, amount in zip(bucket_indexes or (), kinds or (), amounts or ()):
+            figures[kind][bucket_index] = amount
+        difference = {
+            index: float(predicted.get(index, 0) - consumed.get(index, 0))
+            for index in predicted.keys() | consumed.keys()
+        }
+        predicted = {index: float(amount) for index, amount in predicted.items()}
+        consumed = {index: float(amount) for index, amount in consumed.items()}
+
+        current = float(stock.get(0, 0))
+        buckets = []
+        for index, (first, last) in enumerate(bounds, start=1):
+            if index in stock:
+                current = float(stock[index])
+            buckets.append({
+                'start': first,
+                'end': last,
+                'predicted_amount': predicted.get(index, 0.0),
+                'actual_consumption': consumed.get(index, 0.0),
+                'consumption_difference': difference.get(index, 0.0),
+                'stock': current,
+            })
+        return {'ingredient': ingredient, 'buckets': buckets, 'unconverted_units': unconverted_units or []}
+
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        for pk, name, code, unit, bucket_indexes, kinds, amounts, unconverted_units in cursor:
+            ingredient = {'id': pk, 'name': name, 'code': code, 'unit': unit}
+            yield build(ingredient, bucket_indexes, kinds, amounts, unconverted_units)
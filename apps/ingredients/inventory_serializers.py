@@ -1,9 +1,14 @@
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 from datetime import date
 import jdatetime
 from decimal import Decimal
 from django.db import transaction
+from .comparison import BUCKET_CHOICES, bucket_starts
 from .models import InventoryStock, InventoryLog, Ingredient, MaterialConsumption, InventoryStockUpdate
+from .reorder import refresh_reorder_points
+from .stock import consume, restore_consumption, set_stock
+from .units import UnitConversionError, ingredient_factor
 
 
 class JalaliDateField(serializers.Field):
@@ -17,6 +22,9 @@ class JalaliDateField(serializers.Field):
         """Convert Gregorian date to Jalali string"""
         if value is None:
             return None
+        # jDateField values come back as jdatetime.date
+        if hasattr(value, 'togregorian'):
+            return value.strftime('%Y-%m-%d')
         if isinstance(value, date):
             jalali = jdatetime.date.fromgregorian(date=value)
             return jalali.strftime('%Y-%m-%d')
@@ -42,7 +50,7 @@ class InventoryStockSerializer(serializers.ModelSerializer):
     ingredient_subcategory = serializers.SerializerMethodField()
     ingredient_unit = serializers.CharField(source='ingredient.unit', read_only=True)
     warning_amount = serializers.IntegerField(source='ingredient.warning_amount', read_only=True)
-    is_low_stock = serializers.SerializerMethodField()
+    is_low_stock = serializers.BooleanField(source='is_low', read_only=True)
     last_received_date = JalaliDateField(required=False)
     last_inspection_date = serializers.SerializerMethodField()
     last_inspected_by = serializers.SerializerMethodField()
@@ -58,6 +66,8 @@ class InventoryStockSerializer(serializers.ModelSerializer):
             'ingredient_unit',
             'total_amount',
             'warning_amount',
+            'daily_usage',
+            'reorder_point',
             'is_low_stock',
             'last_received_date',
             'last_inspection_date',
@@ -65,7 +75,37 @@ class InventoryStockSerializer(serializers.ModelSerializer):
             'created_at',
             'updated_at',
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'ingredient_name', 'ingredient_category', 'ingredient_subcategory', 'ingredient_unit', 'warning_amount', 'is_low_stock', 'last_inspection_date', 'last_inspected_by']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'ingredient_name', 'ingredient_category', 'ingredient_subcategory', 'ingredient_unit', 'warning_amount', 'daily_usage', 'reorder_point', 'is_low_stock', 'last_inspection_date', 'last_inspected_by']
+        extra_kwargs = {
+            # DRF does not read Meta.constraints; without this a second stock
+            # row for an ingredient fails on inventorystock_ingredient_uniq
+            'ingredient': {'validators': [UniqueValidator(
+                queryset=InventoryStock.objects.all(),
+                message='برای این ماده اولیه قبلاً موجودی ثبت شده است.',
+            )]},
+        }
+
+    # Written by the stock service, read back after it runs
+    STOCK_FIELDS = ['total_amount', 'daily_usage', 'reorder_point', 'is_low', 'updated_at']
+
+    @transaction.atomic
+    def create(self, validated_data):
+        """The entered amount is posted to the ledger as an adjustment"""
+        total_amount = validated_data.pop('total_amount')
+        instance = super().create(dict(validated_data, total_amount=0))
+        set_stock(instance.ingredient_id, total_amount, 'adjustment', date.today())
+        instance.refresh_from_db(fields=self.STOCK_FIELDS)
+        return instance
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        """A changed amount is posted to the ledger as an adjustment"""
+        total_amount = validated_data.pop('total_amount', None)
+        instance = super().update(instance, validated_data)
+        if total_amount is not None:
+            set_stock(instance.ingredient_id, total_amount, 'adjustment', date.today())
+            instance.refresh_from_db(fields=self.STOCK_FIELDS)
+        return instance
 
     def get_ingredient_category(self, obj):
         """Return Persian label for ingredient category"""
@@ -79,29 +119,29 @@ class InventoryStockSerializer(serializers.ModelSerializer):
         subcategory_dict = dict(SUBCATEGORY_CHOICES)
         return subcategory_dict.get(obj.ingredient.subcategory, obj.ingredient.subcategory)
 
-    def get_is_low_stock(self, obj):
-        """Check if stock is below warning amount"""
-        return obj.total_amount <= obj.ingredient.warning_amount
-    
+    def _last_inspection(self, obj):
+        """
+        (date, inspector username) of the ingredient's last inspection.
+        InventoryStockViewSet annotates both; other callers pay one query.
+        """
+        if not hasattr(obj, 'last_inspection_date'):
+            last_update = InventoryStockUpdate.objects.filter(
+                ingredient_id=obj.ingredient_id
+            ).order_by('-inspection_date', '-created_at').values_list(
+                'inspection_date', 'created_by__username'
+            ).first()
+            obj.last_inspection_date, obj.last_inspected_by = last_update or (None, None)
+        return obj.last_inspection_date, obj.last_inspected_by
+
     def get_last_inspection_date(self, obj):
         """Get last inspection date from InventoryStockUpdate"""
-        from .models import InventoryStockUpdate
-        last_update = InventoryStockUpdate.objects.filter(
-            ingredient=obj.ingredient
-        ).order_by('-inspection_date', '-created_at').first()
-        if last_update:
-            return JalaliDateField().to_representation(last_update.inspection_date)
-        return None
+        inspection_date, _ = self._last_inspection(obj)
+        return JalaliDateField().to_representation(inspection_date)
     
     def get_last_inspected_by(self, obj):
         """Get username of last inspector"""
-        from .models import InventoryStockUpdate
-        last_update = InventoryStockUpdate.objects.filter(
-            ingredient=obj.ingredient
-        ).order_by('-inspection_date', '-created_at').first()
-        if last_update and last_update.created_by:
-            return last_update.created_by.username
-        return None
+        _, username = self._last_inspection(obj)
+        return username
 
 
 class InventoryLogSerializer(serializers.ModelSerializer):
@@ -125,6 +165,16 @@ class InventoryLogSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'ingredient_name', 'ingredient_id']
 
+    def validate(self, attrs):
+        """واحد باید به واحد ماده اولیه قابل تبدیل باشد"""
+        inventory = attrs.get('inventory')
+        if inventory and attrs.get('unit'):
+            try:
+                ingredient_factor(inventory.ingredient, attrs['unit'])
+            except UnitConversionError as e:
+                raise serializers.ValidationError({'unit': str(e)})
+        return attrs
+
 
 class MaterialConsumptionSerializer(serializers.ModelSerializer):
     """Serializer for MaterialConsumption (مصرفی BOM)"""
@@ -194,6 +244,15 @@ class MaterialConsumptionSerializer(serializers.ModelSerializer):
                     'ingredient': f'زیر دسته‌بندی ماده اولیه با زیر دسته‌بندی غذا مطابقت ندارد.'
                 })
         
+        # واحد باید به واحد ماده اولیه قابل تبدیل باشد
+        ingredient = ingredient or getattr(self.instance, 'ingredient', None)
+        unit = attrs.get('unit') or getattr(self.instance, 'unit', None)
+        if ingredient and unit:
+            try:
+                ingredient_factor(ingredient, unit)
+            except UnitConversionError as e:
+                raise serializers.ValidationError({'unit': str(e)})
+        
         return attrs
 
     @transaction.atomic
@@ -205,26 +264,26 @@ class MaterialConsumptionSerializer(serializers.ModelSerializer):
         # ایجاد MaterialConsumption
         material_consumption = MaterialConsumption.objects.create(**validated_data)
         
-        # کسر از موجودی InventoryStock
-        ingredient = material_consumption.ingredient
-        inventory_stock, created = InventoryStock.objects.get_or_create(
-            ingredient=ingredient,
-            defaults={'total_amount': 0}
-        )
-        
-        # تبدیل واحد و کسر از موجودی (فرض می‌کنیم واحدها یکسان هستند)
-        consumed_amount = float(material_consumption.consumed_amount)
-        if inventory_stock.total_amount >= consumed_amount:
-            inventory_stock.total_amount -= consumed_amount
-            inventory_stock.save()
-        else:
-            # اگر موجودی کافی نباشد، خطا نمی‌دهیم اما می‌توانیم warning بدهیم
-            # یا می‌توانیم موجودی را صفر کنیم
-            inventory_stock.total_amount = 0
-            inventory_stock.save()
+        # کسر از موجودی InventoryStock (پس از تبدیل به واحد ماده اولیه)
+        # اگر موجودی کافی نباشد خطا نمی‌دهیم و موجودی صفر می‌شود
+        consume(material_consumption)
+        # The consumption moves the ingredient's velocity, and so its reorder point
+        refresh_reorder_points([material_consumption.ingredient_id])
         
         return material_consumption
 
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        """ویرایش MaterialConsumption و اصلاح موجودی"""
+        # The old amount goes back to the old ingredient before the new one is taken
+        previous_ingredient_id = instance.ingredient_id
+        restored = restore_consumption(instance)
+        material_consumption = super().update(instance, validated_data)
+        if restored:
+            consume(material_consumption)
+        refresh_reorder_points([previous_ingredient_id, material_consumption.ingredient_id])
+        return material_consumption
+
 
 class InventoryStockUpdateSerializer(serializers.ModelSerializer):
     """Serializer for InventoryStockUpdate (ثبت موجودی واقعی)"""
@@ -265,18 +324,133 @@ class InventoryStockUpdateSerializer(serializers.ModelSerializer):
         # ایجاد InventoryStockUpdate
         stock_update = InventoryStockUpdate.objects.create(**validated_data)
         
-        # به‌روزرسانی InventoryStock
-        ingredient = stock_update.ingredient
-        inventory_stock, created = InventoryStock.objects.get_or_create(
-            ingredient=ingredient,
-            defaults={'total_amount': 0}
-        )
-        
         # به‌روزرسانی موجودی و تاریخ
-        inventory_stock.total_amount = float(stock_update.actual_amount)
-        inventory_stock.last_received_date = stock_update.inspection_date
-        inventory_stock.save()
+        set_stock(
+            stock_update.ingredient_id, stock_update.actual_amount, 'stocktake', stock_update.inspection_date,
+            last_received_date=stock_update.inspection_date, stock_update=stock_update,
+        )
         
         return stock_update
 
 
+# Largest BigAutoField id; larger ids in raw SQL parameters overflow bigint
+MAX_ID = 2 ** 63 - 1
+
+
+def required_date(value):
+    """Field-level check of a required JalaliDateField, which reads an empty value as None"""
+    if value is None:
+        raise serializers.ValidationError('تاریخ الزامی است.')
+    return value
+
+
+class StockBalanceQuerySerializer(serializers.Serializer):
+    """Query parameters of the stock balances on a date"""
+    date = JalaliDateField()
+    ingredient_id = serializers.IntegerField(required=False, min_value=1, max_value=MAX_ID)
+
+    def validate_date(self, value):
+        return required_date(value)
+
+
+
+class InventoryComparisonRangeQuerySerializer(serializers.Serializer):
+    """Query parameters of the range mode of the inventory comparison"""
+    MAX_BUCKETS = 1000
+
+    start = JalaliDateField()
+    end = JalaliDateField()
+    bucket = serializers.ChoiceField(choices=BUCKET_CHOICES, default='day')
+    ingredient_id = serializers.IntegerField(required=False, min_value=1, max_value=MAX_ID)
+    stream = serializers.BooleanField(default=False, help_text='ارسال پاسخ به صورت JSON lines')
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # from and to are Python keywords, so they are declared as start and end
+        fields['from'] = fields.pop('start')
+        fields['to'] = fields.pop('end')
+        return fields
+
+    # Named after the renamed fields
+    def validate_from(self, value):
+        return required_date(value)
+
+    def validate_to(self, value):
+        return required_date(value)
+
+    def validate(self, attrs):
+        if attrs['to'] < attrs['from']:
+            raise serializers.ValidationError({'to': 'تاریخ پایان نمی‌تواند قبل از تاریخ شروع باشد.'})
+        # The day count bounds the work of counting the buckets themselves
+        days = (attrs['to'] - attrs['from']).days
+        if days > self.MAX_BUCKETS * 31 or len(bucket_starts(attrs['from'], attrs['to'], attrs['bucket'])) > self.MAX_BUCKETS:
+            raise serializers.ValidationError({
+                'bucket': f'بازه انتخاب شده بیش از {self.MAX_BUCKETS} بازه زمانی دارد. بازه کوتاه‌تر یا بازه زمانی بزرگ‌تری انتخاب کنید.'
+            })
+        return attrs
+
+
+class ProcurementQuerySerializer(serializers.Serializer):
+    """Query parameters of the procurement plan"""
+    MAX_DAYS = 366
+
+    start = JalaliDateField()
+    end = JalaliDateField()
+    ingredient_id = serializers.IntegerField(required=False, min_value=1, max_value=MAX_ID)
+    shortfall_only = serializers.BooleanField(default=False, help_text='فقط مواد اولیه دارای کسری')
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # from and to are Python keywords, so they are declared as start and end
+        fields['from'] = fields.pop('start')
+        fields['to'] = fields.pop('end')
+        return fields
+
+    # Named after the renamed fields
+    def validate_from(self, value):
+        return required_date(value)
+
+    def validate_to(self, value):
+        return required_date(value)
+
+    def validate(self, attrs):
+        # The plan nets against today's stock, so it cannot look back
+        if attrs['from'] < date.today():
+            raise serializers.ValidationError({'from': 'تاریخ شروع نمی‌تواند قبل از امروز باشد.'})
+        if attrs['to'] < attrs['from']:
+            raise serializers.ValidationError({'to': 'تاریخ پایان نمی‌تواند قبل از تاریخ شروع باشد.'})
+        if (attrs['to'] - attrs['from']).days >= self.MAX_DAYS:
+            raise serializers.ValidationError({'to': f'بازه انتخاب شده نمی‌تواند بیش از {self.MAX_DAYS} روز باشد.'})
+        return attrs
+
+
+class LowStockSerializer(serializers.ModelSerializer):
+    """Serializer for the low-stock feed (مواد اولیه زیر نقطه سفارش)"""
+    ingredient_name = serializers.CharField(source='ingredient.name', read_only=True)
+    ingredient_code = serializers.CharField(source='ingredient.code', read_only=True)
+    ingredient_unit = serializers.CharField(source='ingredient.unit', read_only=True)
+    warning_amount = serializers.IntegerField(source='ingredient.warning_amount', read_only=True)
+    days_left = serializers.SerializerMethodField()
+
+    class Meta:
+        model = InventoryStock
+        fields = [
+            'id',
+            'ingredient',
+            'ingredient_name',
+            'ingredient_code',
+            'ingredient_unit',
+            'total_amount',
+            'warning_amount',
+            'daily_usage',
+            'reorder_point',
+            'days_left',
+            'updated_at',
+        ]
+        read_only_fields = fields
+
+    def get_days_left(self, obj):
+        """Days the stock lasts at the current daily usage, None without usage"""
+        if not obj.daily_usage:
+            return None
+        return round(obj.total_amount / obj.daily_usage, 1)
@@ -1,25 +1,34 @@
-from rest_framework import mixins, viewsets, status
+from rest_framework import mixins, permissions, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Sum, Q, F
+from django.db.models import Q, F, OuterRef, Subquery
 from django.db import transaction
-from decimal import Decimal
+from django.http import StreamingHttpResponse
 import jdatetime
+import json
 from datetime import date
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 from apps.accounts.permissions import KitchenAccess, WarehouseAccess,RestaurantOrKitchenAccess
-from apps.menu.models import MenuPlan
 
-from .models import InventoryStock, InventoryLog, MaterialConsumption, InventoryStockUpdate, Ingredient
+from .comparison import compare_inventory, compare_inventory_range
+from .procurement import plan_procurement
+from .reorder import low_stock, refresh_reorder_points
+from .stock import adjust_stock, balance_at, restore_consumption
+from .units import convert
+from .models import Ingredient, InventoryStock, InventoryLog, MaterialConsumption, InventoryStockUpdate
 from .inventory_serializers import (
     InventoryStockSerializer, 
     InventoryLogSerializer,
     MaterialConsumptionSerializer,
-    InventoryStockUpdateSerializer
+    InventoryStockUpdateSerializer,
+    InventoryComparisonRangeQuerySerializer,
+    ProcurementQuerySerializer,
+    StockBalanceQuerySerializer,
+    LowStockSerializer,
 )
 
 
@@ -40,6 +49,16 @@ class InventoryStockViewSet(
     permission_classes = [KitchenAccess]
     lookup_field = 'id'
 
+    def get_queryset(self):
+        """Annotate the last inspection so the list costs no query per row"""
+        last_update = InventoryStockUpdate.objects.filter(
+            ingredient=OuterRef('ingredient')
+        ).order_by('-inspection_date', '-created_at')
+        return super().get_queryset().annotate(
+            last_inspection_date=Subquery(last_update.values('inspection_date')[:1]),
+            last_inspected_by=Subquery(last_update.values('created_by__username')[:1]),
+        )
+
     @swagger_auto_schema(
         operation_summary="List inventory stock",
         operation_description="Retrieve all inventory stock items with details. Requires kitchen manager access.",
@@ -48,6 +67,31 @@ class InventoryStockViewSet(
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
+    @action(detail=False, methods=['get'], url_path='balances')
+    @swagger_auto_schema(
+        operation_summary="Stock on a date",
+        operation_description="Stock of each ingredient at the end of a past date, from the stock movement ledger. Requires kitchen manager access.",
+        manual_parameters=[
+            openapi.Parameter('date', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True, description='Jalali date (YYYY-MM-DD)'),
+            openapi.Parameter('ingredient_id', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False),
+        ],
+        responses={200: openapi.Response(description='[{ingredient_id, ingredient_name, ingredient_unit, balance}]')},
+    )
+    def balances(self, request):
+        params = StockBalanceQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        ingredients = Ingredient.objects.all()
+        if 'ingredient_id' in params:
+            ingredients = ingredients.filter(id=params['ingredient_id'])
+        ingredients = list(ingredients.values_list('id', 'name', 'unit'))
+        balances = balance_at(params['date'], [pk for pk, _, _ in ingredients])
+        return Response([
+            {'ingredient_id': pk, 'ingredient_name': name, 'ingredient_unit': unit, 'balance': balances[pk]}
+            for pk, name, unit in ingredients
+        ])
+
     @swagger_auto_schema(
         operation_summary="Retrieve inventory stock",
         operation_description="Retrieve a specific inventory stock item. Requires kitchen manager access.",
@@ -147,6 +191,8 @@ class InventoryLogViewSet(
     queryset = InventoryLog.objects.select_related('inventory__ingredient')
     serializer_class = InventoryLogSerializer
     permission_classes = [KitchenAccess]
+    # ?pagination=cursor switches the list to keyset pagination
+    cursor_ordering = ('-created_at', '-id')
     lookup_field = 'id'
 
     @swagger_auto_schema(
@@ -202,12 +248,16 @@ class InventoryLogViewSet(
         inventory_stock = serializer.validated_data['inventory']
         amount = serializer.validated_data['amount']
         
-        # Update inventory stock
-        inventory_stock.total_amount += amount
-        inventory_stock.save()
-        
-        # Create the log entry
-        self.perform_create(serializer)
+        with transaction.atomic():
+            # Create the log entry
+            self.perform_create(serializer)
+            
+            # Update inventory stock, in the ingredient's unit
+            inventory_log = serializer.instance
+            adjust_stock(
+                inventory_stock.ingredient_id, convert(amount, inventory_log.unit, inventory_stock.ingredient),
+                'receipt', inventory_log.date or date.today(), inventory_log=inventory_log,
+            )
         
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
@@ -231,6 +281,8 @@ class MaterialConsumptionViewSet(
     )
     serializer_class = MaterialConsumptionSerializer
     permission_classes = [KitchenAccess]
+    # ?pagination=cursor switches the list to keyset pagination
+    cursor_ordering = ('-created_at', '-id')
     lookup_field = 'id'
     
     def get_queryset(self):
@@ -307,12 +359,19 @@ class MaterialConsumptionViewSet(
     
     @swagger_auto_schema(
         operation_summary="Delete material consumption",
-        operation_description="Delete a material consumption entry. Requires kitchen manager access.",
+        operation_description="Delete a material consumption entry. The consumed amount is returned to the stock. Requires kitchen manager access.",
         responses={204: 'Material consumption deleted'},
     )
     def destroy(self, request, *args, **kwargs):
         return super().destroy(request, *args, **kwargs)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        # The consumed amount goes back into stock
+        restore_consumption(instance)
+        instance.delete()
+        refresh_reorder_points([instance.ingredient_id])
+
 
 class InventoryStockUpdateViewSet(
     mixins.ListModelMixin,
@@ -413,10 +472,17 @@ class InventoryComparisonView(APIView):
             openapi.Parameter('ingredient_id', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False),
             openapi.Parameter('date', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False, description='Jalali date (YYYY-MM-DD), default: today'),
             openapi.Parameter('previous_date', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False, description='Jalali date (YYYY-MM-DD) for previous stock comparison'),
+            openapi.Parameter('from', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False, description='Range mode: Jalali start date (YYYY-MM-DD)'),
+            openapi.Parameter('to', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False, description='Range mode: Jalali end date (YYYY-MM-DD)'),
+            openapi.Parameter('bucket', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False, enum=['day', 'week', 'jalali_month'], description='Range mode: bucket size, default: day'),
+            openapi.Parameter('stream', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN, required=False, description='Range mode: stream one JSON object per ingredient per line (application/x-ndjson)'),
         ],
         responses={200: openapi.Response(description='Comparison data')},
     )
     def get(self, request):
+        if 'from' in request.query_params or 'to' in request.query_params:
+            return self.get_range(request)
+
         ingredient_id = request.query_params.get('ingredient_id', None)
         date_param = request.query_params.get('date', None)
         previous_date_param = request.query_params.get('previous_date', None)
@@ -442,77 +508,82 @@ class InventoryComparisonView(APIView):
         else:
             previous_date = None
         
-        # فیلتر کردن ingredients
-        ingredients = Ingredient.objects.all()
-        if ingredient_id:
-            ingredients = ingredients.filter(id=ingredient_id)
-        
-        results = []
-        
-        for ingredient in ingredients:
-            # محاسبه پیش‌بینی (از MenuPlan‌ها)
-            menu_plans = MenuPlan.objects.filter(
-                food__ingredients__ingredient=ingredient,
-                date__lte=comparison_date
-            ).distinct()
-            
-            predicted_amount = Decimal('0')
-            for menu_plan in menu_plans:
-                food_ingredient = menu_plan.food.ingredients.filter(ingredient=ingredient).first()
-                if food_ingredient:
-                    required_amount = Decimal(str(food_ingredient.amount_per_serving)) * Decimal(str(menu_plan.capacity))
-                    predicted_amount += required_amount
-            comparison_date_j = jdatetime.date.fromgregorian(date=comparison_date)
-            # محاسبه مصرف واقعی (از MaterialConsumption)
-            consumptions = MaterialConsumption.objects.filter(
-                ingredient=ingredient,
-                menu_plan__date__lte=comparison_date_j
-            )
-            actual_consumption = consumptions.aggregate(
-                total=Sum('consumed_amount')
-            )['total'] or Decimal('0')
-            
-            # موجودی فعلی (از آخرین InventoryStockUpdate)
-            latest_update = InventoryStockUpdate.objects.filter(
-                ingredient=ingredient,
-                inspection_date__lte=comparison_date
-            ).order_by('-inspection_date', '-created_at').first()
-            
-            current_stock = Decimal('0')
-            if latest_update:
-                current_stock = Decimal(str(latest_update.actual_amount))
-            
-            # موجودی قبلی
-            previous_stock = Decimal('0')
-            if previous_date:
-                previous_update = InventoryStockUpdate.objects.filter(
-                    ingredient=ingredient,
-                    inspection_date__lte=previous_date
-                ).order_by('-inspection_date', '-created_at').first()
-                if previous_update:
-                    previous_stock = Decimal(str(previous_update.actual_amount))
-            
-            # محاسبه تفاوت‌ها
-            consumption_difference = predicted_amount - actual_consumption
-            stock_difference = current_stock - previous_stock if previous_date else Decimal('0')
-            actual_consumed = previous_stock - current_stock if previous_date and previous_stock > 0 else Decimal('0')
-            
-            results.append({
-                'ingredient': {
-                    'id': ingredient.id,
-                    'name': ingredient.name,
-                    'code': ingredient.code,
-                    'unit': ingredient.unit,
-                },
-                'predicted_amount': float(predicted_amount),
-                'actual_consumption': float(actual_consumption),
-                'current_stock': float(current_stock),
-                'previous_stock': float(previous_stock) if previous_date else None,
-                'consumption_difference': float(consumption_difference),
-                'stock_difference': float(stock_difference) if previous_date else None,
-                'actual_consumed': float(actual_consumed) if previous_date else None,
-            })
+        results = compare_inventory(comparison_date, previous_date, ingredient_id)
         
         return Response(results, status=status.HTTP_200_OK)
 
+    def get_range(self, request):
+        """
+        Predicted vs. actual consumption and stock per bucket (day, Saturday
+        based week or Jalali month) per ingredient between from and to
+        """
+        params = InventoryComparisonRangeQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        rows = compare_inventory_range(
+            params['from'],
+            params['to'],
+            params['bucket'],
+            ingredient_id=params.get('ingredient_id'),
+        )
+        if not params['stream']:
+            return Response(list(rows), status=status.HTTP_200_OK)
 
+        def lines():
+            for row in rows:
+                yield json.dumps(row, ensure_ascii=False, separators=(',', ':')).encode() + b'\n'
+
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+
+class ProcurementView(APIView):
+    """
+    برنامه خرید مواد اولیه
+    Ingredient demand of the upcoming menu plans netted against the stock
+    """
+
+    permission_classes = [KitchenAccess]
+
+    @swagger_auto_schema(
+        operation_summary="Procurement plan",
+        operation_description="Explode the menu plans between from and to that are not cooked yet into ingredient demand per day (amount_per_serving × capacity, in the ingredient's unit), net it against the current stock less what the uncooked plans from today up to from still need (committed) and return the shortfalls. Recipe lines whose unit cannot be converted to the ingredient's are left out and listed in unconverted_units. Requires kitchen manager access.",
+        manual_parameters=[
+            openapi.Parameter('from', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True, description='Jalali start date (YYYY-MM-DD), not before today'),
+            openapi.Parameter('to', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True, description='Jalali end date (YYYY-MM-DD)'),
+            openapi.Parameter('ingredient_id', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False),
+            openapi.Parameter('shortfall_only', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN, required=False, description='Only ingredients with a shortfall'),
+        ],
+        responses={200: openapi.Response(description='[{ingredient, stock, committed, demand, shortfall, unconverted_units, days: [{date, demand, projected_stock, shortfall}]}]')},
+    )
+    def get(self, request):
+        params = ProcurementQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        results = plan_procurement(
+            params['from'],
+            params['to'],
+            ingredient_id=params.get('ingredient_id'),
+            shortfall_only=params['shortfall_only'],
+        )
+        return Response(results, status=status.HTTP_200_OK)
+
+
+class LowStockView(APIView):
+    """
+    مواد اولیه زیر نقطه سفارش
+    Stock rows at or below their reorder point, kept current on every stock
+    change so the feed only reads the flagged rows; cheap to poll.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_summary="Low-stock feed",
+        operation_description="Ingredients whose stock is at or below their reorder point: the larger of the warning amount and the trailing daily consumption times the delivery lead time. Requires authentication.",
+        responses={200: LowStockSerializer(many=True)},
+    )
+    def get(self, request):
+        serializer = LowStockSerializer(low_stock(), many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
@@ -0,0 +1,144 @@
+from datetime import date, timedelta
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+import jdatetime
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.accounts.models import User
+from apps.foods.models import Food, FoodIngredient
+from apps.ingredients.inventory_views import InventoryComparisonView
+from apps.ingredients.models import Ingredient, InventoryStockUpdate, MaterialConsumption
+from apps.menu.models import MenuPlan
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def populate(ingredients=2000, foods=400, ingredients_per_food=10, plans=50000, days=365,
+             inspections=30, consumption_share=5):
+    """
+    Insert the comparison fixture with set-based INSERTs: foods using
+    ingredients_per_food ingredients each, plans spread over the last days,
+    consumptions for every consumption_share-th plan and inspections every
+    third day per ingredient. Returns the id of the first ingredient.
+    """
+    today = date.today()
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            WITH rows AS (
+                INSERT INTO {_table(Ingredient)}
+                    (category, subcategory, name, unit, unit_price, code, warning_amount, created_at, updated_at)
+                SELECT 'normal', 'staff', 'bench ingredient ' || i, 'kg', 1, 'BIC' || i, 0, NOW(), NOW()
+                FROM generate_series(1, %s) AS i
+                RETURNING id
+            )
+            SELECT min(id) FROM rows
+        """, [ingredients])
+        ingredient_low = cursor.fetchone()[0]
+        cursor.execute(f"""
+            WITH rows AS (
+                INSERT INTO {_table(Food)}
+                    (title, category, subcategory, meal_types, preparation_time, unit_price, created_at, updated_at)
+                SELECT 'bench food ' || i, 'normal', 'staff', ARRAY['breakfast', 'lunch', 'dinner'], 0, 0, NOW(), NOW()
+                FROM generate_series(1, %s) AS i
+                RETURNING id
+            )
+            SELECT min(id) FROM rows
+        """, [foods])
+        food_low = cursor.fetchone()[0]
+        # Every other recipe line is in grams, so the figures go through unit conversion
+        cursor.execute(f"""
+            INSERT INTO {_table(FoodIngredient)}
+                (food_id, ingredient_id, amount_per_serving, unit, created_at, updated_at)
+            SELECT %s + f, %s + (f * %s + j) %% %s,
+                   (0.05 + (j %% 7) * 0.1) * CASE WHEN j %% 2 = 0 THEN 1000 ELSE 1 END,
+                   CASE WHEN j %% 2 = 0 THEN 'g' ELSE '' END, NOW(), NOW()
+            FROM generate_series(0, %s - 1) AS f, generate_series(0, %s - 1) AS j
+        """, [food_low, ingredient_low, ingredients_per_food, ingredients, foods, ingredients_per_food])
+        cursor.execute(f"""
+            INSERT INTO {_table(MenuPlan)}
+                (date, food_id, meal_type, capacity, cook_status, created_at, updated_at)
+            SELECT %s::date - (i %% %s), %s + i %% %s,
+                   (ARRAY['breakfast', 'lunch', 'dinner'])[1 + i %% 3],
+                   50 + i %% 100, 'done', NOW(), NOW()
+            FROM generate_series(0, %s - 1) AS i
+        """, [today, days, food_low, foods, plans])
+        cursor.execute(f"""
+            INSERT INTO {_table(MaterialConsumption)}
+                (menu_plan_id, ingredient_id, consumed_amount, unit, created_at, updated_at)
+            SELECT plan.id, usage.ingredient_id, round(usage.amount_per_serving * plan.capacity * 0.9, 2),
+                   CASE WHEN usage.unit = '' THEN 'kg' ELSE usage.unit END, NOW(), NOW()
+            FROM {_table(MenuPlan)} AS plan
+            JOIN {_table(FoodIngredient)} AS usage ON usage.food_id = plan.food_id
+            WHERE plan.food_id >= %s AND plan.id %% %s = 0
+        """, [food_low, consumption_share])
+        cursor.execute(f"""
+            INSERT INTO {_table(InventoryStockUpdate)}
+                (ingredient_id, actual_amount, inspection_date, created_at, updated_at)
+            SELECT %s + i, 1000 - d * 10 + i %% 17, %s::date - d * 3, NOW(), NOW()
+            FROM generate_series(0, %s - 1) AS i, generate_series(0, %s - 1) AS d
+        """, [ingredient_low, today, ingredients, inspections])
+        for model in (Ingredient, Food, FoodIngredient, MenuPlan, MaterialConsumption, InventoryStockUpdate):
+            cursor.execute(f'ANALYZE {_table(model)}')
+    return ingredient_low
+
+
+class Command(BaseCommand):
+    help = (
+        'Times the inventory comparison endpoint on a fixture of 2,000 ingredients and 50,000 menu '
+        'plans. The fixture is inserted in a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=2000, help='Synthetic ingredients')
+        parser.add_argument('--foods', type=int, default=400, help='Synthetic foods')
+        parser.add_argument('--ingredients-per-food', type=int, default=10, help='Ingredients of each food')
+        parser.add_argument('--plans', type=int, default=50000, help='Synthetic menu plans')
+        parser.add_argument('--repeat', type=int, default=3, help='Requests per measurement (best is reported)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write('inserting the fixture...')
+            ingredient_low = populate(
+                ingredients=options['ingredients'],
+                foods=options['foods'],
+                ingredients_per_food=options['ingredients_per_food'],
+                plans=options['plans'],
+            )
+            self._run(options, ingredient_low)
+            transaction.set_rollback(True)
+
+    def _run(self, options, ingredient_low):
+        user = User.objects.filter(is_central=True).first() or User.objects.create(
+            username='bench_comparison', is_central=True
+        )
+        factory = APIRequestFactory()
+        view = InventoryComparisonView.as_view()
+        today = jdatetime.date.today()
+        params = {
+            'all ingredients': {'date': str(today)},
+            'all, previous_date': {'date': str(today), 'previous_date': str(today - timedelta(days=30))},
+            'one ingredient': {'date': str(today), 'ingredient_id': ingredient_low + 7},
+            'range, jalali months': {'from': str(today - timedelta(days=364)), 'to': str(today), 'bucket': 'jalali_month'},
+            'range, days': {'from': str(today - timedelta(days=364)), 'to': str(today), 'bucket': 'day'},
+        }
+
+        self.stdout.write(f"{'request':<22} {'rows':>6} {'queries':>8} {'ms':>10}")
+        for name, query in params.items():
+            best = None
+            for _ in range(options['repeat']):
+                request = factory.get('/api/ingredients/comparison/', query)
+                force_authenticate(request, user=user)
+                # The view checks permissions in dispatch, before DRF authenticates
+                request.user = user
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = view(request)
+                    elapsed = time.perf_counter() - started
+                assert response.status_code == 200, response.data
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write(f'{name:<22} {len(response.data):>6} {len(queries):>8} {best * 1000:>10.1f}')
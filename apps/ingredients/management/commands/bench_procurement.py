@@ -0,0 +1,86 @@
+from datetime import timedelta
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+import jdatetime
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.accounts.models import User
+from apps.ingredients.inventory_views import ProcurementView
+from apps.ingredients.models import InventoryStock
+from apps.menu.models import MenuPlan
+
+from .bench_inventory_comparison import _table, populate
+
+
+class Command(BaseCommand):
+    help = (
+        'Times the procurement plan over a quarter of upcoming menu plans (2,000 ingredients, '
+        '400 foods). The fixture is inserted in a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=2000, help='Synthetic ingredients')
+        parser.add_argument('--foods', type=int, default=400, help='Synthetic foods')
+        parser.add_argument('--ingredients-per-food', type=int, default=10, help='Ingredients of each food')
+        parser.add_argument('--plans', type=int, default=50000, help='Synthetic menu plans')
+        parser.add_argument('--days', type=int, default=90, help='Days the plans are spread over')
+        parser.add_argument('--repeat', type=int, default=3, help='Requests per measurement (best is reported)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write('inserting the fixture...')
+            last_plan = MenuPlan.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            ingredient_low = populate(
+                ingredients=options['ingredients'],
+                foods=options['foods'],
+                ingredients_per_food=options['ingredients_per_food'],
+                plans=options['plans'],
+                days=options['days'],
+                inspections=1,
+            )
+            with connection.cursor() as cursor:
+                # The fixture plans the past days; move its plans to the upcoming ones
+                cursor.execute(f"""
+                    UPDATE {_table(MenuPlan)} SET date = date + %s, cook_status = 'pending'
+                    WHERE id > %s
+                """, [options['days'], last_plan])
+                cursor.execute(f"""
+                    INSERT INTO {_table(InventoryStock)} (ingredient_id, total_amount, created_at, updated_at)
+                    SELECT id, 500 + id %% 1000, NOW(), NOW()
+                    FROM generate_series(%s, %s + %s - 1) AS id
+                    ON CONFLICT (ingredient_id) DO NOTHING
+                """, [ingredient_low, ingredient_low, options['ingredients']])
+                cursor.execute(f'ANALYZE {_table(MenuPlan)}')
+            self._run(options, ingredient_low)
+            transaction.set_rollback(True)
+
+    def _run(self, options, ingredient_low):
+        user = User.objects.filter(is_central=True).first() or User.objects.create(
+            username='bench_procurement', is_central=True
+        )
+        factory = APIRequestFactory()
+        view = ProcurementView.as_view()
+        start = jdatetime.date.today() + timedelta(days=1)
+        end = start + timedelta(days=options['days'] - 1)
+        params = {
+            'quarter': {'from': str(start), 'to': str(end)},
+            'quarter, shortfall only': {'from': str(start), 'to': str(end), 'shortfall_only': 'true'},
+            'one ingredient': {'from': str(start), 'to': str(end), 'ingredient_id': ingredient_low + 7},
+        }
+
+        self.stdout.write(f"{'request':<24} {'rows':>6} {'queries':>8} {'ms':>10}")
+        for name, query in params.items():
+            best = None
+            for _ in range(options['repeat']):
+                request = factory.get('/api/ingredients/procurement/', query)
+                force_authenticate(request, user=user)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = view(request)
+                    elapsed = time.perf_counter() - started
+                assert response.status_code == 200, response.data
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write(f'{name:<24} {len(response.data):>6} {len(queries):>8} {best * 1000:>10.1f}')
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.ingredients.models import InventoryStock
+from apps.ingredients.reorder import refresh_reorder_points
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the daily usage, reorder point and low-stock flag of every stock row. Run daily, '
+        'as the trailing consumption window slides, and once after the columns are added.'
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        changed = refresh_reorder_points()
+        elapsed = time.perf_counter() - started
+        low = InventoryStock.objects.filter(is_low=True).count()
+        self.stdout.write(self.style.SUCCESS(f'changed={changed} low={low} elapsed={elapsed:.3f}s'))
@@ -0,0 +1,116 @@
+from datetime import date
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.accounts.models import User
+from apps.foods.models import Food
+from apps.ingredients.inventory_views import InventoryLogViewSet, MaterialConsumptionViewSet
+from apps.ingredients.models import Ingredient, InventoryLog, InventoryStock, MaterialConsumption, StockMovement
+from apps.menu.models import MenuPlan
+
+
+class Command(BaseCommand):
+    help = (
+        'Fires parallel receipts and consumptions of one ingredient through the inventory endpoints '
+        'and verifies the stock equals the initial amount plus the ledger'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--receipts', type=int, default=40, help='Parallel inventory log entries')
+        parser.add_argument('--consumptions', type=int, default=40, help='Parallel material consumptions')
+        parser.add_argument('--initial', type=int, default=100000, help='Initial stock of the ingredient')
+
+    def handle(self, *args, **options):
+        receipts = options['receipts']
+        consumptions = options['consumptions']
+        initial = options['initial']
+
+        user = User.objects.filter(is_central=True).first() or User.objects.create(
+            username='bench_stock', is_central=True
+        )
+        ingredient = Ingredient.objects.create(
+            category='normal', subcategory='staff', name='bench stock', unit='kg', unit_price=1,
+            code='BSTOCK', warning_amount=0,
+        )
+        food = Food.objects.create(
+            title='bench stock', category='normal', subcategory='staff', meal_types=['lunch'],
+            preparation_time=0, unit_price=0,
+        )
+        stock = InventoryStock.objects.create(ingredient=ingredient, total_amount=initial)
+        # A consumption is unique per plan and ingredient, so each one gets its own plan
+        plans = MenuPlan.objects.bulk_create([
+            MenuPlan(date=date.today(), food=food, meal_type='lunch', capacity=0, cook_status='done')
+            for _ in range(consumptions)
+        ])
+
+        factory = APIRequestFactory()
+        jobs = [
+            (InventoryLogViewSet, '/api/ingredients/logs/', {
+                'inventory': stock.id, 'amount': 1 + i % 9, 'unit': 'kg', 'code': f'BS{i}',
+                'date': str(date.today()),
+            })
+            for i in range(receipts)
+        ] + [
+            (MaterialConsumptionViewSet, '/api/ingredients/material-consumptions/', {
+                'menu_plan': plan.id, 'ingredient': ingredient.id, 'consumed_amount': 1 + i % 7, 'unit': 'kg',
+            })
+            for i, plan in enumerate(plans)
+        ]
+
+        barrier = threading.Barrier(len(jobs))
+        results = {'created': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def issue(viewset, path, data):
+            outcome = 'errors'
+            try:
+                request = factory.post(path, data, format='json')
+                force_authenticate(request, user=user)
+                barrier.wait()
+                response = viewset.as_view({'post': 'create'})(request)
+                if response.status_code == 201:
+                    outcome = 'created'
+                else:
+                    self.stderr.write(str(response.data))
+            except Exception as e:
+                self.stderr.write(str(e))
+            finally:
+                connection.close()
+            with lock:
+                results[outcome] += 1
+
+        threads = [threading.Thread(target=issue, args=job) for job in jobs]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        stock.refresh_from_db()
+        received = InventoryLog.objects.filter(inventory=stock).aggregate(total=Sum('amount'))['total'] or 0
+        consumed = MaterialConsumption.objects.filter(ingredient=ingredient).aggregate(
+            total=Sum('consumed_amount'),
+        )['total'] or 0
+        expected = initial + received - float(consumed)
+        moved = StockMovement.objects.filter(ingredient=ingredient).aggregate(total=Sum('amount'))['total'] or 0
+        food.delete()
+        ingredient.delete()
+
+        self.stdout.write(
+            f"requests={len(jobs)} created={results['created']} errors={results['errors']} "
+            f"received={received} consumed={consumed} stock={stock.total_amount} expected={expected} "
+            f"elapsed={elapsed:.3f}s"
+        )
+        if results['errors']:
+            raise CommandError(f"{results['errors']} requests failed")
+        if stock.total_amount != expected:
+            raise CommandError(f'Lost updates: stock={stock.total_amount} ledger={expected}')
+        if abs(initial + moved - stock.total_amount) > 1e-6:
+            raise CommandError(f'Stock movements do not add up: stock={stock.total_amount} movements={moved}')
+        self.stdout.write(self.style.SUCCESS('Stock matches the ledger'))
@@ -0,0 +1,38 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.ingredients.pricing import PriceListError, apply_price_list, read_price_list, validate_price_list
+
+
+class Command(BaseCommand):
+    help = (
+        'Applies a price list (CSV with code and unit_price columns, or JSON) to the ingredients in one '
+        'statement and lists the foods whose recipe cost moved by more than --threshold percent.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Price list file (.csv or .json)')
+        parser.add_argument('--threshold', default='5', help='Cost change in percent to report a food')
+
+    def handle(self, *args, **options):
+        try:
+            threshold = Decimal(options['threshold'])
+        except InvalidOperation:
+            raise CommandError('--threshold must be a number')
+        fmt = 'json' if options['path'].lower().endswith('.json') else 'csv'
+        try:
+            with open(options['path'], encoding='utf-8-sig') as price_list:
+                prices = validate_price_list(read_price_list(price_list.read(), fmt))
+        except OSError as e:
+            raise CommandError(str(e))
+        except PriceListError as e:
+            raise CommandError('\n'.join(e.errors))
+
+        result = apply_price_list(prices, threshold)
+        for food in result['foods']:
+            change = 'new' if food['change_percent'] is None else f"{food['change_percent']:+}%"
+            self.stdout.write(f"{food['title']}: {food['previous_cost']} -> {food['cost']} ({change})")
+        self.stdout.write(self.style.SUCCESS(
+            f"updated={result['updated']} unchanged={result['unchanged']} foods_moved={len(result['foods'])}"
+        ))
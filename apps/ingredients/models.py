@@ -45,6 +45,14 @@ NORMAL_SUBCATEGORY_CHOICES = [
 # All subcategory choices combined
 SUBCATEGORY_CHOICES = HAZRATI_SUBCATEGORY_CHOICES + NORMAL_SUBCATEGORY_CHOICES
 
+# Kinds of stock movement (StockMovement.kind)
+MOVEMENT_KIND_CHOICES = [
+    ('receipt', 'دریافت از انبار'),
+    ('consumption', 'مصرف'),
+    ('adjustment', 'اصلاح موجودی'),
+    ('stocktake', 'شمارش موجودی'),
+]
+
 # Mapping category to valid subcategories
 CATEGORY_SUBCATEGORY_MAP = {
     'hazrati': [choice[0] for choice in HAZRATI_SUBCATEGORY_CHOICES],
@@ -92,6 +100,23 @@ class Ingredient(models.Model):
         verbose_name='مقدار هشدار موجودی',
         validators=[MinValueValidator(0)],
     )
+    # Bridges between mass, volume and count units (see apps.ingredients.units)
+    density = models.DecimalField(
+        max_digits=10,
+        decimal_places=4,
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(0)],
+        verbose_name='چگالی (گرم بر میلی‌لیتر)',
+    )
+    piece_weight = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(0)],
+        verbose_name='وزن هر عدد (گرم)',
+    )
     created_at = jmodels.jDateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
     updated_at = jmodels.jDateTimeField(auto_now=True, verbose_name='تاریخ به‌روزرسانی')
 
@@ -136,6 +161,24 @@ class InventoryStock(models.Model):
         null=True,
         blank=True,
     )
+    # Maintained by apps.ingredients.reorder; null until first computed
+    daily_usage = models.FloatField(
+        verbose_name='مصرف روزانه',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    reorder_point = models.FloatField(
+        verbose_name='نقطه سفارش',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    is_low = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='کمبود موجودی',
+    )
     created_at = jmodels.jDateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
     updated_at = jmodels.jDateTimeField(auto_now=True, verbose_name='تاریخ به‌روزرسانی')
 
@@ -143,6 +186,14 @@ class InventoryStock(models.Model):
         verbose_name = 'موجودی ماده اولیه'
         verbose_name_plural = 'موجودی مواد اولیه'
         ordering = ['ingredient']
+        constraints = [
+            # One stock row per ingredient, as get_or_create(ingredient=...) assumes
+            models.UniqueConstraint(fields=['ingredient'], name='inventorystock_ingredient_uniq'),
+        ]
+        indexes = [
+            # The low-stock feed reads only the flagged rows
+            models.Index(fields=['ingredient'], condition=models.Q(is_low=True), name='inventorystock_low_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"{self.ingredient.name} - {self.total_amount}"
@@ -183,6 +234,10 @@ class InventoryLog(models.Model):
         verbose_name = 'لاگ موجودی ماده اولیه'
         verbose_name_plural = 'لاگ‌های موجودی مواد اولیه'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination (see core.pagination)
+            models.Index(fields=['created_at', 'id'], name='inventorylog_created_id_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"{self.inventory.ingredient.name} - {self.amount}"
@@ -238,6 +293,18 @@ class MaterialConsumption(models.Model):
         verbose_name_plural = 'مصرفی‌های BOM'
         ordering = ['-created_at']
         unique_together = [['menu_plan', 'ingredient']]
+        indexes = [
+            # Keyset pagination (see core.pagination)
+            models.Index(fields=['created_at', 'id'], name='consumption_created_id_idx'),
+            # Consumption of an ingredient (comparison view); the unique
+            # (menu_plan, ingredient) index only serves lookups by plan. Covers
+            # consumed_amount and unit so the sums can be answered from the index.
+            models.Index(
+                fields=['ingredient', 'menu_plan'],
+                include=['consumed_amount', 'unit'],
+                name='consumption_ingr_plan_idx',
+            ),
+        ]
 
     def clean(self):
         from django.core.exceptions import ValidationError
@@ -315,6 +382,105 @@ class InventoryStockUpdate(models.Model):
         verbose_name_plural = 'ثبت‌های موجودی واقعی'
         ordering = ['-inspection_date', '-created_at']
         unique_together = [['ingredient', 'inspection_date']]
+        indexes = [
+            # Latest inspection of an ingredient up to a date, read as one index tuple
+            models.Index(
+                fields=['ingredient', '-inspection_date', '-created_at'],
+                name='stockupdate_ingr_latest_idx',
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.ingredient.name} - {self.actual_amount} ({self.inspection_date})"
+
+
+class StockMovement(models.Model):
+    """
+    دفتر گردش موجودی - هر تغییر InventoryStock.total_amount یک ردیف
+    Append-only: rows are written by apps.ingredients.stock and never
+    changed; a correction is a new movement. amount is the change actually
+    applied (after the floor at zero) and balance the stock right after it.
+    """
+    objects = jmodels.jManager()
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='stock_movements',
+        verbose_name='ماده اولیه',
+    )
+    kind = models.CharField(
+        max_length=50,
+        choices=MOVEMENT_KIND_CHOICES,
+        verbose_name='نوع گردش',
+    )
+    amount = models.FloatField(verbose_name='تغییر موجودی')
+    balance = models.FloatField(verbose_name='موجودی پس از گردش')
+    date = jmodels.jDateField(verbose_name='تاریخ')
+    inventory_log = models.ForeignKey(
+        InventoryLog,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='stock_movements',
+        verbose_name='لاگ موجودی',
+    )
+    material_consumption = models.ForeignKey(
+        MaterialConsumption,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='stock_movements',
+        verbose_name='مصرفی BOM',
+    )
+    stock_update = models.ForeignKey(
+        InventoryStockUpdate,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='stock_movements',
+        verbose_name='ثبت موجودی واقعی',
+    )
+    created_at = jmodels.jDateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
+
+    class Meta:
+        verbose_name = 'گردش موجودی'
+        verbose_name_plural = 'گردش‌های موجودی'
+        ordering = ['-date', '-id']
+        indexes = [
+            # Movements of an ingredient after its last snapshot (balance_at)
+            models.Index(fields=['ingredient', 'date'], include=['amount'], name='stockmovement_ingr_date_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.ingredient.name} - {self.amount} ({self.date})"
+
+
+class StockSnapshot(models.Model):
+    """
+    موجودی پایان روز - مانده هر ماده اولیه در پایان روزهایی که گردش داشته
+    balance is the sum of the ingredient's movements dated up to date. The
+    rows are written by the rebuild_stock_snapshots command and kept in
+    step when a back-dated movement is posted.
+    """
+    objects = jmodels.jManager()
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='stock_snapshots',
+        verbose_name='ماده اولیه',
+    )
+    date = jmodels.jDateField(verbose_name='تاریخ')
+    balance = models.FloatField(verbose_name='موجودی پایان روز')
+    created_at = jmodels.jDateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
+
+    class Meta:
+        verbose_name = 'موجودی پایان روز'
+        verbose_name_plural = 'موجودی‌های پایان روز'
+        ordering = ['-date']
+        constraints = [
+            # Also serves the latest snapshot of an ingredient up to a date
+            models.UniqueConstraint(fields=['ingredient', 'date'], name='stocksnapshot_ingr_date_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.ingredient.name} - {self.balance} ({self.date})"
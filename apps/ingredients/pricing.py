@@ -0,0 +1,148 @@
+"""
+به‌روزرسانی گروهی قیمت مواد اولیه
+Applies a price list (ingredient code → unit_price) in one statement.
+The list is validated as a whole, without a model round trip per row:
+prices in Python, codes in one query against Ingredient. The foods using
+the repriced ingredients are then recosted (see apps.foods.costing), and
+the ones whose cost moved by more than a threshold are reported.
+"""
+import csv
+from decimal import Decimal, InvalidOperation
+import io
+import json
+
+from django.db import connection, transaction
+
+from apps.foods.costing import reprice_ingredients
+from apps.foods.models import Food
+
+from .models import Ingredient
+
+# Ingredient.unit_price is DecimalField(max_digits=10, decimal_places=2)
+MAX_PRICE = Decimal('99999999.99')
+
+
+class PriceListError(ValueError):
+    """Raised with a list of Persian messages when a price list is rejected"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(errors))
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def read_price_list(content, fmt):
+    """
+    (code, price) pairs of a price list. fmt is 'csv', with code and
+    unit_price columns, or 'json', either {code: price} or a list of
+    {"code": ..., "unit_price": ...}. Prices are returned as given.
+    """
+    try:
+        if fmt == 'csv':
+            rows = csv.DictReader(io.StringIO(content))
+            if not rows.fieldnames or not {'code', 'unit_price'} <= set(rows.fieldnames):
+                raise PriceListError(['فایل CSV باید ستون‌های code و unit_price داشته باشد.'])
+            return [(row['code'], row['unit_price']) for row in rows]
+        data = json.loads(content) if isinstance(content, str) else content
+        if isinstance(data, dict):
+            return list(data.items())
+        if isinstance(data, list) and all(isinstance(row, dict) for row in data):
+            return [(row.get('code'), row.get('unit_price')) for row in data]
+    except (csv.Error, json.JSONDecodeError) as e:
+        raise PriceListError([f'فایل قیمت قابل خواندن نیست: {e}'])
+    raise PriceListError(['لیست قیمت باید به شکل {code: unit_price} یا لیستی از {code, unit_price} باشد.'])
+
+
+def validate_price_list(pairs):
+    """
+    [(code, Decimal price)] for pairs, or PriceListError listing every
+    problem: bad prices, repeated codes, and codes matching no ingredient
+    or several (Ingredient.code is not unique).
+    """
+    errors = []
+    prices = {}
+    for line, (code, price) in enumerate(pairs, start=1):
+        code = str(code or '').strip()
+        if not code:
+            errors.append(f'ردیف {line}: کد ماده اولیه خالی است.')
+            continue
+        if code in prices:
+            errors.append(f'کد {code} بیش از یک بار آمده است.')
+            continue
+        try:
+            price = Decimal(str(price).strip())
+        except (InvalidOperation, ValueError):
+            errors.append(f'کد {code}: قیمت «{price}» عدد نیست.')
+            continue
+        if not price.is_finite() or price < 0 or price > MAX_PRICE or price.as_tuple().exponent < -2:
+            errors.append(f'کد {code}: قیمت باید عددی بین 0 و {MAX_PRICE} با حداکثر دو رقم اعشار باشد.')
+            continue
+        prices[code] = price
+    if not prices and not errors:
+        errors.append('لیست قیمت خالی است.')
+
+    if prices:
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT listed.code, COUNT(ingredient.id)
+                FROM unnest(%s::text[]) AS listed(code)
+                LEFT JOIN {_table(Ingredient)} AS ingredient ON ingredient.code = listed.code
+                GROUP BY listed.code
+                HAVING COUNT(ingredient.id) <> 1
+                ORDER BY listed.code
+            """, [list(prices)])
+            for code, matches in cursor.fetchall():
+                if matches:
+                    errors.append(f'کد {code} به {matches} ماده اولیه تعلق دارد.')
+                else:
+                    errors.append(f'ماده اولیه‌ای با کد {code} یافت نشد.')
+    if errors:
+        raise PriceListError(errors)
+    return list(prices.items())
+
+
+@transaction.atomic
+def apply_price_list(prices, threshold=Decimal('5')):
+    """
+    Set the prices ([(code, Decimal price)], validated) with one
+    UPDATE ... FROM (VALUES ...), recost the foods using the changed
+    ingredients and return {'updated', 'unchanged', 'foods'}, foods being
+    those whose recipe cost moved by more than threshold percent.
+    """
+    values = ', '.join(['(%s, %s::numeric)'] * len(prices))
+    params = [value for pair in prices for value in pair]
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {_table(Ingredient)} AS ingredient
+            SET unit_price = listed.unit_price, updated_at = NOW()
+            FROM (VALUES {values}) AS listed(code, unit_price)
+            WHERE ingredient.code = listed.code AND ingredient.unit_price <> listed.unit_price
+            RETURNING ingredient.id
+        """, params)
+        changed = [pk for pk, in cursor.fetchall()]
+
+    foods = Food.objects.filter(ingredients__ingredient_id__in=changed).distinct()
+    before = dict(foods.values_list('id', 'recipe_cost'))
+    reprice_ingredients(changed)
+
+    moved = []
+    for pk, title, cost in Food.objects.filter(id__in=before).values_list('id', 'title', 'recipe_cost'):
+        previous = before[pk]
+        if previous == cost:
+            continue
+        # A cost appearing from nothing (or first computed) or becoming
+        # unknown always counts
+        change = (cost - previous) * 100 / previous if previous and cost is not None else None
+        if change is None or abs(change) > threshold:
+            moved.append({
+                'id': pk,
+                'title': title,
+                'previous_cost': previous,
+                'cost': cost,
+                'change_percent': round(change, 2) if change is not None else None,
+            })
+    moved.sort(key=lambda food: (food['change_percent'] is not None, -abs(food['change_percent'] or 0)))
+    return {'updated': len(changed), 'unchanged': len(prices) - len(changed), 'foods': moved}
@@ -0,0 +1,89 @@
+"""
+نقطه سفارش مواد اولیه
+Keeps the low-stock set, InventoryStock.is_low, current. An ingredient is
+low when its stock is at or below its reorder point: the larger of its
+warning amount and what it consumes in INVENTORY_REORDER_LEAD_DAYS at its
+average daily consumption (daily_usage) over the trailing
+INVENTORY_REORDER_WINDOW_DAYS. Consumptions in a unit that cannot be
+converted to the ingredient's are left out of daily_usage rather than
+counted as if already in it.
+
+Stock changes flip the flag against the stored reorder point (see
+stock._update_stock). The reorder point itself moves when consumptions are
+recorded or the ingredient changes, and as the window slides; callers
+refresh those ingredients here, and the refresh_reorder_points command
+refreshes all of them daily. Rows that predate the flag are computed
+after migrate (see upgrade.compute_reorder_points). Readers only scan the
+flagged rows.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connection
+
+from apps.menu.models import MenuPlan
+
+from .models import Ingredient, InventoryStock, MaterialConsumption
+from .units import factors_sql
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def refresh_reorder_points(ingredient_ids=None, today=None):
+    """
+    Recompute daily_usage, reorder_point and is_low of the stock rows of
+    ingredient_ids (all rows when None) in one statement, writing only the
+    rows that change. Returns the number of rows written.
+    """
+    if ingredient_ids is not None:
+        ingredient_ids = list(set(ingredient_ids))
+        if not ingredient_ids:
+            return 0
+    today = today or date.today()
+    window = settings.INVENTORY_REORDER_WINDOW_DAYS
+    params = {
+        'ids': ingredient_ids,
+        'first_day': today - timedelta(days=window - 1),
+        'today': today,
+        'window': window,
+        'lead': settings.INVENTORY_REORDER_LEAD_DAYS,
+    }
+    consumption_filter = ingredient_filter = ''
+    if ingredient_ids is not None:
+        consumption_filter = 'AND consumption.ingredient_id = ANY(%(ids)s)'
+        ingredient_filter = 'WHERE ingredient.id = ANY(%(ids)s)'
+    factors = factors_sql('%(ids)s::bigint[]' if ingredient_ids is not None else None)
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            WITH factor AS ({factors}), usage AS (
+                SELECT consumption.ingredient_id,
+                       SUM(consumption.consumed_amount * factor.factor)::float / %(window)s AS daily
+                FROM {_table(MaterialConsumption)} AS consumption
+                JOIN {_table(MenuPlan)} AS plan ON plan.id = consumption.menu_plan_id
+                LEFT JOIN factor ON factor.ingredient_id = consumption.ingredient_id
+                                AND factor.unit = consumption.unit
+                WHERE plan.date BETWEEN %(first_day)s AND %(today)s {consumption_filter}
+                GROUP BY 1
+            ), target AS (
+                SELECT ingredient.id AS ingredient_id, COALESCE(usage.daily, 0) AS daily_usage,
+                       GREATEST(ingredient.warning_amount, COALESCE(usage.daily, 0) * %(lead)s) AS reorder_point
+                FROM {_table(Ingredient)} AS ingredient
+                LEFT JOIN usage ON usage.ingredient_id = ingredient.id
+                {ingredient_filter}
+            )
+            UPDATE {_table(InventoryStock)} AS stock
+            SET daily_usage = target.daily_usage, reorder_point = target.reorder_point,
+                is_low = stock.total_amount <= target.reorder_point
+            FROM target
+            WHERE stock.ingredient_id = target.ingredient_id
+              AND (stock.daily_usage, stock.reorder_point, stock.is_low)
+                  IS DISTINCT FROM (target.daily_usage, target.reorder_point, stock.total_amount <= target.reorder_point)
+        """, params)
+        return cursor.rowcount
+
+
+def low_stock():
+    """The flagged stock rows with their ingredients, from the partial index"""
+    return InventoryStock.objects.filter(is_low=True).select_related('ingredient')
@@ -1,6 +1,9 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 
 from .models import Ingredient
+from .pricing import PriceListError, read_price_list, validate_price_list
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -23,6 +26,8 @@ class IngredientSerializer(serializers.ModelSerializer):
             'unit_price',
             'code',
             'warning_amount',
+            'density',
+            'piece_weight',
             'created_at',
             'updated_at',
         ]
@@ -69,3 +74,42 @@ class IngredientSerializer(serializers.ModelSerializer):
                 })
         
         return attrs
+
+
+class IngredientPriceListSerializer(serializers.Serializer):
+    """
+    A price list for the bulk price update: a CSV or JSON file, or prices
+    in the body (JSON, or CSV text). Validated as a whole.
+    """
+    prices = serializers.JSONField(
+        required=False,
+        help_text='{code: unit_price}، لیستی از {code, unit_price} یا متن CSV با ستون‌های code و unit_price',
+    )
+    file = serializers.FileField(required=False, help_text='فایل CSV یا JSON')
+    threshold = serializers.DecimalField(
+        max_digits=6,
+        decimal_places=2,
+        min_value=0,
+        default=Decimal('5'),
+        help_text='درصد تغییر بهای غذا برای گزارش شدن',
+    )
+
+    def validate(self, attrs):
+        upload = attrs.pop('file', None)
+        if upload is not None:
+            fmt = 'json' if upload.name.lower().endswith('.json') else 'csv'
+            try:
+                content = upload.read().decode('utf-8-sig')
+            except UnicodeDecodeError:
+                raise serializers.ValidationError({'file': 'فایل باید با کدگذاری UTF-8 باشد.'})
+        elif 'prices' in attrs:
+            content = attrs['prices']
+            fmt = 'csv' if isinstance(content, str) else 'json'
+        else:
+            raise serializers.ValidationError({'prices': 'لیست قیمت (prices) یا فایل (file) الزامی است.'})
+
+        try:
+            attrs['prices'] = validate_price_list(read_price_list(content, fmt))
+        except PriceListError as e:
+            raise serializers.ValidationError({'prices': e.errors})
+        return attrs
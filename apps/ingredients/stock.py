@@ -0,0 +1,202 @@
+"""
+موجودی مواد اولیه
+Every change to InventoryStock.total_amount goes through this module. The
+arithmetic happens in the UPDATE itself, so concurrent receipts and
+consumptions never overwrite each other, and only the changed columns are
+written.
+
+Each change is also appended to the StockMovement ledger. StockSnapshot
+holds end-of-day balances, so the stock of any past date is one snapshot
+read plus the movements dated after it (see balance_at). The low-stock
+flag follows the new total here (see reorder).
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import InventoryStock, StockMovement, StockSnapshot
+from .reorder import refresh_reorder_points
+from .units import convert
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _update_stock(ingredient_id, values, kind, movement_date, source):
+    """
+    Apply values to the ingredient's stock row, creating an empty row
+    first when the ingredient has none, record the movement and return the
+    new total. Must run inside a transaction: the row lock taken here keeps
+    the previous and new totals ours until commit.
+    """
+    stock = InventoryStock.objects.filter(ingredient_id=ingredient_id)
+    previous = stock.select_for_update().values_list('total_amount', flat=True).first()
+    if previous is None:
+        # The unique ingredient constraint makes concurrent creations safe
+        InventoryStock.objects.get_or_create(ingredient_id=ingredient_id, defaults={'total_amount': 0})
+        previous = stock.select_for_update().values_list('total_amount', flat=True).get()
+    stock.update(**dict(values, updated_at=timezone.now()))
+    total, reorder_point, is_low = stock.values_list('total_amount', 'reorder_point', 'is_low').get()
+    if reorder_point is None:
+        refresh_reorder_points([ingredient_id])
+    elif (total <= reorder_point) != is_low:
+        stock.update(is_low=total <= reorder_point)
+
+    delta = total - previous
+    StockMovement.objects.create(
+        ingredient_id=ingredient_id, kind=kind, amount=delta, balance=total, date=movement_date, **source
+    )
+    # Snapshots at or after a back-dated movement already count the days before it
+    StockSnapshot.objects.filter(ingredient_id=ingredient_id, date__gte=movement_date).update(
+        balance=F('balance') + delta,
+    )
+    return total
+
+
+@transaction.atomic
+def adjust_stock(ingredient_id, delta, kind, movement_date, **source):
+    """
+    Add delta to the ingredient's stock (negative to consume), never going
+    below zero, and return the new total. source names the record behind
+    the movement (inventory_log, material_consumption or stock_update).
+    """
+    return _update_stock(ingredient_id, {
+        'total_amount': Greatest(F('total_amount') + float(delta), Value(0.0)),
+    }, kind, movement_date, source)
+
+
+@transaction.atomic
+def set_stock(ingredient_id, amount, kind, movement_date, last_received_date=None, **source):
+    """
+    Replace the ingredient's stock with a counted amount and return it.
+    last_received_date is only written when given.
+    """
+    values = {'total_amount': float(amount)}
+    if last_received_date is not None:
+        values['last_received_date'] = last_received_date
+    return _update_stock(ingredient_id, values, kind, movement_date, source)
+
+
+def consume(consumption):
+    """Take a material consumption (in its own unit) out of stock"""
+    amount = convert(consumption.consumed_amount, consumption.unit, consumption.ingredient)
+    return adjust_stock(
+        consumption.ingredient_id, -amount, 'consumption',
+        consumption.menu_plan.date, material_consumption=consumption,
+    )
+
+
+def restore_consumption(consumption):
+    """
+    Put back what consumption took out of stock, before it is changed or
+    deleted. Returns False when it never went through the ledger (plans
+    cooked before it existed, or consumptions created with the plan).
+    """
+    movements = StockMovement.objects.filter(material_consumption=consumption)
+    if not movements.exists():
+        return False
+    taken = movements.aggregate(total=Sum('amount'))['total']
+    adjust_stock(
+        consumption.ingredient_id, -taken, 'consumption',
+        consumption.menu_plan.date, material_consumption=consumption,
+    )
+    return True
+
+
+_BALANCE_SQL = f"""
+    COALESCE(snapshot.balance, 0) + COALESCE((
+        SELECT SUM(movement.amount)
+        FROM {_table(StockMovement)} AS movement
+        WHERE movement.ingredient_id = ingredient.id
+          AND movement.date > COALESCE(snapshot.date, '-infinity'::date)
+          AND movement.date <= %(day)s
+    ), 0)
+"""
+
+_SNAPSHOT_JOIN = f"""
+    LEFT JOIN LATERAL (
+        SELECT date, balance
+        FROM {_table(StockSnapshot)}
+        WHERE ingredient_id = ingredient.id AND date <= %(day)s
+        ORDER BY date DESC
+        LIMIT 1
+    ) AS snapshot ON TRUE
+"""
+
+
+def balance_at(day, ingredient_ids):
+    """
+    {ingredient id: stock at the end of day (Gregorian)} from the last
+    snapshot up to day plus the movements dated after it.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT ingredient.id, {_BALANCE_SQL}
+            FROM unnest(%(ids)s::bigint[]) AS ingredient(id)
+            {_SNAPSHOT_JOIN}
+        """, {'day': day, 'ids': list(ingredient_ids)})
+        return dict(cursor.fetchall())
+
+
+@transaction.atomic
+def rebuild_snapshots(ingredient_ids, since=None):
+    """
+    Rewrite the snapshots of the ingredients from since (Gregorian, None
+    for their whole history) with one row per day that has movements.
+
+    A full rebuild first posts an opening adjustment for ingredients whose
+    stock differs from their ledger (stock recorded before the ledger
+    existed), dated on their first movement or the creation of their stock
+    row. The stock rows are locked meanwhile so no movement slips between
+    the read and the write.
+    """
+    ids = list(ingredient_ids)
+    params = {'ids': ids, 'since': since, 'day': since - timedelta(days=1) if since else None}
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT id FROM {_table(InventoryStock)}
+            WHERE ingredient_id = ANY(%(ids)s) ORDER BY id FOR UPDATE
+        """, params)
+        if since is None:
+            cursor.execute(f"""
+                INSERT INTO {_table(StockMovement)} (ingredient_id, kind, amount, balance, date, created_at)
+                SELECT stock.ingredient_id, 'adjustment', stock.total_amount - COALESCE(ledger.total, 0),
+                       stock.total_amount, COALESCE(ledger.first_date, stock.created_at::date), NOW()
+                FROM {_table(InventoryStock)} AS stock
+                LEFT JOIN (
+                    SELECT ingredient_id, SUM(amount) AS total, MIN(date) AS first_date
+                    FROM {_table(StockMovement)}
+                    WHERE ingredient_id = ANY(%(ids)s)
+                    GROUP BY ingredient_id
+                ) AS ledger ON ledger.ingredient_id = stock.ingredient_id
+                WHERE stock.ingredient_id = ANY(%(ids)s)
+                  AND abs(stock.total_amount - COALESCE(ledger.total, 0)) > 1e-9
+            """, params)
+        cursor.execute(f"""
+            DELETE FROM {_table(StockSnapshot)}
+            WHERE ingredient_id = ANY(%(ids)s) AND (%(since)s::date IS NULL OR date >= %(since)s)
+        """, params)
+        # Without since the opening balance finds no snapshot or movement: zero
+        cursor.execute(f"""
+            WITH day AS (
+                SELECT ingredient_id, date, SUM(amount) AS amount
+                FROM {_table(StockMovement)}
+                WHERE ingredient_id = ANY(%(ids)s) AND (%(since)s::date IS NULL OR date >= %(since)s)
+                GROUP BY ingredient_id, date
+            ), opening AS (
+                SELECT ingredient.id, {_BALANCE_SQL} AS balance
+                FROM (SELECT DISTINCT ingredient_id AS id FROM day) AS ingredient
+                {_SNAPSHOT_JOIN}
+            )
+            INSERT INTO {_table(StockSnapshot)} (ingredient_id, date, balance, created_at)
+            SELECT day.ingredient_id, day.date,
+                   opening.balance + SUM(day.amount) OVER (PARTITION BY day.ingredient_id ORDER BY day.date),
+                   NOW()
+            FROM day
+            JOIN opening ON opening.id = day.ingredient_id
+        """, params)
+        return cursor.rowcount
@@ -0,0 +1,242 @@
+from datetime import date, timedelta
+import threading
+
+from django.db import connection
+from django.db.models import Sum
+from django.test import TransactionTestCase
+from rest_framework.test import APITestCase
+
+from apps.accounts.models import User
+from apps.foods.models import Food, FoodIngredient
+from apps.menu.models import MenuPlan
+from core.testing import PAGE_SIZE
+
+from .inventory_serializers import JalaliDateField
+from .comparison import compare_inventory, compare_inventory_range
+from .models import Ingredient, InventoryStock, InventoryStockUpdate, MaterialConsumption, StockMovement
+from .stock import adjust_stock, consume
+
+
+def _ingredient(code):
+    return Ingredient.objects.create(
+        name=f'ماده {code}', code=code, unit='kg', category='normal', subcategory='staff',
+        unit_price=1000, warning_amount=10,
+    )
+
+
+class InventoryStockListTest(APITestCase):
+    """The stock list annotates the last inspection instead of querying it per row"""
+
+    # One full page and part of the next
+    STOCKS = PAGE_SIZE + 3
+    INSPECTIONS_PER_STOCK = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='kitchen', roles=['kitchen_manager'])
+        inspectors = [User.objects.create(username=f'inspector{i}') for i in range(cls.INSPECTIONS_PER_STOCK)]
+        today = date.today()
+        cls.stocks = []
+        cls.last_inspection = {}
+        updates = []
+        for i in range(cls.STOCKS):
+            ingredient = _ingredient(f'ING-{i}')
+            stock = InventoryStock.objects.create(ingredient=ingredient, total_amount=100 + i)
+            cls.stocks.append(stock)
+            # Created out of date order, with the latest inspection neither first nor last
+            for j, days_ago in enumerate([3, 1 + i % 2, 5]):
+                updates.append(InventoryStockUpdate(
+                    ingredient=ingredient, actual_amount=50 + j, created_by=inspectors[(i + j) % len(inspectors)],
+                    inspection_date=today - timedelta(days=days_ago),
+                ))
+            cls.last_inspection[stock.id] = (
+                JalaliDateField().to_representation(today - timedelta(days=1 + i % 2)),
+                inspectors[(i + 1) % len(inspectors)].username,
+            )
+        InventoryStockUpdate.objects.bulk_create(updates)
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def assertStocks(self, results, stocks):
+        """results are the payloads of stocks, in order"""
+        self.assertEqual(
+            [
+                (row['id'], row['ingredient'], row['ingredient_name'], row['total_amount'],
+                 row['last_inspection_date'], row['last_inspected_by'])
+                for row in results
+            ],
+            [
+                (stock.id, stock.ingredient_id, stock.ingredient.name, stock.total_amount,
+                 *self.last_inspection[stock.id])
+                for stock in stocks
+            ],
+        )
+
+    def test_list_pages(self):
+        # COUNT(*), the page of stock rows with ingredients and annotations
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/ingredients/stock/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], self.STOCKS)
+        # Ordered by ingredient, which orders by name
+        stocks = sorted(self.stocks, key=lambda stock: stock.ingredient.name)
+        self.assertStocks(response.data['results'], stocks[:PAGE_SIZE])
+
+        with self.assertNumQueries(2):
+            response = self.client.get(response.data['next'])
+        self.assertEqual(response.status_code, 200)
+        self.assertStocks(response.data['results'], stocks[PAGE_SIZE:])
+        self.assertIsNone(response.data['next'])
+
+    def test_retrieve(self):
+        stock = self.stocks[1]
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/ingredients/stock/{stock.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertStocks([response.data], [stock])
+
+
+class ComparisonUnitsTest(APITestCase):
+    """Amounts in a unit the ingredient cannot convert to are reported, not counted 1:1"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredient = _ingredient('ING-U')
+        foods = [
+            Food.objects.create(
+                title=f'غذا {i}', category='normal', subcategory='staff',
+                meal_types=['lunch'], preparation_time=10, unit_price=100,
+            )
+            for i in range(2)
+        ]
+        plans = [
+            MenuPlan.objects.create(date=date.today(), food=food, meal_type='lunch', capacity=10, cook_status='done')
+            for food in foods
+        ]
+        FoodIngredient.objects.create(food=foods[0], ingredient=cls.ingredient, amount_per_serving=200, unit='g')
+        # Without a density, the mass amounts saved before cannot become litres
+        Ingredient.objects.filter(id=cls.ingredient.id).update(unit='l')
+        cls.ingredient.refresh_from_db()
+        FoodIngredient.objects.create(food=foods[1], ingredient=cls.ingredient, amount_per_serving=100, unit='ml')
+        MaterialConsumption.objects.bulk_create([
+            MaterialConsumption(menu_plan=plans[0], ingredient=cls.ingredient, consumed_amount=3, unit='kg'),
+            MaterialConsumption(menu_plan=plans[1], ingredient=cls.ingredient, consumed_amount=500, unit='ml'),
+        ])
+
+    def test_compare_inventory(self):
+        [row] = compare_inventory(date.today(), ingredient_id=self.ingredient.id)
+        self.assertEqual((row['predicted_amount'], row['actual_consumption']), (1.0, 0.5))
+        self.assertEqual(row['unconverted_units'], ['g', 'kg'])
+
+    def test_compare_inventory_range(self):
+        [row] = compare_inventory_range(date.today(), date.today(), 'day', ingredient_id=self.ingredient.id)
+        [bucket] = row['buckets']
+        self.assertEqual((bucket['predicted_amount'], bucket['actual_consumption']), (1.0, 0.5))
+        self.assertEqual(row['unconverted_units'], ['g', 'kg'])
+
+
+class ProcurementTest(APITestCase):
+    """Uncooked plans before from draw on the stock the range is netted against"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='kitchen', roles=['kitchen_manager'])
+        cls.ingredient = _ingredient('ING-P')
+        InventoryStock.objects.create(ingredient=cls.ingredient, total_amount=8)
+        food = Food.objects.create(
+            title='غذا', category='normal', subcategory='staff',
+            meal_types=['lunch'], preparation_time=10, unit_price=100,
+        )
+        FoodIngredient.objects.create(food=food, ingredient=cls.ingredient, amount_per_serving=500, unit='g')
+        # 5 kg each: tomorrow's plan is before the range, the next one in it
+        cls.start = date.today() + timedelta(days=2)
+        for day in (date.today() + timedelta(days=1), cls.start):
+            MenuPlan.objects.create(date=day, food=food, meal_type='lunch', capacity=10)
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def _get(self, start, end):
+        return self.client.get('/api/ingredients/procurement/', {'from': start, 'to': end})
+
+    def test_empty_dates(self):
+        response = self._get('', '')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'from', 'to'})
+
+    def test_committed_stock(self):
+        start = JalaliDateField().to_representation(self.start)
+        response = self._get(start, start)
+        self.assertEqual(response.status_code, 200)
+        [row] = response.data
+        self.assertEqual(
+            (row['stock'], row['committed'], row['demand'], row['shortfall'], row['unconverted_units']),
+            (8.0, 5.0, 5.0, 2.0, []),
+        )
+        self.assertEqual(
+            [(day['date'], day['projected_stock'], day['shortfall']) for day in row['days']],
+            [(start, -2.0, 2.0)],
+        )
+
+
+class StockLedgerConcurrencyTest(TransactionTestCase):
+    """Concurrent stock changes serialize on the stock row and each leave one movement"""
+
+    THREADS = 8
+    CALLS_PER_THREAD = 6
+    INITIAL = 40.0
+
+    def setUp(self):
+        self.ingredient = _ingredient('ING-C')
+        InventoryStock.objects.create(ingredient=self.ingredient, total_amount=self.INITIAL)
+        food = Food.objects.create(
+            title='غذا', category='normal', subcategory='staff',
+            meal_types=['lunch'], preparation_time=10, unit_price=100,
+        )
+        # One consumption per plan, as (menu_plan, ingredient) is unique
+        plans = MenuPlan.objects.bulk_create([
+            MenuPlan(date=date.today(), food=food, meal_type='lunch', capacity=10, cook_status='done')
+            for _ in range(self.THREADS * self.CALLS_PER_THREAD)
+        ])
+        self.consumptions = MaterialConsumption.objects.bulk_create([
+            MaterialConsumption(menu_plan=plan, ingredient=self.ingredient, consumed_amount=7, unit='kg')
+            for plan in plans
+        ])
+
+    def test_concurrent_adjust_and_consume(self):
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def work(thread):
+            try:
+                barrier.wait()
+                for call in range(self.CALLS_PER_THREAD):
+                    if (thread + call) % 2:
+                        consume(self.consumptions[thread * self.CALLS_PER_THREAD + call])
+                    else:
+                        adjust_stock(self.ingredient.id, 5, 'receipt', date.today())
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        movements = StockMovement.objects.filter(ingredient=self.ingredient)
+        self.assertEqual(movements.count(), self.THREADS * self.CALLS_PER_THREAD)
+        # Consumptions outrun receipts, so some hit the floor at zero and
+        # the movement records the part actually taken
+        total = InventoryStock.objects.get(ingredient=self.ingredient).total_amount
+        self.assertGreaterEqual(total, 0)
+        self.assertAlmostEqual(total, self.INITIAL + movements.aggregate(total=Sum('amount'))['total'])
+        # Each movement's balance follows from the one before it
+        balance = self.INITIAL
+        for movement in movements.order_by('id'):
+            balance += movement.amount
+            self.assertAlmostEqual(movement.balance, balance)
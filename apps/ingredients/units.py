@@ -0,0 +1,147 @@
+"""
+تبدیل واحد مواد اولیه
+Conversion between the units of UNIT_CHOICES. Units of one dimension
+convert through a precomputed factor table; mass, volume and count are
+bridged per ingredient by its density (grams per millilitre) and piece
+weight (grams per piece). Packaging units (pack, carton, ...) have no
+fixed size and only convert to themselves.
+
+Row-by-row callers use convert; set-based queries join
+factors_sql, built from the same table.
+"""
+from decimal import Decimal
+
+from django.db import connection
+
+from .models import UNIT_CHOICES, Ingredient
+
+
+# unit: (dimension, size in the dimension's base unit: gram, millilitre, piece)
+UNITS = {
+    'mg': ('mass', Decimal('0.001')),
+    'g': ('mass', Decimal('1')),
+    'kg': ('mass', Decimal('1000')),
+    'ton': ('mass', Decimal('1000000')),
+    'ml': ('volume', Decimal('1')),
+    'l': ('volume', Decimal('1000')),
+    'cup': ('volume', Decimal('240')),
+    'tbsp': ('volume', Decimal('15')),
+    'tsp': ('volume', Decimal('5')),
+    'pcs': ('count', Decimal('1')),
+    'dozen': ('count', Decimal('12')),
+    'pack': ('pack', Decimal('1')),
+    'carton': ('carton', Decimal('1')),
+    'set': ('set', Decimal('1')),
+    'tray': ('tray', Decimal('1')),
+    'bag': ('bag', Decimal('1')),
+}
+
+# (from unit, to unit): factor, for every pair within a dimension
+FACTORS = {
+    (source, target): source_size / target_size
+    for source, (source_dimension, source_size) in UNITS.items()
+    for target, (target_dimension, target_size) in UNITS.items()
+    if source_dimension == target_dimension
+}
+
+
+class UnitConversionError(ValueError):
+    """Raised when an amount cannot be expressed in the requested unit"""
+
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+        labels = dict(UNIT_CHOICES)
+        super().__init__(
+            f'واحد {labels.get(source, source)} قابل تبدیل به واحد {labels.get(target, target)} نیست.'
+        )
+
+
+def _grams_per_base(dimension, density, piece_weight):
+    # Grams in one base unit (ml, piece) of the dimension, None when unknown
+    if dimension == 'mass':
+        return Decimal('1')
+    if dimension == 'volume':
+        return density
+    if dimension == 'count':
+        return piece_weight
+    return None
+
+
+def factor(source, target, density=None, piece_weight=None):
+    """
+    Multiplier turning an amount in source into target. density and
+    piece_weight (Decimal) bridge dimensions; raises UnitConversionError
+    when the units cannot be bridged.
+    """
+    if source == target:
+        return Decimal('1')
+    try:
+        return FACTORS[source, target]
+    except KeyError:
+        pass
+    if source not in UNITS or target not in UNITS:
+        raise UnitConversionError(source, target)
+    (source_dimension, source_size), (target_dimension, target_size) = UNITS[source], UNITS[target]
+    source_grams = _grams_per_base(source_dimension, density, piece_weight)
+    target_grams = _grams_per_base(target_dimension, density, piece_weight)
+    if not source_grams or not target_grams:
+        raise UnitConversionError(source, target)
+    return source_size * source_grams / (target_size * target_grams)
+
+
+def ingredient_factor(ingredient, unit):
+    """Multiplier turning an amount in unit into the ingredient's (stock) unit"""
+    return factor(unit or ingredient.unit, ingredient.unit, ingredient.density, ingredient.piece_weight)
+
+
+def convert(amount, unit, ingredient):
+    """amount (in unit) expressed in the ingredient's unit, as a Decimal"""
+    return Decimal(amount) * ingredient_factor(ingredient, unit)
+
+
+def _pairs_sql():
+    # Every (from, to) unit pair with the ratio of their sizes, computed here once
+    values = ', '.join(
+        f"('{source}', '{target}', {source_size / target_size}::numeric, "
+        f"'{source_dimension}', '{target_dimension}')"
+        for source, (source_dimension, source_size) in UNITS.items()
+        for target, (target_dimension, target_size) in UNITS.items()
+    )
+    return f'(VALUES {values}) AS pair(source, target, ratio, source_dimension, target_dimension)'
+
+
+def _grams_sql(dimension):
+    return (
+        f"CASE {dimension} WHEN 'mass' THEN 1 WHEN 'volume' THEN ingredient.density "
+        f"WHEN 'count' THEN ingredient.piece_weight END"
+    )
+
+
+def factors_sql(ingredient_ids=None):
+    """
+    SQL query of (ingredient_id, unit, factor) rows: the multiplier turning
+    an amount in unit into the ingredient's unit, for every ingredient and
+    unit ('' standing for the ingredient's own unit, as in recipes). Pairs
+    that cannot be bridged (rows saved before the ingredient's unit,
+    density or piece weight changed) give NULL, as do units missing from
+    UNITS through the LEFT JOIN callers make on (ingredient_id, unit);
+    callers leave those amounts out and report them rather than guess.
+
+    ingredient_ids is an SQL placeholder of a bigint array restricting
+    the ingredients, for queries about a few of them.
+    """
+    table = connection.ops.quote_name(Ingredient._meta.db_table)
+    where = f'WHERE ingredient.id = ANY({ingredient_ids})' if ingredient_ids else ''
+    return f"""
+        SELECT ingredient.id AS ingredient_id, pair.source AS unit, CASE
+            WHEN pair.source_dimension = pair.target_dimension THEN pair.ratio
+            ELSE pair.ratio * ({_grams_sql('pair.source_dimension')})
+                / NULLIF({_grams_sql('pair.target_dimension')}, 0)
+        END AS factor
+        FROM {table} AS ingredient
+        JOIN {_pairs_sql()} ON pair.target = ingredient.unit
+        {where}
+        UNION ALL
+        SELECT ingredient.id, '', 1 FROM {table} AS ingredient {where}
+    """
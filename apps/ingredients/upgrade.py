@@ -0,0 +1,82 @@
+"""
+مهاجرت داده‌های موجود
+Data steps that accompany schema changes. Migration files are generated
+on deploy (makemigrations), so steps that must run before or after a
+migration hook into migrate's signals (see IngredientsConfig.ready) and
+check the schema themselves; they do nothing once the data is in shape.
+"""
+from django.db import connections
+
+from .models import InventoryStock
+from .reorder import refresh_reorder_points
+
+
+def _table(connection, model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def merge_duplicate_stocks(using='default', **kwargs):
+    """
+    pre_migrate: merge an ingredient's duplicate stock rows into its oldest
+    one before inventorystock_ingredient_uniq is added. Amounts are summed,
+    the latest receipt date is kept and rows pointing at the merged stock
+    rows (inventory logs) are moved to the kept one. Only baseline columns
+    are used, as the newer ones may not exist yet.
+    """
+    connection = connections[using]
+    table = InventoryStock._meta.db_table
+    with connection.cursor() as cursor:
+        if table not in connection.introspection.table_names(cursor):
+            return
+        if 'inventorystock_ingredient_uniq' in connection.introspection.get_constraints(cursor, table):
+            return
+        cursor.execute(f"""
+            SELECT array_agg(id ORDER BY id), SUM(total_amount), MAX(last_received_date)
+            FROM {_table(connection, InventoryStock)}
+            GROUP BY ingredient_id
+            HAVING COUNT(*) > 1
+        """)
+        groups = cursor.fetchall()
+        if not groups:
+            return
+
+        relations = [
+            (relation.related_model, relation.field.column)
+            for relation in InventoryStock._meta.related_objects
+            if relation.one_to_many
+            and relation.related_model._meta.db_table in connection.introspection.table_names(cursor)
+        ]
+        for ids, total_amount, last_received_date in groups:
+            keep, merged = ids[0], ids[1:]
+            for model, column in relations:
+                cursor.execute(
+                    f'UPDATE {_table(connection, model)} SET {connection.ops.quote_name(column)} = %s '
+                    f'WHERE {connection.ops.quote_name(column)} = ANY(%s)',
+                    [keep, merged],
+                )
+            cursor.execute(
+                f'UPDATE {_table(connection, InventoryStock)} SET total_amount = %s, last_received_date = %s WHERE id = %s',
+                [total_amount, last_received_date, keep],
+            )
+            cursor.execute(f'DELETE FROM {_table(connection, InventoryStock)} WHERE id = ANY(%s)', [merged])
+
+
+def compute_reorder_points(using='default', **kwargs):
+    """
+    post_migrate: compute the reorder point and low-stock flag of the stock
+    rows that have none yet, as rows created before the columns existed
+    start out not low and would be missing from the low-stock feed until
+    the daily refresh.
+    """
+    connection = connections[using]
+    table = InventoryStock._meta.db_table
+    with connection.cursor() as cursor:
+        if table not in connection.introspection.table_names(cursor):
+            return
+        columns = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+        if 'reorder_point' not in columns:
+            return
+        cursor.execute(f'SELECT ingredient_id FROM {_table(connection, InventoryStock)} WHERE reorder_point IS NULL')
+        ingredient_ids = [ingredient_id for ingredient_id, in cursor.fetchall()]
+    if ingredient_ids:
+        refresh_reorder_points(ingredient_ids)
@@ -7,7 +7,9 @@ from .inventory_views import (
     InventoryLogViewSet,
     MaterialConsumptionViewSet,
     InventoryStockUpdateViewSet,
-    InventoryComparisonView
+    InventoryComparisonView,
+    ProcurementView,
+    LowStockView,
 )
 
 router = DefaultRouter()
@@ -19,4 +21,6 @@ router.register(r'', IngredientManagementViewSet, basename='ingredient-managemen
 
 urlpatterns = [
     path('comparison/', InventoryComparisonView.as_view(), name='inventory-comparison'),
+    path('procurement/', ProcurementView.as_view(), name='procurement'),
+    path('inventory/low-stock/', LowStockView.as_view(), name='inventory-low-stock'),
 ] + router.urls
@@ -1,12 +1,17 @@
-from rest_framework import mixins, permissions, viewsets
+from rest_framework import mixins, permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 from apps.accounts.permissions import KitchenAccess
+from apps.foods.costing import reprice_ingredients
 
 from .models import Ingredient
-from .serializers import IngredientSerializer
+from .pricing import apply_price_list
+from .reorder import refresh_reorder_points
+from .serializers import IngredientPriceListSerializer, IngredientSerializer
 
 
 class IngredientManagementViewSet(
@@ -82,6 +87,29 @@ class IngredientManagementViewSet(
     def partial_update(self, request, *args, **kwargs):
         return super().partial_update(request, *args, **kwargs)
 
+    @action(detail=False, methods=['post'], url_path='bulk-prices')
+    @swagger_auto_schema(
+        operation_summary="Bulk update ingredient prices",
+        operation_description="Apply a price list (ingredient code → unit_price) as CSV or JSON, in the body or as an uploaded file. The whole list is validated first and applied in one statement; the response lists the foods whose recipe cost moved by more than threshold percent. Requires kitchen manager access.",
+        request_body=IngredientPriceListSerializer,
+        responses={
+            200: openapi.Response(description='{updated, unchanged, foods: [{id, title, previous_cost, cost, change_percent}]}'),
+            400: 'Validation error',
+        },
+    )
+    def bulk_prices(self, request):
+        serializer = IngredientPriceListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = apply_price_list(serializer.validated_data['prices'], serializer.validated_data['threshold'])
+        return Response(result, status=status.HTTP_200_OK)
+
+    def perform_update(self, serializer):
+        # The price and unit feed the cost of the foods using it, the warning
+        # amount and unit its reorder point
+        ingredient = serializer.save()
+        reprice_ingredients([ingredient.id])
+        refresh_reorder_points([ingredient.id])
+
     @swagger_auto_schema(
         operation_summary="Delete ingredient",
         operation_description="Delete an ingredient record. Requires kitchen manager access.",
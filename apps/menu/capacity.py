@@ -0,0 +1,99 @@
+"""
+رزرو ظرفیت برنامه‌های غذایی
+Atomic capacity reservation for MenuPlan rows, shared by token issuance.
+"""
+from django.db import connection, transaction
+
+from .models import MenuPlan
+
+
+class CapacityError(Exception):
+    """
+    Raised when a (food, meal_type) demand cannot be reserved.
+    available is None when no MenuPlan exists for the requested food/meal.
+    """
+
+    def __init__(self, food_id, meal_type, requested, available=None):
+        self.food_id = food_id
+        self.meal_type = meal_type
+        self.requested = requested
+        self.available = available
+        super().__init__(
+            f'food={food_id} meal_type={meal_type} requested={requested} available={available}'
+        )
+
+
+def _gregorian(value):
+    """jDateField values may come back as jdatetime.date"""
+    if hasattr(value, 'togregorian'):
+        return value.togregorian()
+    return value
+
+
+def reserve_capacity(plan_date, demands):
+    """
+    Decrease MenuPlan capacity for all demands of one date in a single
+    conditional UPDATE ... WHERE capacity >= n RETURNING statement.
+
+    demands: iterable of (food_id, meal_type, count); repeated keys are summed.
+    Returns {(food_id, meal_type): (menu_plan_id, remaining_capacity)}.
+    Raises CapacityError (and rolls back every decrement) on the first shortfall.
+    """
+    requested = {}
+    for food_id, meal_type, count in demands:
+        key = (food_id, meal_type)
+        requested[key] = requested.get(key, 0) + count
+    if not requested:
+        return {}
+
+    plan_date = _gregorian(plan_date)
+    table = connection.ops.quote_name(MenuPlan._meta.db_table)
+    values_sql = ', '.join(['(%s, %s, %s)'] * len(requested))
+    params = []
+    for (food_id, meal_type), count in requested.items():
+        params.extend([food_id, meal_type, count])
+    params.append(plan_date)
+
+    # The outer "capacity >= requested" is re-checked by PostgreSQL against the
+    # latest row version when a concurrent issuer updated it first, so two
+    # transactions can never both take the last portions.
+    sql = f"""
+        UPDATE {table} AS mp
+        SET capacity = mp.capacity - v.requested, updated_at = NOW()
+        FROM (VALUES {values_sql}) AS v(food_id, meal_type, requested)
+        WHERE mp.id = (
+            SELECT p.id FROM {table} AS p
+            WHERE p.food_id = v.food_id
+              AND p.date = %s
+              AND p.meal_type = v.meal_type
+              AND p.capacity >= v.requested
+            ORDER BY p.id
+            LIMIT 1
+        )
+        AND mp.capacity >= v.requested
+        RETURNING mp.id, mp.food_id, mp.meal_type, mp.capacity
+    """
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        reserved = {
+            (food_id, meal_type): (plan_id, capacity)
+            for plan_id, food_id, meal_type, capacity in rows
+        }
+        for key, count in requested.items():
+            if key not in reserved:
+                # Only the failure path pays for this lookup
+                food_id, meal_type = key
+                available = (
+                    MenuPlan.objects
+                    .filter(food_id=food_id, date=plan_date, meal_type=meal_type)
+                    .order_by('-capacity')
+                    .values_list('capacity', flat=True)
+                    .first()
+                )
+                raise CapacityError(food_id, meal_type, count, available)
+
+    return reserved
@@ -0,0 +1,90 @@
+from datetime import date
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from apps.foods.models import Food
+from apps.menu.capacity import CapacityError, reserve_capacity
+from apps.menu.models import MenuPlan
+
+
+class Command(BaseCommand):
+    help = (
+        'Fires parallel capacity reservations at one MenuPlan and verifies nothing is oversold. The '
+        'reservations run in waves over --workers threads, each holding one database connection, so '
+        'the default stays below PostgreSQL\'s default max_connections of 100.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Number of parallel reservations')
+        parser.add_argument('--capacity', type=int, default=150, help='Initial MenuPlan capacity')
+        parser.add_argument('--count', type=int, default=1, help='Portions requested per reservation')
+        parser.add_argument('--workers', type=int, default=50, help='Parallel threads (database connections)')
+
+    def handle(self, *args, **options):
+        requests = options['requests']
+        capacity = options['capacity']
+        count = options['count']
+
+        food = Food.objects.create(
+            title='bench capacity',
+            category='hazrati',
+            subcategory='needy',
+            meal_types=['lunch'],
+            preparation_time=0,
+            unit_price=0,
+        )
+        plan = MenuPlan.objects.create(date=date.today(), food=food, meal_type='lunch', capacity=capacity)
+
+        workers = max(1, min(options['workers'], requests))
+        barrier = threading.Barrier(workers)
+        results = {'reserved': 0, 'rejected': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def reserve():
+            try:
+                with transaction.atomic():
+                    reserve_capacity(plan.date, [(food.id, 'lunch', count)])
+                return 'reserved'
+            except CapacityError:
+                return 'rejected'
+            except Exception as e:
+                self.stderr.write(str(e))
+                return 'errors'
+
+        def work(share):
+            # Every worker starts its first reservation together, then goes on with the next wave
+            outcomes = []
+            try:
+                barrier.wait()
+                outcomes = [reserve() for _ in range(share)]
+            finally:
+                connection.close()
+            with lock:
+                for outcome in outcomes:
+                    results[outcome] += 1
+
+        shares = [requests // workers + (i < requests % workers) for i in range(workers)]
+        threads = [threading.Thread(target=work, args=(share,)) for share in shares]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        plan.refresh_from_db()
+        sold = results['reserved'] * count
+        food.delete()
+
+        self.stdout.write(
+            f"requests={requests} workers={workers} reserved={results['reserved']} rejected={results['rejected']} "
+            f"errors={results['errors']} remaining={plan.capacity} elapsed={elapsed:.3f}s"
+        )
+        if results['errors']:
+            raise CommandError(f"{results['errors']} reservations failed with unexpected errors")
+        if sold > capacity or plan.capacity != capacity - sold or plan.capacity < 0:
+            raise CommandError(f'Oversold: capacity={capacity} sold={sold} remaining={plan.capacity}')
+        self.stdout.write(self.style.SUCCESS('No oversell detected'))
@@ -0,0 +1,166 @@
+from datetime import date, timedelta
+import re
+
+import jdatetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Max, Sum
+
+from apps.foods.models import Food
+from apps.ingredients.models import Ingredient, InventoryStockUpdate, MaterialConsumption
+from apps.menu.models import MenuPlan
+from apps.tokens.models import Token
+
+
+# Indexes whose effect is measured: dropped for the "before" plans
+BENCH_INDEXES = {
+    MenuPlan: ['menuplan_food_date_meal_idx', 'menuplan_date_meal_idx'],
+    Token: ['token_date_updated_idx', 'token_pending_date_idx'],
+    InventoryStockUpdate: ['stockupdate_ingr_latest_idx'],
+    MaterialConsumption: ['consumption_ingr_plan_idx'],
+}
+
+_EXECUTION_TIME = re.compile(r'Execution Time: ([\d.]+) ms')
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+class Command(BaseCommand):
+    help = (
+        'Shows the query plans of the hot lookups with and without their composite/partial '
+        'indexes on a synthetic dataset. Everything runs in one transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tokens', type=int, default=6000000, help='Synthetic tokens')
+        parser.add_argument('--plans', type=int, default=2000000, help='Synthetic menu plans')
+        parser.add_argument('--stock-updates', type=int, default=1000000, help='Synthetic stock inspections')
+        parser.add_argument('--consumptions', type=int, default=1000000, help='Synthetic material consumptions')
+        parser.add_argument('--foods', type=int, default=500, help='Synthetic foods')
+        parser.add_argument('--ingredients', type=int, default=2000, help='Synthetic ingredients')
+        parser.add_argument('--days', type=int, default=730, help='Days the tokens and plans are spread over')
+        parser.add_argument('--timings-only', action='store_true', help='Print the timings without the plans')
+
+    def handle(self, *args, **options):
+        if options['consumptions'] > options['plans'] * options['ingredients']:
+            raise CommandError('--consumptions cannot exceed plans x ingredients')
+        with transaction.atomic():
+            self._populate(options)
+            before = self._explain_all(drop=True)
+            after = self._explain_all(drop=False)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"\n{'query':<28} {'before ms':>10} {'after ms':>10}")
+        for name, _ in self.queries:
+            self.stdout.write(f'{name:<28} {before[name][0]:>10.2f} {after[name][0]:>10.2f}')
+        if not options['timings_only']:
+            for name, _ in self.queries:
+                self.stdout.write(f'\n=== {name}\n--- before\n{before[name][1]}\n--- after\n{after[name][1]}')
+
+    def _insert(self, cursor, sql, params):
+        """Run an INSERT ... RETURNING id and return the (contiguous) id range"""
+        cursor.execute(f'WITH rows AS ({sql} RETURNING id) SELECT min(id), max(id), count(*) FROM rows', params)
+        low, high, count = cursor.fetchone()
+        if high - low + 1 != count:
+            raise CommandError('Synthetic ids are not contiguous; run the benchmark on an idle database')
+        return low, high
+
+    def _populate(self, options):
+        days = options['days']
+        today = date.today()
+        self.stdout.write('inserting synthetic rows...')
+        with connection.cursor() as cursor:
+            food_low, _ = self._insert(cursor, f"""
+                INSERT INTO {_table(Food)}
+                    (title, category, subcategory, meal_types, preparation_time, unit_price, created_at, updated_at)
+                SELECT 'bench food ' || i, 'normal', 'staff', ARRAY['breakfast', 'lunch', 'dinner'], 0, 0, NOW(), NOW()
+                FROM generate_series(1, %s) AS i
+            """, [options['foods']])
+            ingredient_low, _ = self._insert(cursor, f"""
+                INSERT INTO {_table(Ingredient)}
+                    (category, subcategory, name, unit, unit_price, code, warning_amount, created_at, updated_at)
+                SELECT 'normal', 'staff', 'bench ingredient ' || i, 'kg', 1, 'IXB' || i, 0, NOW(), NOW()
+                FROM generate_series(1, %s) AS i
+            """, [options['ingredients']])
+            plan_low, _ = self._insert(cursor, f"""
+                INSERT INTO {_table(MenuPlan)}
+                    (date, food_id, meal_type, capacity, cook_status, created_at, updated_at)
+                SELECT %s::date - (i %% %s), %s + (i / %s) %% %s,
+                       (ARRAY['breakfast', 'lunch', 'dinner'])[1 + (i / (%s * %s)) %% 3],
+                       100, 'done', NOW(), NOW()
+                FROM generate_series(0, %s - 1) AS i
+            """, [today, days, food_low, days, options['foods'], days, options['foods'], options['plans']])
+            # Most tokens of past days are received; the partial index only covers pending ones
+            cursor.execute(f"""
+                INSERT INTO {_table(Token)}
+                    (token_code, customer_name, date, total_price, status, created_at, updated_at)
+                SELECT 'IXB' || lpad(i::text, 10, '0'), 'bench', %s::date - (i %% %s), 0,
+                       CASE WHEN i %% 7 = 0 THEN 'pending' ELSE 'received' END,
+                       NOW() - i * INTERVAL '1 second', NOW() - i * INTERVAL '1 second'
+                FROM generate_series(0, %s - 1) AS i
+            """, [today, days, options['tokens']])
+            cursor.execute(f"""
+                INSERT INTO {_table(InventoryStockUpdate)}
+                    (ingredient_id, actual_amount, inspection_date, created_at, updated_at)
+                SELECT %s + i %% %s, 10, %s::date - (i / %s), NOW(), NOW()
+                FROM generate_series(0, %s - 1) AS i
+            """, [ingredient_low, options['ingredients'], today, options['ingredients'], options['stock_updates']])
+            cursor.execute(f"""
+                INSERT INTO {_table(MaterialConsumption)}
+                    (menu_plan_id, ingredient_id, consumed_amount, unit, created_at, updated_at)
+                SELECT %s + (i / %s) %% %s, %s + i %% %s, 1, 'kg', NOW(), NOW()
+                FROM generate_series(0, %s - 1) AS i
+            """, [plan_low, options['ingredients'], options['plans'], ingredient_low, options['ingredients'],
+                  options['consumptions']])
+            for model in (Food, Ingredient, MenuPlan, Token, InventoryStockUpdate, MaterialConsumption):
+                cursor.execute(f'ANALYZE {_table(model)}')
+
+        probe_date = today - timedelta(days=days // 2)
+        food_id = food_low + 7
+        ingredient_id = ingredient_low + 7
+        # The querysets the endpoints build, with representative parameters
+        self.queries = [
+            ('menu plan lookup', MenuPlan.objects.filter(
+                food_id=food_id, date=probe_date, meal_type='breakfast',
+            ).order_by('id')[:1]),
+            ('menu plan list by date', MenuPlan.objects.filter(date=probe_date)[:20]),
+            ('mark received', Token.objects.filter(token_code='IXB0000000007', status='pending')),
+            ('manifest fingerprint', Token.objects.filter(date=probe_date).order_by().values('date').annotate(
+                last_update=Max('updated_at'), count=Count('id'),
+            )),
+            ('manifest pending tokens', Token.objects.filter(date=probe_date, status='pending').values_list(
+                'token_code', flat=True,
+            )),
+            ('last inspection', InventoryStockUpdate.objects.filter(
+                ingredient_id=ingredient_id, inspection_date__lte=today,
+            ).order_by('-inspection_date', '-created_at')[:1]),
+            ('consumption by ingredient', MaterialConsumption.objects.filter(
+                # jManager only accepts Jalali values for a lookup ending in __date
+                ingredient_id=ingredient_id, menu_plan__date__lte=jdatetime.date.fromgregorian(date=today),
+            ).order_by().values('ingredient').annotate(total=Sum('consumed_amount'))),
+        ]
+
+    def _explain_all(self, drop):
+        """{query name: (execution ms, plan text)}; drop=True plans without the bench indexes"""
+        results = {}
+        with transaction.atomic():
+            if drop:
+                with connection.schema_editor() as schema_editor:
+                    for model, names in BENCH_INDEXES.items():
+                        for index in model._meta.indexes:
+                            if index.name in names:
+                                schema_editor.remove_index(model, index)
+            with connection.cursor() as cursor:
+                for name, queryset in self.queries:
+                    sql, params = queryset.query.sql_with_params()
+                    # The first run warms the cache, the second one is reported
+                    for _ in range(2):
+                        cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql}', params)
+                        plan = '\n'.join(row[0] for row in cursor.fetchall())
+                    results[name] = (float(_EXECUTION_TIME.search(plan).group(1)), plan)
+            if drop:
+                transaction.set_rollback(True)
+        return results
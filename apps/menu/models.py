@@ -59,6 +59,12 @@ class MenuPlan(models.Model):
         verbose_name = 'برنامه غذایی'
         verbose_name_plural = 'برنامه‌های غذایی'
         ordering = ['-date', 'meal_type']
+        indexes = [
+            # Plan lookup of token and sale creation and the capacity reservation
+            models.Index(fields=['food', 'date', 'meal_type'], name='menuplan_food_date_meal_idx'),
+            # Menu list by date, in the default ordering
+            models.Index(fields=['-date', 'meal_type'], name='menuplan_date_meal_idx'),
+        ]
     
     
     def save(self, *args, **kwargs):
@@ -81,6 +87,7 @@ class MenuPlan(models.Model):
 
     def _create_material_consumptions(self):
         from apps.ingredients.models import MaterialConsumption
+        from apps.ingredients.reorder import refresh_reorder_points
         from apps.foods.models import FoodIngredient
 
         # جلوگیری از دوباره ثبت شدن
@@ -103,12 +110,14 @@ class MenuPlan(models.Model):
                     menu_plan=self,
                     ingredient=fi.ingredient,
                     consumed_amount=total_amount,
-                    unit=fi.ingredient.unit,
+                    # In the recipe's unit; stock conversion goes through apps.ingredients.units
+                    unit=fi.unit or fi.ingredient.unit,
                     created_by=None,
                 )
             )
 
         MaterialConsumption.objects.bulk_create(consumptions)
+        refresh_reorder_points([consumption.ingredient_id for consumption in consumptions])
 
     def __str__(self) -> str:
         return f"{self.food.title} ({self.date})"
@@ -5,6 +5,7 @@ from decimal import Decimal
 
 from .models import MenuPlan
 from apps.ingredients.models import CATEGORY_TYPE_CHOICES, SUBCATEGORY_CHOICES
+from apps.ingredients.units import UnitConversionError, convert
 
 
 class JalaliDateField(serializers.Field):
@@ -108,8 +109,16 @@ class MenuPlanSerializer(serializers.ModelSerializer):
         food_ingredients = obj.food.ingredients.all()
         
         for food_ingredient in food_ingredients:
-            # محاسبه مقدار مورد نیاز: مقدار برای هر سرو × ظرفیت
+            # محاسبه مقدار مورد نیاز: مقدار برای هر سرو × ظرفیت، به واحد ماده اولیه
             required_amount = Decimal(str(food_ingredient.amount_per_serving)) * Decimal(str(obj.capacity))
+            conversion_error = None
+            try:
+                required_amount = str(convert(required_amount, food_ingredient.unit, food_ingredient.ingredient))
+            except UnitConversionError as e:
+                # Recipes saved before the ingredient's unit changed: the
+                # amount is unknown in the ingredient's unit, so say why
+                required_amount = None
+                conversion_error = str(e)
             
             ingredients_data.append({
                 'ingredient_id': food_ingredient.ingredient.id,
@@ -117,8 +126,10 @@ class MenuPlanSerializer(serializers.ModelSerializer):
                 'ingredient_code': food_ingredient.ingredient.code,
                 'ingredient_unit': food_ingredient.ingredient.unit,
                 'amount_per_serving': str(food_ingredient.amount_per_serving),
+                'amount_per_serving_unit': food_ingredient.unit or food_ingredient.ingredient.unit,
                 'capacity': obj.capacity,
-                'required_amount': str(required_amount),
+                'required_amount': required_amount,
+                'conversion_error': conversion_error,
             })
         
         return ingredients_data
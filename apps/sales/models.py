@@ -9,6 +9,7 @@ class DirectSale(models.Model):
     objects = jmodels.jManager()
     sale_code = models.CharField(
         max_length=150,
+        unique=True,
         verbose_name='کد فروش',
         validators=[MinLengthValidator(2)],
         blank=True,
@@ -41,6 +42,10 @@ class DirectSale(models.Model):
         verbose_name = 'فروش مستقیم'
         verbose_name_plural = 'فروش‌های مستقیم'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination (see core.pagination)
+            models.Index(fields=['created_at', 'id'], name='directsale_created_id_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"{self.sale_code} - {self.customer_name}"
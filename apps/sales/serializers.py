@@ -1,8 +1,6 @@
 from rest_framework import serializers
 from datetime import date
 import jdatetime
-import secrets
-import string
 from django.db import transaction
 from drf_yasg.utils import swagger_serializer_method
 from drf_yasg import openapi
@@ -11,6 +9,10 @@ from .models import DirectSale, DirectSaleItem
 from apps.foods.models import Food, MEAL_TYPE_CHOICES
 from apps.ingredients.models import NORMAL_SUBCATEGORY_CHOICES, SUBCATEGORY_CHOICES
 from apps.menu.models import MenuPlan
+from apps.tokens.codes import CodeAllocator
+
+
+sale_codes = CodeAllocator(DirectSale, 'sale', 'sale_code')
 
 
 class JalaliDateField(serializers.Field):
@@ -79,6 +81,26 @@ class DirectSaleItemReadSerializer(serializers.ModelSerializer):
         fields = ['id', 'food', 'food_title', 'food_unit_price', 'meal_type', 'meal_type_label', 'count', 'created_at', 'updated_at']
         read_only_fields = ['id', 'meal_type_label', 'created_at', 'updated_at']
 
+    def to_representation(self, instance):
+        """
+        Flat fast path: items are rendered for every row of the sale lists,
+        so read the (prefetched) attributes directly instead of resolving each
+        field's source.
+        """
+        fields = self.fields
+        food = instance.food
+        return {
+            'id': instance.id,
+            'food': instance.food_id,
+            'food_title': food.title,
+            'food_unit_price': fields['food_unit_price'].to_representation(food.unit_price),
+            'meal_type': instance.meal_type,
+            'meal_type_label': instance.get_meal_type_display(),
+            'count': instance.count,
+            'created_at': fields['created_at'].to_representation(instance.created_at),
+            'updated_at': fields['updated_at'].to_representation(instance.updated_at),
+        }
+
 
 class DirectSaleCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating DirectSale with DirectSaleItems"""
@@ -162,29 +184,18 @@ class DirectSaleCreateSerializer(serializers.ModelSerializer):
         items = obj.items.all()
         return DirectSaleItemReadSerializer(items, many=True).data
     
-    def generate_sale_code(self):
-        """Generate a random sale code"""
-        # Generate 8-character alphanumeric code
-        alphabet = string.ascii_uppercase + string.digits
-        code = ''.join(secrets.choice(alphabet) for _ in range(8))
-        
-        # Check if code already exists, regenerate if needed
-        while DirectSale.objects.filter(sale_code=code).exists():
-            code = ''.join(secrets.choice(alphabet) for _ in range(8))
-        
-        return code
-    
     @transaction.atomic
     def create(self, validated_data):
         """Create DirectSale and DirectSaleItems together, and decrease MenuPlan capacity"""
         foods_data = validated_data.pop('foods')
         subcategory = validated_data.pop('subcategory')  # We don't store subcategory in DirectSale model
         
-        # Generate sale code
-        sale_code = self.generate_sale_code()
+        # Allocate id and sale code; ids whose code a legacy sale holds are skipped
+        sale_id, sale_code = sale_codes.allocate_one()
         
         # Create DirectSale
         direct_sale = DirectSale.objects.create(
+            id=sale_id,
             sale_code=sale_code,
             **validated_data
         )
@@ -0,0 +1,25 @@
+from datetime import date
+
+from rest_framework.test import APITestCase
+
+from core.testing import ItemListTestsMixin
+
+from .models import DirectSale, DirectSaleItem
+
+
+class DirectSaleListTest(ItemListTestsMixin, APITestCase):
+    url = '/api/sales/'
+    role = 'delivery_desk'
+
+    @classmethod
+    def create_rows(cls, foods):
+        sales = [
+            DirectSale.objects.create(sale_code=f'DS-{i}', customer_name=f'مشتری {i}', date=date.today())
+            for i in range(cls.ROWS)
+        ]
+        DirectSaleItem.objects.bulk_create([
+            DirectSaleItem(direct_sale=sale, food=food, meal_type=('lunch', 'dinner')[j % 2], count=i + j + 1)
+            for i, sale in enumerate(sales)
+            for j, food in enumerate(foods)
+        ])
+        return sales
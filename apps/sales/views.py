@@ -1,3 +1,4 @@
+from django.db.models import Prefetch
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -16,8 +17,19 @@ class DirectSaleViewSet(viewsets.ModelViewSet):
     """
     queryset = DirectSale.objects.all()
     permission_classes = [DeliveryDeskAccess]
+    # ?pagination=cursor switches the list to keyset pagination
+    cursor_ordering = ('-created_at', '-id')
     http_method_names = ['get', 'post', 'delete', 'head', 'options']
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            # Items and their foods in two queries for the whole page
+            queryset = queryset.prefetch_related(
+                Prefetch('items', queryset=DirectSaleItem.objects.select_related('food'))
+            )
+        return queryset
+
     def get_serializer_class(self):
         if self.action == 'create':
             return DirectSaleCreateSerializer
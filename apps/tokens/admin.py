@@ -1,6 +1,7 @@
 from django.contrib import admin
+from django.db import transaction
 
-from .models import Token, TokenItem
+from .models import Token, TokenDeletion, TokenItem, TokenImageJob, TokenReceiptBatch
 
 
 class TokenItemInline(admin.TabularInline):
@@ -13,13 +14,19 @@ class TokenItemInline(admin.TabularInline):
 
 @admin.register(Token)
 class TokenAdmin(admin.ModelAdmin):
-    list_display = ('token_code', 'customer_name', 'date', 'status', 'total_price', 'created_at', 'updated_at')
+    list_display = ('token_code', 'customer_name', 'date', 'status', 'total_price', 'received_at', 'created_at', 'updated_at')
     list_filter = ('date', 'status')
     search_fields = ('token_code', 'customer_name', 'phone')
     inlines = (TokenItemInline,)
     ordering = ('-date',)
     readonly_fields = ('created_at', 'updated_at')
 
+    def delete_queryset(self, request, queryset):
+        # Bulk deletes skip Token.delete; record them for manifest deltas
+        with transaction.atomic():
+            TokenDeletion.record(queryset.values_list('token_code', 'date'))
+            super().delete_queryset(request, queryset)
+
 
 @admin.register(TokenItem)
 class TokenItemAdmin(admin.ModelAdmin):
@@ -27,3 +34,18 @@ class TokenItemAdmin(admin.ModelAdmin):
     search_fields = ('token__token_code', 'food__title')
     autocomplete_fields = ('token', 'food')
     readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(TokenImageJob)
+class TokenImageJobAdmin(admin.ModelAdmin):
+    list_display = ('token', 'attempts', 'available_at', 'created_at')
+    search_fields = ('token__token_code',)
+    raw_id_fields = ('token',)
+    readonly_fields = ('created_at',)
+
+
+@admin.register(TokenReceiptBatch)
+class TokenReceiptBatchAdmin(admin.ModelAdmin):
+    list_display = ('idempotency_key', 'created_by', 'created_at')
+    search_fields = ('idempotency_key',)
+    readonly_fields = ('results', 'created_at')
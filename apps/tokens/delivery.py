@@ -0,0 +1,127 @@
+"""
+تحویل توکن در میز تحویل
+Marking tokens as received with conditional UPDATEs, so a double scan can
+never deliver the same token twice.
+"""
+from django.db import connection, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.utils import timezone
+
+from .models import Token, TokenItem, TokenReceiptBatch
+
+
+def _token_table():
+    return connection.ops.quote_name(Token._meta.db_table)
+
+
+def prefetch_items(tokens):
+    """Load items (with their food) of already fetched tokens in one query"""
+    prefetch_related_objects(
+        tokens,
+        Prefetch('items', queryset=TokenItem.objects.select_related('food')),
+    )
+    return tokens
+
+
+def mark_received(token_code):
+    """
+    Flip one pending token to received.
+
+    Returns (token, 'received') when this call delivered it, (None,
+    'already_received') when it had been delivered before, or (None,
+    'unknown') when no token has this code. The status check and the update
+    are one statement, so of two concurrent scans exactly one wins.
+    """
+    tokens = list(Token.objects.raw(
+        f"""
+        UPDATE {_token_table()}
+        SET status = 'received', received_at = NOW(), updated_at = NOW()
+        WHERE token_code = %s AND status = 'pending'
+        RETURNING *
+        """,
+        [token_code],
+    ))
+    if tokens:
+        return prefetch_items(tokens)[0], 'received'
+
+    # Only failed scans pay for this lookup; a token never goes back to pending
+    if Token.objects.filter(token_code=token_code).exists():
+        return None, 'already_received'
+    return None, 'unknown'
+
+
+def mark_received_batch(scans):
+    """
+    Apply many (token_code, scanned_at) scans in one statement.
+
+    Each pending token takes the time of its earliest scan; every other scan
+    of the batch is reported as already received. Returns one
+    {'token_code', 'result'} per scan, in input order, with result one of
+    'received', 'already_received' or 'unknown'.
+    """
+    if not scans:
+        return []
+    codes = [code for code, _ in scans]
+    scanned = [scanned_at or timezone.now() for _, scanned_at in scans]
+    table = _token_table()
+
+    # The final SELECT sees the snapshot from before the UPDATE, so "exists"
+    # comes from the join and "received" only from the UPDATE's RETURNING
+    sql = f"""
+        WITH scans AS (
+            SELECT code, scanned_at, position,
+                   ROW_NUMBER() OVER (PARTITION BY code ORDER BY scanned_at, position) AS nth
+            FROM unnest(%s::varchar[], %s::timestamptz[]) WITH ORDINALITY AS s(code, scanned_at, position)
+        ),
+        delivered AS (
+            UPDATE {table} AS t
+            SET status = 'received', received_at = s.scanned_at, updated_at = NOW()
+            FROM scans AS s
+            WHERE t.token_code = s.code AND s.nth = 1 AND t.status = 'pending'
+            RETURNING t.token_code
+        )
+        SELECT s.code,
+               CASE
+                   WHEN d.token_code IS NOT NULL AND s.nth = 1 THEN 'received'
+                   WHEN t.id IS NOT NULL THEN 'already_received'
+                   ELSE 'unknown'
+               END
+        FROM scans AS s
+        LEFT JOIN delivered AS d ON d.token_code = s.code
+        LEFT JOIN {table} AS t ON t.token_code = s.code
+        ORDER BY s.position
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [codes, scanned])
+        return [{'token_code': code, 'result': result} for code, result in cursor.fetchall()]
+
+
+def receive_batch(idempotency_key, scans, user=None):
+    """
+    Apply a scanner upload once per idempotency key.
+
+    The key is claimed before the tokens are touched; a concurrent upload
+    with the same key waits on the unique index and then reads the first
+    upload's results. Returns (results, replayed).
+    """
+    table = connection.ops.quote_name(TokenReceiptBatch._meta.db_table)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (idempotency_key, results, created_by_id, created_at)
+                VALUES (%s, '[]', %s, NOW())
+                ON CONFLICT (idempotency_key) DO NOTHING
+                RETURNING id
+                """,
+                [idempotency_key, user.pk if user else None],
+            )
+            claimed = cursor.fetchone()
+        if claimed is None:
+            # This key was seen before: answer with the stored results
+            batch = TokenReceiptBatch.objects.get(idempotency_key=idempotency_key)
+            return batch.results, True
+
+        results = mark_received_batch(scans)
+        TokenReceiptBatch.objects.filter(pk=claimed[0]).update(results=results)
+    return results, False
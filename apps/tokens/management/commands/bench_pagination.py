@@ -0,0 +1,80 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.accounts.models import User
+from apps.tokens.models import Token
+from apps.tokens.views import TokenViewSet
+
+
+BENCH_PREFIX = 'PGB'
+
+
+class Command(BaseCommand):
+    help = 'Compares page-number and keyset pagination latency of the token list at deep pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=300000, help='Synthetic tokens to insert')
+        parser.add_argument('--pages', type=int, nargs='+', default=[1, 100, 1000, 10000], help='Pages to time')
+        parser.add_argument('--repeat', type=int, default=5, help='Requests per measurement (best is reported)')
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic tokens')
+
+    def handle(self, *args, **options):
+        table = connection.ops.quote_name(Token._meta.db_table)
+        self.stdout.write(f"inserting {options['rows']} synthetic tokens...")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table}
+                    (token_code, customer_name, date, total_price, status, created_at, updated_at)
+                SELECT %s || lpad(i::text, 9, '0'), 'bench', CURRENT_DATE, 0, 'pending',
+                       NOW() - i * INTERVAL '1 second', NOW()
+                FROM generate_series(1, %s) AS i
+                """,
+                [BENCH_PREFIX, options['rows']],
+            )
+            cursor.execute(f'ANALYZE {table}')
+
+        try:
+            self._run(options)
+        finally:
+            if not options['keep']:
+                # Synthetic rows have no items or jobs, so skip the ORM cascade
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DELETE FROM {table} WHERE token_code LIKE %s', [BENCH_PREFIX + '%'])
+
+    def _run(self, options):
+        user = User.objects.filter(is_central=True).first() or User.objects.create(
+            username='bench_pagination', is_central=True
+        )
+        factory = APIRequestFactory()
+        view = TokenViewSet.as_view({'get': 'list'})
+
+        def timed(params):
+            best = None
+            for _ in range(options['repeat']):
+                request = factory.get('/api/tokens/', params)
+                force_authenticate(request, user=user)
+                started = time.perf_counter()
+                response = view(request)
+                elapsed = time.perf_counter() - started
+                assert response.status_code == 200, response.data
+                best = elapsed if best is None else min(best, elapsed)
+            return best * 1000
+
+        page_size = 20
+        self.stdout.write(f"{'page':>8} {'page-number ms':>16} {'keyset ms':>12}")
+        for page in options['pages']:
+            offset = (page - 1) * page_size
+            params = {'pagination': 'cursor'}
+            if offset:
+                # Cursor of the last row on the previous page, as a client would hold it
+                previous = Token.objects.order_by('-created_at', '-id')[offset - 1]
+                paginator = TokenViewSet.pagination_class()
+                paginator.field = Token._meta.get_field('created_at')
+                params = {'cursor': paginator._encode_cursor(previous)}
+            self.stdout.write(
+                f'{page:>8} {timed({"page": page}):>16.1f} {timed(params):>12.1f}'
+            )
@@ -0,0 +1,51 @@
+from datetime import date
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.tokens.signing import InvalidPayload, sign_payload, signing_key, verify_payload
+
+
+class Command(BaseCommand):
+    help = 'Measures offline verifications per second of signed token QR payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000, help='Number of verifications')
+        parser.add_argument('--tokens', type=int, default=1000, help='Distinct payloads to cycle through')
+        parser.add_argument('--items', type=int, default=3, help='Items per token')
+
+    def handle(self, *args, **options):
+        key = signing_key(settings.TOKEN_SIGNING_KEY)
+        meal_types = ['breakfast', 'lunch', 'dinner']
+        payloads = [
+            sign_payload(
+                key,
+                token_id,
+                f'BENCH{token_id:03d}'[-8:],
+                date.today(),
+                [(random.randint(1, 500), random.choice(meal_types), random.randint(1, 5)) for _ in range(options['items'])],
+            )
+            for token_id in range(1, options['tokens'] + 1)
+        ]
+
+        # A tampered payload must be rejected
+        tampered = payloads[0][:-1] + ('0' if payloads[0][-1] != '0' else '1')
+        try:
+            verify_payload(key, tampered)
+            self.stderr.write(self.style.ERROR('tampered payload was accepted'))
+            return
+        except InvalidPayload:
+            pass
+
+        count = options['count']
+        started = time.perf_counter()
+        for i in range(count):
+            verify_payload(key, payloads[i % len(payloads)])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f'payload length={len(payloads[0])} chars, verifications={count}, '
+            f'elapsed={elapsed:.3f}s, rate={count / elapsed:,.0f}/s'
+        )
@@ -0,0 +1,55 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+
+from apps.tokens.models import Token, TokenImageJob
+
+
+def _render_chunk(token_ids, force):
+    """Runs in a pool process with its own database connection"""
+    connections.close_all()
+    rendered = 0
+    for token in Token.objects.filter(id__in=token_ids).prefetch_related('items'):
+        token.render_images(force=force)
+        rendered += 1
+    # Anything still queued for these tokens is done now
+    TokenImageJob.objects.filter(token_id__in=token_ids).delete()
+    connections.close_all()
+    return rendered
+
+
+class Command(BaseCommand):
+    help = 'Backfills or re-renders token barcode/QR images in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-render tokens that already have images')
+        parser.add_argument('--date', help='Only tokens of this Gregorian date (YYYY-MM-DD)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Process pool size')
+        parser.add_argument('--chunk', type=int, default=200, help='Tokens per pool task')
+
+    def handle(self, *args, **options):
+        tokens = Token.objects.all()
+        if options['date']:
+            tokens = tokens.filter(date=options['date'])
+        if not options['force']:
+            tokens = tokens.filter(
+                Q(barcode_image='') | Q(barcode_image__isnull=True)
+                | Q(qrcode_image='') | Q(qrcode_image__isnull=True)
+            )
+
+        token_ids = list(tokens.order_by('id').values_list('id', flat=True))
+        chunk = options['chunk']
+        chunks = [token_ids[i:i + chunk] for i in range(0, len(token_ids), chunk)]
+        self.stdout.write(f'Rendering {len(token_ids)} tokens in {len(chunks)} chunks')
+
+        # Forked workers must not share the parent's connection
+        connections.close_all()
+        rendered = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for count in pool.map(_render_chunk, chunks, [options['force']] * len(chunks)):
+                rendered += count
+
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} tokens'))
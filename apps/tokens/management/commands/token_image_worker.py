@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.tokens.models import TokenImageJob
+
+
+class Command(BaseCommand):
+    help = 'Processes the token barcode/QR rendering queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=50, help='Jobs claimed per poll')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+
+    def handle(self, *args, **options):
+        batch = options['batch']
+        self.stdout.write('Token image worker started')
+
+        while True:
+            close_old_connections()
+            jobs = TokenImageJob.claim(batch)
+            for job in jobs:
+                if not job.run():
+                    self.stderr.write(f'Rendering token {job.token_id} failed (attempt {job.attempts + 1})')
+
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
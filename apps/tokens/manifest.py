@@ -0,0 +1,153 @@
+"""
+مانیفست روزانه توکن‌ها برای میز تحویل
+Compact binary manifest of a day's tokens, so a delivery desk can keep
+validating scans while the network is down.
+
+Layout (big-endian):
+
+    header    b'TKMF' | version:1 | flags:1 | date (days since 2000-01-01):2
+              | generated_at (unix ms):8 | since (unix ms, 0 = full):8
+              | record count:4 | code width:1
+    records   code (ASCII, NUL padded to code width) | status:1 | portions:2
+    bloom     (flags & FLAG_BLOOM) bits:4 | hashes:1 | bit array
+
+Records are sorted by the bytes of the code, so desks can binary search
+the fixed-width records. A full manifest holds only pending tokens; a
+delta (since > 0) holds every token of the day changed after since, with
+status 0 = pending, 1 = received, to be upserted by code. A delta cannot
+list deleted tokens, so when a token of the date was deleted after since
+(see TokenDeletion) the full manifest is returned instead, with since = 0
+in its header: desks replace their copy. Bloom bit i of
+code c is set for i in range(hashes) at (h1 + i * h2) % bits, where h1 and
+h2 are the two big-endian 64-bit halves of blake2b(c, digest_size=16).
+"""
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+import hashlib
+import math
+import struct
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum, Value
+from django.db.models.functions import Coalesce, Collate
+from django.utils import timezone
+
+from .models import Token, TokenDeletion
+
+
+MANIFEST_VERSION = 1
+FLAG_BLOOM = 1
+EPOCH = date(2000, 1, 1)
+
+STATUS_CODES = {'pending': 0, 'received': 1}
+
+# Delta windows overlap by this much so rows committed late are not missed;
+# records are upserts, so repeating one is harmless
+DELTA_OVERLAP = timedelta(seconds=60)
+CACHE_TIMEOUT = 60 * 60 * 24
+
+_HEADER = struct.Struct('>4sBBHQQIB')
+_RECORD_TAIL = struct.Struct('>BH')
+
+
+def _unix_ms(value):
+    return int(value.timestamp() * 1000)
+
+
+def _changed_after(since):
+    """Start of the window a delta since a unix ms timestamp covers"""
+    return datetime.fromtimestamp(since / 1000, tz=dt_timezone.utc) - DELTA_OVERLAP
+
+
+def bloom_filter(codes, error_rate):
+    """(bits, hashes, bit array) of a Bloom filter over the codes"""
+    count = max(len(codes), 1)
+    bits = max(8, math.ceil(-count * math.log(error_rate) / math.log(2) ** 2))
+    bits += -bits % 8
+    hashes = max(1, round(bits / count * math.log(2)))
+    array = bytearray(bits // 8)
+    for code in codes:
+        digest = hashlib.blake2b(code, digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big')
+        for i in range(hashes):
+            bit = (h1 + i * h2) % bits
+            array[bit >> 3] |= 1 << (bit & 7)
+    return bits, hashes, bytes(array)
+
+
+def manifest_fingerprint(token_date):
+    """Changes whenever a token of the date is issued, updated or deleted"""
+    state = Token.objects.filter(date=token_date).aggregate(
+        last_update=Max('updated_at'),
+        count=Count('id'),
+    )
+    last_update = state['last_update']
+    return f"{token_date.isoformat()}:{state['count']}:{_unix_ms(last_update) if last_update else 0}"
+
+
+def build_manifest(token_date, since=None, bloom_error_rate=None):
+    """
+    Encode the manifest of a date, or the delta since a unix ms timestamp,
+    from one streaming query ordered by the code's bytes.
+    """
+    generated_at = timezone.now()
+    queryset = Token.objects.filter(date=token_date)
+    if since:
+        queryset = queryset.filter(updated_at__gt=_changed_after(since))
+    else:
+        queryset = queryset.filter(status='pending')
+    rows = (
+        queryset
+        .annotate(portions=Coalesce(Sum('items__count'), Value(0)))
+        .order_by(Collate('token_code', 'C'))
+        .values_list('token_code', 'status', 'portions')
+        .iterator(chunk_size=2000)
+    )
+
+    codes = []
+    tails = []
+    for code, status, portions in rows:
+        codes.append(code.encode('ascii'))
+        tails.append(_RECORD_TAIL.pack(STATUS_CODES.get(status, 0), min(portions, 0xFFFF)))
+
+    width = max((len(code) for code in codes), default=0)
+    flags = FLAG_BLOOM if bloom_error_rate else 0
+    parts = [_HEADER.pack(
+        b'TKMF',
+        MANIFEST_VERSION,
+        flags,
+        (token_date - EPOCH).days,
+        _unix_ms(generated_at),
+        since or 0,
+        len(codes),
+        width,
+    )]
+    parts += [code.ljust(width, b'\0') + tail for code, tail in zip(codes, tails)]
+    if bloom_error_rate:
+        bits, hashes, array = bloom_filter(codes, bloom_error_rate)
+        parts += [struct.pack('>IB', bits, hashes), array]
+    return b''.join(parts)
+
+
+def get_manifest(token_date, since=None, bloom_error_rate=None, if_none_match=''):
+    """
+    (manifest bytes, ETag); the bytes are None when if_none_match already
+    holds the ETag. Full manifests are cached per date until a token of that
+    date changes; deltas are small and built per request, and a delta over
+    a deletion is served as the full manifest.
+    """
+    if since and TokenDeletion.deleted_after(token_date, _changed_after(since)):
+        since = None
+    fingerprint = manifest_fingerprint(token_date)
+    etag_source = f'{fingerprint}:{since or 0}:{bloom_error_rate or 0}'
+    etag = '"%s"' % hashlib.sha1(etag_source.encode()).hexdigest()
+    if etag in if_none_match:
+        return None, etag
+    if since:
+        return build_manifest(token_date, since, bloom_error_rate), etag
+
+    key = f'token-manifest:v{MANIFEST_VERSION}:{etag_source}'
+    data = cache.get(key)
+    if data is None:
+        data = build_manifest(token_date, bloom_error_rate=bloom_error_rate)
+        cache.set(key, data, CACHE_TIMEOUT)
+    return data, etag
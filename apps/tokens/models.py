@@ -1,15 +1,35 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
 from django.core.validators import MinLengthValidator, MinValueValidator
 from django_jalali.db import models as jmodels
 
 import os
-from io import BytesIO
-from django.core.files import File
-import barcode
-from barcode.writer import ImageWriter
-import qrcode
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.urls import reverse
 
 from apps.foods.models import Food
+from .rendering import render_barcode, render_qrcode
+from .signing import sign_payload, signing_key
+
+
+def token_qr_data(token_id, token_code, token_date, items):
+    """
+    QR text of a token: a signed payload of its id, code, date and
+    (food_id, meal_type, count) items with TOKEN_SIGNED_QR, otherwise the code.
+    Tokens that do not fit the payload layout get the code as well, which
+    desks look up online as they do without signed payloads.
+    """
+    if not settings.TOKEN_SIGNED_QR:
+        return token_code
+    if hasattr(token_date, 'togregorian'):
+        token_date = token_date.togregorian()
+    try:
+        return sign_payload(signing_key(settings.TOKEN_SIGNING_KEY), token_id, token_code, token_date, items)
+    except ValueError:
+        return token_code
 
 
 STATUS_CHOICES = [
@@ -22,6 +42,7 @@ class Token(models.Model):
     objects = jmodels.jManager()
     token_code = models.CharField(
         max_length=150,
+        unique=True,
         verbose_name='توکن',
         validators=[MinLengthValidator(2)],
     )
@@ -51,6 +72,7 @@ class Token(models.Model):
         validators=[MinValueValidator(0)],
         default=0,
     )
+    # Stored copies are optional; see TOKEN_STORE_IMAGES and rendering.py
     barcode_image = models.ImageField(
         upload_to='barcodes/',   
         blank=True,
@@ -70,34 +92,78 @@ class Token(models.Model):
         default='pending',
         verbose_name='وضعیت',
     )
+    received_at = jmodels.jDateTimeField(blank=True, null=True, verbose_name='زمان دریافت')
     created_at = jmodels.jDateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
     updated_at = jmodels.jDateTimeField(auto_now=True, verbose_name='تاریخ به‌روزرسانی')
     def save(self, *args, **kwargs):
-        # اول ذخیره اصلی برای داشتن ID و token_code
+        is_new = self._state.adding
         super().save(*args, **kwargs)
 
+        # Barcode/QR rendering is queued for the image worker instead of
+        # running in the request; the URLs resolve once the worker is done
+        if is_new and settings.TOKEN_STORE_IMAGES and not (self.barcode_image and self.qrcode_image):
+            enqueue_token_images([self.pk])
+
+    @property
+    def barcode_image_name(self):
+        return f"barcodes/{self.token_code}_barcode.png"
+
+    @property
+    def qrcode_image_name(self):
+        return f"qrcodes/{self.token_code}_qrcode.png"
+
+    def qr_data(self):
+        """Text encoded in the token's QR code"""
+        if not settings.TOKEN_SIGNED_QR:
+            return self.token_code
+        # Sorted here rather than with order_by so prefetched items are used
+        items = sorted(self.items.all(), key=lambda item: item.id)
+        return token_qr_data(
+            self.pk, self.token_code, self.date,
+            [(item.food_id, item.meal_type, item.count) for item in items],
+        )
+
+    def image_url(self, field_name, fmt=None):
+        """
+        Stored image URL if there is one. Otherwise the on-demand rendering
+        endpoint in fmt (default TOKEN_IMAGE_FORMAT), or with TOKEN_STORE_IMAGES
+        the URL the worker will store it under.
+        """
+        image = getattr(self, field_name)
+        if image:
+            return image.url
+        if not self.token_code:
+            return None
+        if settings.TOKEN_STORE_IMAGES:
+            return image.storage.url(getattr(self, f'{field_name}_name'))
+        kind = field_name.replace('_image', '')
+        fmt = fmt or settings.TOKEN_IMAGE_FORMAT
+        return reverse('token-image', kwargs={'code': self.token_code, 'kind': kind, 'fmt': fmt})
+
+    def render_images(self, force=False):
+        """Render missing barcode/QR images and store them with one UPDATE"""
         updated = False
 
+        if force:
+            # Re-render under the same deterministic names
+            for image in (self.barcode_image, self.qrcode_image):
+                if image:
+                    image.delete(save=False)
+
         if self.token_code:
             # --- Generate Barcode ---
             if not self.barcode_image:
-                CODE128 = barcode.get_barcode_class('code128')
-                code = CODE128(self.token_code, writer=ImageWriter())
-                buffer = BytesIO()
-                code.write(buffer)
-                buffer.seek(0)  # مهم
                 filename = f"{self.token_code}_barcode.png"
-                self.barcode_image.save(filename, File(buffer), save=False)
+                # Drop leftovers so the stored name matches barcode_image_name
+                self.barcode_image.storage.delete(self.barcode_image_name)
+                self.barcode_image.save(filename, ContentFile(render_barcode(self.token_code)), save=False)
                 updated = True
 
             # --- Generate QR Code ---
             if not self.qrcode_image:
-                qr_img = qrcode.make(self.token_code)
-                qr_buffer = BytesIO()
-                qr_img.save(qr_buffer, format='PNG')
-                qr_buffer.seek(0)
                 filename = f"{self.token_code}_qrcode.png"
-                self.qrcode_image.save(filename, File(qr_buffer), save=False)
+                self.qrcode_image.storage.delete(self.qrcode_image_name)
+                self.qrcode_image.save(filename, ContentFile(render_qrcode(self.qr_data())), save=False)
                 updated = True
 
         if updated:
@@ -108,13 +174,25 @@ class Token(models.Model):
         verbose_name = 'توکن'
         verbose_name_plural = 'توکن‌ها'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination (see core.pagination)
+            models.Index(fields=['created_at', 'id'], name='token_created_id_idx'),
+            # Manifest fingerprint (max updated_at of a date) and deltas
+            models.Index(fields=['date', 'updated_at'], name='token_date_updated_idx'),
+            # Pending tokens of a date: full manifests and the delivery desks;
+            # received tokens pile up and never need this index
+            models.Index(
+                fields=['date'],
+                condition=models.Q(status='pending'),
+                name='token_pending_date_idx',
+            ),
+        ]
 
-    def __str__(self) -> str:
-        return f"{self.token_code} - {self.customer_name}"
-    class Meta:
-        verbose_name = 'توکن'
-        verbose_name_plural = 'توکن‌ها'
-        ordering = ['-created_at']
+    def delete(self, *args, **kwargs):
+        # Recorded for manifest deltas, which only see rows that still exist
+        with transaction.atomic():
+            TokenDeletion.record([(self.token_code, self.date)])
+            return super().delete(*args, **kwargs)
 
     def __str__(self) -> str:
         return f"{self.token_code} - {self.customer_name}"
@@ -152,6 +230,153 @@ class TokenItem(models.Model):
         verbose_name = 'آیتم توکن'
         verbose_name_plural = 'اقلام توکن'
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='tokenitem_created_id_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"{self.token.token_code} - {self.food.title}"
+
+
+class TokenDeletion(models.Model):
+    """
+    توکن حذف شده
+    Code and date of a deleted token. Manifest deltas are built from
+    updated_at and cannot report a deleted row, so a delta whose window saw
+    a deletion of its date is answered with a full manifest (see
+    manifest.py). Rows are kept for RETENTION; older deltas always get a
+    full manifest.
+    """
+    objects = jmodels.jManager()
+    token_code = models.CharField(max_length=150, verbose_name='توکن')
+    date = jmodels.jDateField(verbose_name='تاریخ')
+    deleted_at = jmodels.jDateTimeField(default=timezone.now, verbose_name='زمان حذف')
+
+    RETENTION = timedelta(days=7)
+
+    class Meta:
+        verbose_name = 'توکن حذف شده'
+        verbose_name_plural = 'توکن‌های حذف شده'
+        ordering = ['-deleted_at']
+        indexes = [
+            models.Index(fields=['date', 'deleted_at'], name='tokendeletion_date_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.token_code} ({self.date})"
+
+    @classmethod
+    def record(cls, tokens):
+        """Record (token_code, date) pairs as deleted now, pruning expired rows"""
+        now = timezone.now()
+        cls.objects.filter(deleted_at__lt=now - cls.RETENTION).delete()
+        cls.objects.bulk_create([
+            cls(token_code=token_code, date=token_date, deleted_at=now)
+            for token_code, token_date in tokens
+        ])
+
+    @classmethod
+    def deleted_after(cls, token_date, moment):
+        """Whether a token of token_date may have been deleted after moment"""
+        if moment < timezone.now() - cls.RETENTION:
+            return True
+        return cls.objects.filter(date=token_date, deleted_at__gt=moment).exists()
+
+
+class TokenImageJob(models.Model):
+    """
+    صف تولید بارکد و QR
+    DB-backed queue of tokens waiting for barcode/QR rendering.
+    Claimed rows are leased until available_at; finished jobs are deleted.
+    """
+    objects = jmodels.jManager()
+    token = models.OneToOneField(
+        Token,
+        on_delete=models.CASCADE,
+        related_name='image_job',
+        verbose_name='توکن',
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name='تعداد تلاش')
+    last_error = models.TextField(blank=True, null=True, verbose_name='آخرین خطا')
+    available_at = jmodels.jDateTimeField(default=timezone.now, verbose_name='زمان آماده پردازش')
+    created_at = jmodels.jDateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
+
+    MAX_ATTEMPTS = 5
+    LEASE = timedelta(minutes=5)
+
+    class Meta:
+        verbose_name = 'صف تصویر توکن'
+        verbose_name_plural = 'صف تصاویر توکن'
+        ordering = ['available_at', 'id']
+
+    def __str__(self) -> str:
+        return f"{self.token_id} ({self.attempts})"
+
+    @classmethod
+    def claim(cls, limit):
+        """Lease up to limit due jobs; concurrent workers skip each other's rows"""
+        now = timezone.now()
+        with transaction.atomic():
+            jobs = list(
+                cls.objects
+                .select_for_update(skip_locked=True)
+                .filter(available_at__lte=now, attempts__lt=cls.MAX_ATTEMPTS)
+                .order_by('available_at', 'id')[:limit]
+            )
+            if jobs:
+                cls.objects.filter(id__in=[job.id for job in jobs]).update(
+                    attempts=F('attempts') + 1,
+                    available_at=now + cls.LEASE,
+                )
+        return jobs
+
+    def run(self):
+        """Render the token images; failures are retried with backoff"""
+        try:
+            token = Token.objects.get(pk=self.token_id)
+            token.render_images()
+        except Exception as e:
+            attempts = self.attempts + 1
+            TokenImageJob.objects.filter(pk=self.pk).update(
+                last_error=str(e),
+                available_at=timezone.now() + timedelta(seconds=30 * 2 ** attempts),
+            )
+            return False
+        self.delete()
+        return True
+
+
+class TokenReceiptBatch(models.Model):
+    """
+    دسته اسکن‌های میز تحویل
+    One uploaded batch of delivery desk scans, keyed by the client's
+    idempotency key. The per-code results are stored so a replayed upload
+    gets the original answer without touching the tokens again.
+    """
+    objects = jmodels.jManager()
+    idempotency_key = models.CharField(max_length=100, unique=True, verbose_name='کلید یکتایی')
+    results = models.JSONField(default=list, verbose_name='نتایج')
+    created_by = models.ForeignKey(
+        'accounts.User',
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='token_receipt_batches',
+        verbose_name='ثبت شده توسط',
+    )
+    created_at = jmodels.jDateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
+
+    class Meta:
+        verbose_name = 'دسته دریافت توکن'
+        verbose_name_plural = 'دسته‌های دریافت توکن'
+        ordering = ['-created_at']
+
+    def __str__(self) -> str:
+        return self.idempotency_key
+
+
+def enqueue_token_images(token_ids):
+    """Queue tokens for the image worker (idempotent)"""
+    TokenImageJob.objects.bulk_create(
+        [TokenImageJob(token_id=token_id) for token_id in token_ids],
+        ignore_conflicts=True,
+    )
@@ -0,0 +1,216 @@
+"""
+برگه چاپ گروهی توکن‌ها
+Streaming N-up PDF print sheet for batches of tokens.
+
+Barcodes and QR codes are drawn as vector rectangles from the same module
+matrices the image renderers use, so nothing is rasterized or written to
+disk. The document is produced page by page by a generator: only one page
+of content and the object offsets are held in memory, whatever the number
+of tokens.
+"""
+import zlib
+
+from .rendering import barcode_modules, module_runs, qrcode_modules
+
+
+PAGE_WIDTH = 595.28   # A4 in points
+PAGE_HEIGHT = 841.89
+PAGE_MARGIN = 24
+CELL_PADDING = 8
+
+DEFAULT_COLUMNS = 2
+DEFAULT_ROWS = 5
+
+# Fixed object numbers; pages are numbered from FIRST_PAGE_OBJECT upwards
+CATALOG_OBJECT = 1
+PAGES_OBJECT = 2
+FONT_OBJECT = 3
+FIRST_PAGE_OBJECT = 4
+
+
+def _number(value):
+    """Compact decimal for PDF operands"""
+    return f'{value:.2f}'.rstrip('0').rstrip('.')
+
+
+# Persian and Arabic-Indic digits and separators as their ASCII forms
+_LATIN = str.maketrans('۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩٫٬،؛', '01234567890123456789.,,;')
+
+
+def _latin(value):
+    """
+    value as the standard Helvetica font can draw it: digits in ASCII and
+    other characters outside Latin-1 (Persian words) dropped, since the
+    sheet embeds no font with Arabic-script glyphs.
+    """
+    value = str(value).translate(_LATIN).encode('latin-1', 'ignore').decode('latin-1')
+    return ' '.join(value.split())
+
+
+def _text(value):
+    """PDF literal string of _latin(value)"""
+    value = _latin(value)
+    return '(%s)' % value.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _modules(rows, x, y, module_width, module_height):
+    """
+    Rectangles for the dark modules; rows run top to bottom from (x, y).
+    Drawn in module units under a scaling matrix so coordinates stay integers.
+    """
+    ops = [
+        'q',
+        f'{_number(module_width)} 0 0 {_number(module_height)} {_number(x)} {_number(y - len(rows) * module_height)} cm',
+    ]
+    bottom = len(rows) - 1
+    for index, row in enumerate(rows):
+        ops += [f'{start} {bottom - index} {length} 1 re' for start, length in module_runs(row)]
+    ops += ['f', 'Q']
+    return ops
+
+
+def _cell(token, x, y, width, height):
+    """Drawing operators for one ticket whose top-left corner is (x, y)"""
+    ops = [
+        '0.8 G 0.5 w',
+        f'{_number(x)} {_number(y - height)} {_number(width)} {_number(height)} re S',
+        '0 g',
+    ]
+    inner_x = x + CELL_PADDING
+    inner_y = y - CELL_PADDING
+    inner_height = height - 2 * CELL_PADDING
+
+    # QR code on the left, as large as the cell allows
+    qr_rows = qrcode_modules(token.get('qr_data') or token['token_code'])
+    qr_size = min(inner_height, (width - 2 * CELL_PADDING) * 0.45)
+    qr_module = qr_size / len(qr_rows)
+    ops += _modules(qr_rows, inner_x, inner_y, qr_module, qr_module)
+
+    # Barcode and the ticket details to its right
+    text_x = inner_x + qr_size + CELL_PADDING
+    text_width = x + width - CELL_PADDING - text_x
+    bar_row = barcode_modules(token['token_code'])
+    bar_height = min(inner_height * 0.45, 48)
+    ops += _modules([bar_row], text_x, inner_y, text_width / len(bar_row), bar_height)
+
+    lines = [
+        ('F1 12', token['token_code']),
+        ('F1 9', token['date']),
+    ]
+    # A delivery time in words alone has nothing drawable left; skip the line
+    if _latin(token.get('deliver_time') or ''):
+        lines.append(('F1 9', token['deliver_time']))
+    lines.append(('F1 9', f"{token['item_count']} items - {token['total_price']}"))
+
+    baseline = inner_y - bar_height - 14
+    for font, value in lines:
+        ops.append(f'BT /{font} Tf {_number(text_x)} {_number(baseline)} Td {_text(value)} Tj ET')
+        baseline -= 12
+    return ops
+
+
+def _page(tokens, columns, rows):
+    cell_width = (PAGE_WIDTH - 2 * PAGE_MARGIN) / columns
+    cell_height = (PAGE_HEIGHT - 2 * PAGE_MARGIN) / rows
+    ops = []
+    for index, token in enumerate(tokens):
+        row, column = divmod(index, columns)
+        ops += _cell(
+            token,
+            PAGE_MARGIN + column * cell_width,
+            PAGE_HEIGHT - PAGE_MARGIN - row * cell_height,
+            cell_width,
+            cell_height,
+        )
+    return '\n'.join(ops).encode('latin-1')
+
+
+def _object(number, body):
+    return b'%d 0 obj\n' % number + body + b'\nendobj\n'
+
+
+def _stream_object(number, data):
+    data = zlib.compress(data, 6)
+    header = b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(data)
+    return _object(number, header + data + b'\nendstream')
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def print_sheet(tokens, columns=DEFAULT_COLUMNS, rows=DEFAULT_ROWS):
+    """
+    Yield a PDF with columns x rows tickets per A4 page.
+
+    tokens: iterable of dicts with token_code, date, deliver_time, item_count,
+    total_price and optionally qr_data (QR text, defaults to the code),
+    consumed lazily (e.g. a QuerySet.iterator()).
+    """
+    offsets = {}
+    position = 0
+
+    def emit(number, data):
+        nonlocal position
+        if number is not None:
+            offsets[number] = position
+        position += len(data)
+        return data
+
+    yield emit(None, b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    yield emit(FONT_OBJECT, _object(
+        FONT_OBJECT,
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+    ))
+
+    page_objects = []
+    media_box = f'[0 0 {_number(PAGE_WIDTH)} {_number(PAGE_HEIGHT)}]'.encode()
+    number = FIRST_PAGE_OBJECT
+    for page_tokens in _chunks(tokens, columns * rows):
+        content_number, page_number = number, number + 1
+        number += 2
+        yield emit(content_number, _stream_object(content_number, _page(page_tokens, columns, rows)))
+        yield emit(page_number, _object(
+            page_number,
+            b'<< /Type /Page /Parent %d 0 R /MediaBox %s /Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>'
+            % (PAGES_OBJECT, media_box, FONT_OBJECT, content_number),
+        ))
+        page_objects.append(page_number)
+
+    if not page_objects:
+        # A PDF needs at least one page
+        content_number, page_number = number, number + 1
+        number += 2
+        yield emit(content_number, _stream_object(content_number, b''))
+        yield emit(page_number, _object(
+            page_number,
+            b'<< /Type /Page /Parent %d 0 R /MediaBox %s /Contents %d 0 R >>'
+            % (PAGES_OBJECT, media_box, content_number),
+        ))
+        page_objects.append(page_number)
+
+    kids = b' '.join(b'%d 0 R' % page for page in page_objects)
+    yield emit(PAGES_OBJECT, _object(
+        PAGES_OBJECT,
+        b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(page_objects)),
+    ))
+    yield emit(CATALOG_OBJECT, _object(
+        CATALOG_OBJECT,
+        b'<< /Type /Catalog /Pages %d 0 R >>' % PAGES_OBJECT,
+    ))
+
+    xref_position = position
+    xref = [b'xref\n0 %d\n' % number, b'0000000000 65535 f \n']
+    xref += [b'%010d 00000 n \n' % offsets[object_number] for object_number in range(1, number)]
+    yield b''.join(xref)
+    yield (
+        b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+        % (number, CATALOG_OBJECT, xref_position)
+    )
@@ -0,0 +1,171 @@
+"""
+تولید بارکد و QR توکن
+Barcode/QR rendering for tokens and the on-demand image cache.
+
+Both symbols are built as module matrices (python-barcode's Code128 and
+qrcode's matrix, neither needs Pillow) and written either as a 1-bit PNG or
+as a single-path SVG, a few hundred bytes per image.
+"""
+from functools import lru_cache
+import hashlib
+import struct
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+import barcode
+import qrcode
+
+
+# Bump when the output of a renderer changes so caches and ETags roll over
+RENDER_VERSION = 2
+
+IMAGE_KINDS = ('barcode', 'qrcode')
+IMAGE_FORMATS = ('png', 'svg')
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+BARCODE_MODULE_WIDTH = 2   # px per Code128 module
+BARCODE_HEIGHT = 80        # px
+BARCODE_QUIET_ZONE = 10    # modules on each side
+QRCODE_BOX_SIZE = 4        # px per QR module
+QRCODE_BORDER = 4          # modules
+
+
+def barcode_modules(code):
+    """Code128 modules as one row of booleans (True = bar), quiet zones included"""
+    pattern = barcode.get_barcode_class('code128')(code).build()[0]
+    quiet = [False] * BARCODE_QUIET_ZONE
+    return quiet + [bit == '1' for bit in pattern] + quiet
+
+
+def qrcode_modules(data):
+    """QR modules as rows of booleans (True = dark), border included"""
+    qr = qrcode.QRCode(border=QRCODE_BORDER)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def _pack_row(modules, scale):
+    """Scale a row of modules to pixels and pack it as a 1-bit PNG scanline"""
+    # In 1-bit grayscale 0 is black, so dark modules become '0'
+    bits = ''.join(('0' if dark else '1') * scale for dark in modules)
+    bits += '1' * (-len(bits) % 8)
+    return b'\x00' + int(bits, 2).to_bytes(len(bits) // 8, 'big')
+
+
+def png_1bit(rows, scale, row_height=None):
+    """Encode module rows as a 1-bit grayscale PNG without Pillow"""
+    row_height = row_height or scale
+    width = len(rows[0]) * scale
+    height = len(rows) * row_height
+    raw = b''.join(_pack_row(row, scale) * row_height for row in rows)
+    header = struct.pack('>IIBBBBB', width, height, 1, 0, 0, 0, 0)
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + _png_chunk(b'IHDR', header)
+        + _png_chunk(b'IDAT', zlib.compress(raw, 9))
+        + _png_chunk(b'IEND', b'')
+    )
+
+
+def module_runs(row):
+    """(start, length) of each run of dark modules in a row"""
+    x = 0
+    while x < len(row):
+        if row[x]:
+            start = x
+            while x < len(row) and row[x]:
+                x += 1
+            yield start, x - start
+        else:
+            x += 1
+
+
+def svg_path(rows, width, height, module_height=1):
+    """Dark module runs of each row as one SVG path in module units"""
+    commands = [
+        f'M{start} {y * module_height}h{length}v{module_height}h{-length}z'
+        for y, row in enumerate(rows)
+        for start, length in module_runs(row)
+    ]
+    columns = len(rows[0])
+    view_height = len(rows) * module_height
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {columns} {view_height}" shape-rendering="crispEdges">'
+        f'<rect width="{columns}" height="{view_height}" fill="#fff"/>'
+        f'<path d="{"".join(commands)}"/></svg>'
+    ).encode()
+
+
+def render_barcode(code, fmt='png'):
+    """Code128 barcode of the token code"""
+    modules = barcode_modules(code)
+    if fmt == 'svg':
+        module_height = BARCODE_HEIGHT // BARCODE_MODULE_WIDTH
+        return svg_path(
+            [modules],
+            len(modules) * BARCODE_MODULE_WIDTH,
+            BARCODE_HEIGHT,
+            module_height=module_height,
+        )
+    return png_1bit([modules], BARCODE_MODULE_WIDTH, row_height=BARCODE_HEIGHT)
+
+
+def render_qrcode(data, fmt='png'):
+    """QR code of the token's QR text (see Token.qr_data)"""
+    rows = qrcode_modules(data)
+    if fmt == 'svg':
+        size = len(rows) * QRCODE_BOX_SIZE
+        return svg_path(rows, size, size)
+    return png_1bit(rows, QRCODE_BOX_SIZE)
+
+
+RENDERERS = {
+    'barcode': render_barcode,
+    'qrcode': render_qrcode,
+}
+
+
+def image_key(kind, fmt, code):
+    key = f'v{RENDER_VERSION}:{kind}:{fmt}:{code}'
+    if kind == 'qrcode' and settings.TOKEN_SIGNED_QR:
+        # Signed QR codes depend on the signing key, so rotating it rolls them over
+        key += ':' + hashlib.sha1(settings.TOKEN_SIGNING_KEY.encode()).hexdigest()[:8]
+    return key
+
+
+def image_etag(kind, fmt, code):
+    """Strong ETag; rendering is deterministic so the key identifies the bytes"""
+    return '"%s"' % hashlib.sha1(image_key(kind, fmt, code).encode()).hexdigest()
+
+
+@lru_cache(maxsize=settings.TOKEN_IMAGE_MEMORY_CACHE_SIZE)
+def get_token_image(kind, fmt, code):
+    """
+    Rendered image bytes from the in-process LRU, then the bounded disk cache,
+    rendering on first request. Raises Token.DoesNotExist for unknown codes
+    (exceptions are not memoized).
+    """
+    from .models import Token
+
+    image_cache = caches['token_images']
+    key = image_key(kind, fmt, code)
+    data = image_cache.get(key)
+    if data is None:
+        token = Token.objects.filter(token_code=code).first()
+        if token is None:
+            raise Token.DoesNotExist(code)
+        data = RENDERERS[kind](token.qr_data() if kind == 'qrcode' else code, fmt)
+        image_cache.set(key, data, timeout=None)
+    return data
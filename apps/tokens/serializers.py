@@ -1,16 +1,21 @@
 from rest_framework import serializers
 from datetime import date
+import time
 import jdatetime
-import secrets
-import string
+from django.conf import settings
 from django.db import transaction
 from drf_yasg.utils import swagger_serializer_method
 from drf_yasg import openapi
 
-from .models import Token, TokenItem, STATUS_CHOICES
+from .codes import CodeAllocator
+from .delivery import mark_received, receive_batch
+from .models import Token, TokenItem, STATUS_CHOICES, enqueue_token_images
+from .printing import DEFAULT_COLUMNS, DEFAULT_ROWS
+from .rendering import IMAGE_FORMATS
+from .signing import InvalidPayload, signing_key, verify_payload
 from apps.foods.models import Food, MEAL_TYPE_CHOICES
 from apps.ingredients.models import HAZRATI_SUBCATEGORY_CHOICES, SUBCATEGORY_CHOICES
-from apps.menu.models import MenuPlan
+from apps.menu.capacity import CapacityError, reserve_capacity
 
 
 class JalaliDateField(serializers.Field):
@@ -53,6 +58,67 @@ class JalaliDateField(serializers.Field):
             raise serializers.ValidationError(f'فرمت تاریخ شمسی نامعتبر است. فرمت صحیح: YYYY-MM-DD (مثال: 1403-08-28)')
 
 
+token_codes = CodeAllocator(Token, 'token', 'token_code')
+
+
+def validate_token_food(food, subcategory):
+    """Validate that a food is hazrati and matches the selected subcategory"""
+    # All tokens are hazrati by default, so category is always 'hazrati'
+    if food.category != 'hazrati':
+        raise serializers.ValidationError({
+            'foods': f'غذای "{food.title}" از دسته‌بندی عادی است. همه توکن‌ها باید از دسته‌بندی حضرتی باشند.'
+        })
+
+    # Check subcategory match
+    if food.subcategory != subcategory:
+        subcategory_dict = dict(SUBCATEGORY_CHOICES)
+        food_subcategory_label = subcategory_dict.get(food.subcategory, food.subcategory)
+        selected_subcategory_label = subcategory_dict.get(subcategory, subcategory)
+        raise serializers.ValidationError({
+            'foods': f'غذای "{food.title}" از زیر دسته‌بندی {food_subcategory_label} است اما زیر دسته‌بندی انتخاب شده {selected_subcategory_label} است.'
+        })
+
+
+def resolve_meal_type(food, meal_type):
+    """Pick the meal type for a food item, validating it against food.meal_types"""
+    if meal_type is None:
+        # If meal_type not specified, check if food has only one meal_type
+        if not food.meal_types or len(food.meal_types) == 0:
+            raise serializers.ValidationError({
+                'foods': f'غذای "{food.title}" هیچ وعده غذایی تعریف نشده است.'
+            })
+        elif len(food.meal_types) == 1:
+            # Use the single meal_type
+            return food.meal_types[0]
+        # Food has multiple meal_types, meal_type must be specified
+        raise serializers.ValidationError({
+            'foods': f'غذای "{food.title}" برای چند وعده تعریف شده است. لطفاً وعده مورد نظر را مشخص کنید (meal_type).'
+        })
+
+    # Validate that the specified meal_type is valid for this food
+    if meal_type not in food.meal_types:
+        meal_type_dict = dict(MEAL_TYPE_CHOICES)
+        valid_meal_types = [meal_type_dict.get(mt, mt) for mt in food.meal_types]
+        raise serializers.ValidationError({
+            'foods': f'وعده غذایی "{meal_type_dict.get(meal_type, meal_type)}" برای غذای "{food.title}" معتبر نیست. وعده‌های معتبر: {", ".join(valid_meal_types)}'
+        })
+    return meal_type
+
+
+def capacity_error(error, foods_by_id, token_date):
+    """Convert a CapacityError into the serializer's oversell message"""
+    food = foods_by_id[error.food_id]
+    meal_type_dict = dict(MEAL_TYPE_CHOICES)
+    meal_type_label = meal_type_dict.get(error.meal_type, error.meal_type)
+    if error.available is None:
+        return serializers.ValidationError({
+            'foods': f'برنامه غذایی برای غذای "{food.title}" در تاریخ {token_date} و وعده {meal_type_label} یافت نشد.'
+        })
+    return serializers.ValidationError({
+        'foods': f'ظرفیت کافی برای غذای "{food.title}" در وعده {meal_type_label} وجود ندارد. ظرفیت موجود: {error.available}، درخواستی: {error.requested}'
+    })
+
+
 class FoodItemSerializer(serializers.Serializer):
     """Serializer for food items in token creation"""
     class Meta:
@@ -79,8 +145,53 @@ class TokenItemReadSerializer(serializers.ModelSerializer):
         fields = ['id', 'food', 'food_title', 'food_unit_price', 'meal_type', 'meal_type_label', 'count', 'created_at', 'updated_at']
         read_only_fields = ['id', 'meal_type_label', 'created_at', 'updated_at']
 
+    def to_representation(self, instance):
+        """
+        Flat fast path: items are rendered for every row of the token lists,
+        so read the (prefetched) attributes directly instead of resolving each
+        field's source.
+        """
+        fields = self.fields
+        food = instance.food
+        return {
+            'id': instance.id,
+            'food': instance.food_id,
+            'food_title': food.title,
+            'food_unit_price': fields['food_unit_price'].to_representation(food.unit_price),
+            'meal_type': instance.meal_type,
+            'meal_type_label': instance.get_meal_type_display(),
+            'count': instance.count,
+            'created_at': fields['created_at'].to_representation(instance.created_at),
+            'updated_at': fields['updated_at'].to_representation(instance.updated_at),
+        }
+
 
-class TokenCreateSerializer(serializers.ModelSerializer):
+class TokenImageUrlsMixin(serializers.Serializer):
+    """
+    Barcode/QR URLs. While the image worker has not rendered them yet the
+    URL the file will be stored under is returned. The on-demand format can
+    be chosen per request with ?image_format=png|svg.
+    """
+    barcode_image_url = serializers.SerializerMethodField()
+    qrcode_image_url = serializers.SerializerMethodField()
+
+    def image_format(self):
+        request = self.context.get('request')
+        fmt = request.query_params.get('image_format') if request else None
+        return fmt if fmt in IMAGE_FORMATS else None
+
+    def get_barcode_image_url(self, obj):
+        url = obj.image_url('barcode_image', self.image_format())
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request and url else url
+
+    def get_qrcode_image_url(self, obj):
+        url = obj.image_url('qrcode_image', self.image_format())
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request and url else url
+
+
+class TokenCreateSerializer(TokenImageUrlsMixin, serializers.ModelSerializer):
     """Serializer for creating Token with TokenItems"""
     date = JalaliDateField()
     subcategory = serializers.ChoiceField(
@@ -92,8 +203,6 @@ class TokenCreateSerializer(serializers.ModelSerializer):
     token_code = serializers.CharField(read_only=True)
     total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     items = serializers.SerializerMethodField()
-    barcode_image_url = serializers.SerializerMethodField()
-    qrcode_image_url = serializers.SerializerMethodField()
     class Meta:
         model = Token
         fields = [
@@ -118,18 +227,6 @@ class TokenCreateSerializer(serializers.ModelSerializer):
             'barcode_image_url', 'qrcode_image_url',
             'created_at', 'updated_at'
         ]
-    def get_barcode_image_url(self, obj):
-        if obj.barcode_image:
-            request = self.context.get('request')
-            return request.build_absolute_uri(obj.barcode_image.url) if request else obj.barcode_image.url
-        return None
-
-    def get_qrcode_image_url(self, obj):
-        if obj.qrcode_image:
-            request = self.context.get('request')
-            return request.build_absolute_uri(obj.qrcode_image.url) if request else obj.qrcode_image.url
-        return None
-    
     def to_representation(self, instance):
         """Remove foods from representation"""
         ret = super().to_representation(instance)
@@ -154,9 +251,6 @@ class TokenCreateSerializer(serializers.ModelSerializer):
             initial_data = getattr(self, 'initial_data', {})
             foods_data = initial_data.get('foods')
         
-        # All tokens are hazrati by default, so category is always 'hazrati'
-        category = 'hazrati'
-        
         if subcategory and foods_data:
             # Validate foods if they exist
             if isinstance(foods_data, list) and len(foods_data) > 0:
@@ -169,20 +263,7 @@ class TokenCreateSerializer(serializers.ModelSerializer):
                         food = food_item
                     
                     if food and hasattr(food, 'category') and hasattr(food, 'subcategory'):
-                        # Check category (must be hazrati)
-                        if food.category != category:
-                            raise serializers.ValidationError({
-                                'foods': f'غذای "{food.title}" از دسته‌بندی عادی است. همه توکن‌ها باید از دسته‌بندی حضرتی باشند.'
-                            })
-                        
-                        # Check subcategory match
-                        if food.subcategory != subcategory:
-                            subcategory_dict = dict(SUBCATEGORY_CHOICES)
-                            food_subcategory_label = subcategory_dict.get(food.subcategory, food.subcategory)
-                            selected_subcategory_label = subcategory_dict.get(subcategory, subcategory)
-                            raise serializers.ValidationError({
-                                'foods': f'غذای "{food.title}" از زیر دسته‌بندی {food_subcategory_label} است اما زیر دسته‌بندی انتخاب شده {selected_subcategory_label} است.'
-                            })
+                        validate_token_food(food, subcategory)
         
         # Always store foods in attrs so it's available in create
         attrs['foods'] = foods_data
@@ -195,116 +276,177 @@ class TokenCreateSerializer(serializers.ModelSerializer):
         items = obj.items.all()
         return TokenItemReadSerializer(items, many=True).data
     
-    def generate_token_code(self):
-        """Generate a random token code"""
-        # Generate 8-character alphanumeric code
-        alphabet = string.ascii_uppercase + string.digits
-        code = ''.join(secrets.choice(alphabet) for _ in range(8))
-        
-        # Check if code already exists, regenerate if needed
-        while Token.objects.filter(token_code=code).exists():
-            code = ''.join(secrets.choice(alphabet) for _ in range(8))
-        
-        return code
-    
     @transaction.atomic
     def create(self, validated_data):
         """Create Token and TokenItems together, and decrease MenuPlan capacity"""
         foods_data = validated_data.pop('foods')
         subcategory = validated_data.pop('subcategory')  # We don't store subcategory in Token model
-        
-        # Generate token code
-        token_code = self.generate_token_code()
-        
-        # Create Token
-        token = Token.objects.create(
-            token_code=token_code,
-            **validated_data
-        )
-        
-        # Calculate total price and create TokenItems
+        token_date = validated_data['date']
+
+        # Resolve meal types and total price before touching the database
         total_price = 0
+        lines = []
+        foods_by_id = {}
         for food_item in foods_data:
             food = food_item['food']
             count = food_item['count']
-            meal_type = food_item.get('meal_type')
-            
-            # Determine meal_type to use
-            if meal_type is None:
-                # If meal_type not specified, check if food has only one meal_type
-                if not food.meal_types or len(food.meal_types) == 0:
-                    raise serializers.ValidationError({
-                        'foods': f'غذای "{food.title}" هیچ وعده غذایی تعریف نشده است.'
-                    })
-                elif len(food.meal_types) == 1:
-                    # Use the single meal_type
-                    meal_type = food.meal_types[0]
-                else:
-                    # Food has multiple meal_types, meal_type must be specified
-                    raise serializers.ValidationError({
-                        'foods': f'غذای "{food.title}" برای چند وعده تعریف شده است. لطفاً وعده مورد نظر را مشخص کنید (meal_type).'
-                    })
-            else:
-                # Validate that the specified meal_type is valid for this food
-                if meal_type not in food.meal_types:
-                    meal_type_dict = dict(MEAL_TYPE_CHOICES)
-                    valid_meal_types = [meal_type_dict.get(mt, mt) for mt in food.meal_types]
-                    raise serializers.ValidationError({
-                        'foods': f'وعده غذایی "{meal_type_dict.get(meal_type, meal_type)}" برای غذای "{food.title}" معتبر نیست. وعده‌های معتبر: {", ".join(valid_meal_types)}'
-                    })
-            
-            # Calculate price for this item
-            item_price = food.unit_price * count
-            total_price += item_price
-            
-            # Decrease MenuPlan capacity first (before creating TokenItem)
-            # Find MenuPlan with matching food, date, and meal_type
-            menu_plan = MenuPlan.objects.filter(
-                food=food,
-                date=token.date,
-                meal_type=meal_type
-            ).first()
-            
-            if menu_plan:
-                # Check if there's enough capacity
-                if menu_plan.capacity < count:
-                    raise serializers.ValidationError({
-                        'foods': f'ظرفیت کافی برای غذای "{food.title}" در وعده {menu_plan.get_meal_type_display()} وجود ندارد. ظرفیت موجود: {menu_plan.capacity}، درخواستی: {count}'
-                    })
-                
-                # Decrease capacity
-                menu_plan.capacity -= count
-                menu_plan.save()
-            else:
-                # If no MenuPlan found, raise an error
-                meal_type_dict = dict(MEAL_TYPE_CHOICES)
-                raise serializers.ValidationError({
-                    'foods': f'برنامه غذایی برای غذای "{food.title}" در تاریخ {token.date} و وعده {meal_type_dict.get(meal_type, meal_type)} یافت نشد.'
-                })
-            
-            # Create TokenItem after capacity check
-            TokenItem.objects.create(
+            meal_type = resolve_meal_type(food, food_item.get('meal_type'))
+            total_price += food.unit_price * count
+            foods_by_id[food.id] = food
+            lines.append((food, meal_type, count))
+
+        # Reserve capacity for all items with one conditional UPDATE
+        try:
+            reserve_capacity(
+                token_date,
+                [(food.id, meal_type, count) for food, meal_type, count in lines],
+            )
+        except CapacityError as error:
+            raise capacity_error(error, foods_by_id, token_date)
+
+        # Create Token; id and code come from the allocator
+        token_id, token_code = token_codes.allocate_one()
+        token = Token.objects.create(
+            id=token_id,
+            token_code=token_code,
+            total_price=total_price,
+            **validated_data
+        )
+
+        TokenItem.objects.bulk_create([
+            TokenItem(
                 token=token,
                 food=food,
                 meal_type=meal_type,
                 count=count
             )
-        
-        # Update total price
-        token.total_price = total_price
-        token.save()
-        
+            for food, meal_type, count in lines
+        ])
+
         return token
     
 
 
-class TokenListSerializer(serializers.ModelSerializer):
+BULK_TOKEN_LIMIT = 5000
+
+
+class BulkFoodItemSerializer(serializers.Serializer):
+    """Food item in bulk issuance; foods are loaded once for the whole batch"""
+    food = serializers.IntegerField(min_value=1)
+    count = serializers.IntegerField(min_value=1)
+    meal_type = serializers.ChoiceField(
+        choices=MEAL_TYPE_CHOICES,
+        required=False,
+        allow_null=True,
+    )
+
+
+class BulkTokenEntrySerializer(serializers.Serializer):
+    """One customer in a bulk issuance batch"""
+    customer_name = serializers.CharField(max_length=150, min_length=2)
+    phone = serializers.CharField(max_length=150, min_length=2, required=False, allow_null=True)
+    deliver_time = serializers.CharField(max_length=150, required=False, allow_null=True, allow_blank=True)
+    foods = BulkFoodItemSerializer(many=True)
+
+    def validate_foods(self, value):
+        if not value:
+            raise serializers.ValidationError('حداقل یک غذا باید انتخاب شود.')
+        return value
+
+
+class TokenBulkCreateSerializer(serializers.Serializer):
+    """Issue many tokens of one date/subcategory (ceremonies, lottery) in one request"""
+    date = JalaliDateField()
+    subcategory = serializers.ChoiceField(choices=HAZRATI_SUBCATEGORY_CHOICES)
+    tokens = BulkTokenEntrySerializer(many=True)
+
+    def validate_tokens(self, value):
+        if not value:
+            raise serializers.ValidationError('حداقل یک توکن باید ارسال شود.')
+        if len(value) > BULK_TOKEN_LIMIT:
+            raise serializers.ValidationError(f'حداکثر {BULK_TOKEN_LIMIT} توکن در هر درخواست قابل صدور است.')
+        return value
+
+    def validate(self, attrs):
+        """Load and validate every distinct food of the batch once"""
+        subcategory = attrs['subcategory']
+        food_ids = {item['food'] for entry in attrs['tokens'] for item in entry['foods']}
+        foods_by_id = Food.objects.in_bulk(food_ids)
+
+        missing = food_ids - set(foods_by_id)
+        if missing:
+            raise serializers.ValidationError({
+                'tokens': f'غذا با شناسه {", ".join(str(food_id) for food_id in sorted(missing))} یافت نشد.'
+            })
+        for food in foods_by_id.values():
+            validate_token_food(food, subcategory)
+
+        attrs['foods_by_id'] = foods_by_id
+        return attrs
+
+    @transaction.atomic
+    def create(self, validated_data):
+        """Reserve capacity for the whole batch, then bulk insert tokens and items"""
+        token_date = validated_data['date']
+        foods_by_id = validated_data['foods_by_id']
+        entries = validated_data['tokens']
+
+        # Resolve meal types per item; capacity is reserved in aggregate below
+        demands = []
+        token_lines = []
+        for entry in entries:
+            total_price = 0
+            lines = []
+            for item in entry['foods']:
+                food = foods_by_id[item['food']]
+                meal_type = resolve_meal_type(food, item.get('meal_type'))
+                total_price += food.unit_price * item['count']
+                lines.append((food, meal_type, item['count']))
+                demands.append((food.id, meal_type, item['count']))
+            token_lines.append((total_price, lines))
+
+        try:
+            reserve_capacity(token_date, demands)
+        except CapacityError as error:
+            raise capacity_error(error, foods_by_id, token_date)
+
+        codes = token_codes.allocate(len(entries))
+        tokens = Token.objects.bulk_create([
+            Token(
+                id=token_id,
+                token_code=token_code,
+                date=token_date,
+                customer_name=entry['customer_name'],
+                phone=entry.get('phone'),
+                deliver_time=entry.get('deliver_time'),
+                total_price=total_price,
+            )
+            for (token_id, token_code), entry, (total_price, _) in zip(codes, entries, token_lines)
+        ])
+        TokenItem.objects.bulk_create([
+            TokenItem(token=token, food=food, meal_type=meal_type, count=count)
+            for token, (_, lines) in zip(tokens, token_lines)
+            for food, meal_type, count in lines
+        ])
+
+        # bulk_create skips Token.save, so queue the images explicitly
+        if settings.TOKEN_STORE_IMAGES:
+            enqueue_token_images([token.id for token in tokens])
+        return tokens
+
+
+class BulkTokenResultSerializer(TokenImageUrlsMixin, serializers.ModelSerializer):
+    """Compact representation returned by bulk issuance"""
+    class Meta:
+        model = Token
+        fields = ['id', 'token_code', 'customer_name', 'total_price', 'barcode_image_url', 'qrcode_image_url']
+
+
+class TokenListSerializer(TokenImageUrlsMixin, serializers.ModelSerializer):
     """Serializer for listing tokens"""
     date = JalaliDateField()
     items = serializers.SerializerMethodField()
     status_label = serializers.CharField(source='get_status_display', read_only=True)
-    barcode_image_url = serializers.SerializerMethodField()
-    qrcode_image_url = serializers.SerializerMethodField()
       
     class Meta:
         model = Token
@@ -321,6 +463,7 @@ class TokenListSerializer(serializers.ModelSerializer):
             'items',
             'barcode_image_url',
             'qrcode_image_url',
+            'received_at',
             'created_at',
             'updated_at',
         ]
@@ -328,7 +471,7 @@ class TokenListSerializer(serializers.ModelSerializer):
         read_only_fields = [
             'id', 'token_code', 'total_price', 'status', 
             'status_label', 'items', 'barcode_image_url', 'qrcode_image_url',
-            'created_at', 'updated_at'
+            'received_at', 'created_at', 'updated_at'
         ]    
     @swagger_serializer_method(serializer_or_field=TokenItemReadSerializer(many=True))
     def get_items(self, obj):
@@ -336,17 +479,51 @@ class TokenListSerializer(serializers.ModelSerializer):
         items = obj.items.all()
         return TokenItemReadSerializer(items, many=True).data
     
-    def get_barcode_image_url(self, obj):
-        if obj.barcode_image:
-            request = self.context.get('request')
-            return request.build_absolute_uri(obj.barcode_image.url) if request else obj.barcode_image.url
-        return None
 
-    def get_qrcode_image_url(self, obj):
-        if obj.qrcode_image:
-            request = self.context.get('request')
-            return request.build_absolute_uri(obj.qrcode_image.url) if request else obj.qrcode_image.url
-        return None
+class TokenPrintSheetQuerySerializer(serializers.Serializer):
+    """Query parameters of the batch print sheet"""
+    date = JalaliDateField(required=False)
+    ids = serializers.CharField(required=False, help_text='شناسه توکن‌ها با کاما جدا شده (مثال: 12,13,14)')
+    columns = serializers.IntegerField(min_value=1, max_value=4, default=DEFAULT_COLUMNS)
+    rows = serializers.IntegerField(min_value=1, max_value=10, default=DEFAULT_ROWS)
+
+    def validate_ids(self, value):
+        try:
+            return [int(token_id) for token_id in value.split(',') if token_id.strip()]
+        except ValueError:
+            raise serializers.ValidationError('شناسه توکن‌ها باید عدد و با کاما جدا شده باشند.')
+
+    def validate(self, attrs):
+        if not attrs.get('date') and not attrs.get('ids'):
+            raise serializers.ValidationError('حداقل یکی از پارامترهای date یا ids الزامی است.')
+        return attrs
+
+
+class TokenManifestQuerySerializer(serializers.Serializer):
+    """Query parameters of the offline delivery manifest"""
+    date = JalaliDateField()
+    since = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        help_text='generated_at مانیفست قبلی (unix ms) برای دریافت فقط تغییرات'
+    )
+    bloom = serializers.BooleanField(default=False, help_text='افزودن فیلتر Bloom کدها')
+    bloom_error_rate = serializers.FloatField(min_value=0.0001, max_value=0.5, default=0.01)
+
+    # Clock skew a desk may have; anything later is not a generated_at of ours
+    SINCE_SKEW_MS = 24 * 60 * 60 * 1000
+
+    def validate_date(self, value):
+        # JalaliDateField reads an empty value as None
+        if value is None:
+            raise serializers.ValidationError('تاریخ الزامی است.')
+        return value
+
+    def validate_since(self, value):
+        if value > time.time() * 1000 + self.SINCE_SKEW_MS:
+            raise serializers.ValidationError('مقدار since نمی‌تواند بعد از زمان فعلی باشد.')
+        return value
+
 
 class TokenStatusUpdateSerializer(serializers.Serializer):
     """Serializer for updating token status by token_code"""
@@ -355,32 +532,19 @@ class TokenStatusUpdateSerializer(serializers.Serializer):
         help_text='کد توکن'
     )
     
-    def validate_token_code(self, value):
-        """Validate that token exists"""
-        if not Token.objects.filter(token_code=value).exists():
-            raise serializers.ValidationError('توکن با این کد یافت نشد.')
-        return value
-    
-    def validate(self, attrs):
-        """Validate that token is not already received"""
-        token_code = attrs.get('token_code')
-        if token_code:
-            try:
-                token = Token.objects.get(token_code=token_code)
-                if token.status == 'received':
-                    raise serializers.ValidationError({
-                        'token_code': f'توکن با کد "{token_code}" قبلاً دریافت شده است.'
-                    })
-            except Token.DoesNotExist:
-                pass
-        return attrs
-    
     def update_status(self):
-        """Update token status to received"""
+        """
+        Update token status to received with one conditional UPDATE; the items
+        for the response are prefetched in a second query.
+        """
         token_code = self.validated_data['token_code']
-        token = Token.objects.get(token_code=token_code)
-        token.status = 'received'
-        token.save()
+        token, result = mark_received(token_code)
+        if result == 'unknown':
+            raise serializers.ValidationError({'token_code': ['توکن با این کد یافت نشد.']})
+        if result == 'already_received':
+            raise serializers.ValidationError({
+                'token_code': [f'توکن با کد "{token_code}" قبلاً دریافت شده است.']
+            })
         return token
     
     @swagger_serializer_method(serializer_or_field=TokenItemReadSerializer(many=True))
@@ -389,3 +553,90 @@ class TokenStatusUpdateSerializer(serializers.Serializer):
         items = obj.items.all()
         return TokenItemReadSerializer(items, many=True).data
 
+
+
+BATCH_RECEIVE_LIMIT = 10000
+
+RECEIVE_RESULT_CHOICES = [
+    ('received', 'دریافت شد'),
+    ('already_received', 'قبلاً دریافت شده'),
+    ('unknown', 'توکن یافت نشد'),
+]
+
+
+class TokenScanSerializer(serializers.Serializer):
+    """One buffered scan of a delivery desk scanner"""
+    token_code = serializers.CharField(max_length=150, help_text='کد توکن')
+    scanned_at = serializers.DateTimeField(
+        required=False,
+        allow_null=True,
+        help_text='زمان اسکن (در صورت عدم ارسال، زمان دریافت درخواست)'
+    )
+
+
+class TokenBatchReceiveSerializer(serializers.Serializer):
+    """Replay of buffered scans; the same idempotency_key is applied only once"""
+    idempotency_key = serializers.CharField(
+        max_length=100,
+        help_text='کلید یکتای این دسته که هنگام ارسال مجدد تکرار می‌شود'
+    )
+    scans = TokenScanSerializer(many=True)
+
+    def validate_scans(self, value):
+        if not value:
+            raise serializers.ValidationError('حداقل یک اسکن باید ارسال شود.')
+        if len(value) > BATCH_RECEIVE_LIMIT:
+            raise serializers.ValidationError(f'حداکثر {BATCH_RECEIVE_LIMIT} اسکن در هر درخواست مجاز است.')
+        return value
+
+    def save(self, user=None):
+        """Apply the scans once; returns (results, replayed)"""
+        scans = [(scan['token_code'], scan.get('scanned_at')) for scan in self.validated_data['scans']]
+        return receive_batch(self.validated_data['idempotency_key'], scans, user=user)
+
+
+class TokenReceiveResultSerializer(serializers.Serializer):
+    token_code = serializers.CharField()
+    result = serializers.ChoiceField(choices=RECEIVE_RESULT_CHOICES)
+
+
+class TokenBatchReceiveResultSerializer(serializers.Serializer):
+    """Response of the batch mark-received endpoint"""
+    replayed = serializers.BooleanField(help_text='این دسته قبلاً با همین کلید ثبت شده بود')
+    received = serializers.IntegerField()
+    already_received = serializers.IntegerField()
+    unknown = serializers.IntegerField()
+    results = TokenReceiveResultSerializer(many=True)
+
+
+class TokenVerifySerializer(serializers.Serializer):
+    """Signed QR payload scanned at the delivery desk"""
+    payload = serializers.CharField(max_length=2200, help_text='محتوای QR امضا شده توکن')
+
+    def validate_payload(self, value):
+        try:
+            return verify_payload(signing_key(settings.TOKEN_SIGNING_KEY), value.strip())
+        except InvalidPayload:
+            raise serializers.ValidationError('امضای QR توکن نامعتبر است.')
+
+    def to_representation(self, instance):
+        """Verified contents, with food titles and meal labels for display"""
+        signed = self.validated_data['payload']
+        foods = Food.objects.in_bulk({item.food_id for item in signed.items})
+        meal_type_dict = dict(MEAL_TYPE_CHOICES)
+        return {
+            'valid': True,
+            'token_id': signed.token_id,
+            'token_code': signed.token_code,
+            'date': JalaliDateField().to_representation(signed.date),
+            'items': [
+                {
+                    'food': item.food_id,
+                    'food_title': foods[item.food_id].title if item.food_id in foods else None,
+                    'meal_type': item.meal_type,
+                    'meal_type_label': meal_type_dict.get(item.meal_type, item.meal_type),
+                    'count': item.count,
+                }
+                for item in signed.items
+            ],
+        }
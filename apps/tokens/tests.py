@@ -0,0 +1,71 @@
+from datetime import date, timedelta
+
+from django.utils import timezone
+from rest_framework.test import APITestCase
+import jdatetime
+
+from apps.accounts.models import User
+from core.testing import ItemListTestsMixin
+
+from .manifest import _HEADER
+from .models import Token, TokenItem
+
+
+class TokenListTest(ItemListTestsMixin, APITestCase):
+    url = '/api/tokens/'
+    role = 'token_issuer'
+
+    @classmethod
+    def create_rows(cls, foods):
+        tokens = [
+            Token.objects.create(token_code=f'TK-{i}', customer_name=f'مشتری {i}', date=date.today())
+            for i in range(cls.ROWS)
+        ]
+        TokenItem.objects.bulk_create([
+            TokenItem(token=token, food=food, meal_type=('lunch', 'dinner')[j % 2], count=i + j + 1)
+            for i, token in enumerate(tokens)
+            for j, food in enumerate(foods)
+        ])
+        return tokens
+
+
+class TokenManifestTest(APITestCase):
+    """Manifest deltas fall back to the full manifest when a token was deleted"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='desk', roles=['delivery_desk'])
+        cls.tokens = [
+            Token.objects.create(token_code=f'MF-{i}', customer_name='مشتری', date=date.today())
+            for i in range(3)
+        ]
+        # Older than the overlap a delta window keeps
+        Token.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def _manifest(self, **params):
+        response = self.client.get('/api/tokens/manifest/', dict(params, date=str(jdatetime.date.today())))
+        self.assertEqual(response.status_code, 200)
+        # (generated_at, since, record count)
+        return _HEADER.unpack_from(response.content)[4:7]
+
+    def test_empty_date(self):
+        response = self.client.get('/api/tokens/manifest/', {'date': ''})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date', response.data)
+
+    def test_delta(self):
+        generated_at, since, count = self._manifest()
+        self.assertEqual((since, count), (0, 3))
+        self.tokens[0].status = 'received'
+        self.tokens[0].save()
+        _, since, count = self._manifest(since=generated_at)
+        self.assertEqual((since, count), (generated_at, 1))
+
+    def test_delta_after_delete(self):
+        generated_at, _, _ = self._manifest()
+        self.tokens[0].delete()
+        _, since, count = self._manifest(since=generated_at)
+        self.assertEqual((since, count), (0, 2))
@@ -1,12 +1,17 @@
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
 
-from .views import TokenViewSet
+from .views import TokenViewSet, TokenImageView
 
 router = DefaultRouter()
 router.register(r'', TokenViewSet, basename='token')
 
 urlpatterns = [
+    re_path(
+        r'^(?P<code>[A-Za-z0-9-]+)/(?P<kind>barcode|qrcode)\.(?P<fmt>png|svg)$',
+        TokenImageView.as_view(),
+        name='token-image',
+    ),
     path('', include(router.urls)),
 ]
 
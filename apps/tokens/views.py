@@ -1,12 +1,34 @@
-from rest_framework import viewsets, status
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db.models import Prefetch, Sum, Value
+from django.db.models.functions import Coalesce
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
 from apps.accounts.permissions import TokenIssuerAccess, DeliveryDeskAccess
-from .models import Token, TokenItem
-from .serializers import TokenCreateSerializer, TokenListSerializer, TokenStatusUpdateSerializer
+from .models import Token, TokenItem, token_qr_data
+from .manifest import get_manifest
+from .printing import print_sheet
+from .rendering import CONTENT_TYPES, get_token_image, image_etag
+from .serializers import (
+    JalaliDateField,
+    TokenCreateSerializer,
+    TokenListSerializer,
+    TokenStatusUpdateSerializer,
+    TokenBulkCreateSerializer,
+    BulkTokenResultSerializer,
+    TokenPrintSheetQuerySerializer,
+    TokenBatchReceiveSerializer,
+    TokenBatchReceiveResultSerializer,
+    TokenVerifySerializer,
+    TokenManifestQuerySerializer,
+)
 
 
 class TokenViewSet(viewsets.ModelViewSet):
@@ -16,11 +38,24 @@ class TokenViewSet(viewsets.ModelViewSet):
     """
     queryset = Token.objects.all()
     permission_classes = [TokenIssuerAccess]
+    # ?pagination=cursor switches the list to keyset pagination
+    cursor_ordering = ('-created_at', '-id')
     http_method_names = ['get', 'post', 'delete', 'head', 'options']
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            # Items and their foods in two queries for the whole page
+            queryset = queryset.prefetch_related(
+                Prefetch('items', queryset=TokenItem.objects.select_related('food'))
+            )
+        return queryset
+
     def get_serializer_class(self):
         if self.action == 'create':
             return TokenCreateSerializer
+        if self.action == 'bulk_create':
+            return TokenBulkCreateSerializer
         return TokenListSerializer
     
     @swagger_auto_schema(
@@ -39,9 +74,113 @@ class TokenViewSet(viewsets.ModelViewSet):
         token = serializer.save()
         
         # Return created token with items
-        response_serializer = TokenListSerializer(token)
+        response_serializer = TokenListSerializer(token, context={'request': request})
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
     
+    @action(detail=False, methods=['post'], url_path='bulk')
+    @swagger_auto_schema(
+        operation_summary="Bulk create tokens",
+        operation_description="Issue many tokens (e.g. ceremonies, lottery) of one date and subcategory in a single request. Capacity is reserved for the whole batch at once; barcode/QR images are rendered in the background. Requires token_issuer role.",
+        request_body=TokenBulkCreateSerializer,
+        responses={
+            201: BulkTokenResultSerializer(many=True),
+            400: 'Validation error'
+        }
+    )
+    def bulk_create(self, request):
+        """Create many tokens with items in one transaction"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        tokens = serializer.save()
+
+        response_serializer = BulkTokenResultSerializer(tokens, many=True, context={'request': request})
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], url_path='print-sheet')
+    @swagger_auto_schema(
+        operation_summary="Batch print sheet",
+        operation_description="Stream a multi-page A4 PDF with columns x rows tickets (barcode, QR code, date, delivery time) per page for the tokens of a date and/or a list of ids. Requires token_issuer role.",
+        query_serializer=TokenPrintSheetQuerySerializer,
+        responses={
+            200: openapi.Response(description='PDF document'),
+            400: 'Validation error'
+        }
+    )
+    def print_sheet(self, request):
+        """Stream an N-up PDF of many tokens without building it in memory"""
+        params = TokenPrintSheetQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        queryset = Token.objects.all()
+        if params.get('date'):
+            queryset = queryset.filter(date=params['date'])
+        if params.get('ids'):
+            queryset = queryset.filter(id__in=params['ids'])
+        fields = ['id', 'token_code', 'date', 'deliver_time', 'total_price', 'item_count']
+        queryset = queryset.order_by('id').annotate(item_count=Coalesce(Sum('items__count'), Value(0)))
+        if settings.TOKEN_SIGNED_QR:
+            # Items for the signed QR payloads, aggregated in the same query
+            queryset = queryset.annotate(
+                item_foods=ArrayAgg('items__food_id', ordering='items__id'),
+                item_meals=ArrayAgg('items__meal_type', ordering='items__id'),
+                item_counts=ArrayAgg('items__count', ordering='items__id'),
+            )
+            fields += ['item_foods', 'item_meals', 'item_counts']
+        rows = queryset.values(*fields).iterator(chunk_size=500)
+
+        date_field = JalaliDateField()
+
+        def tokens():
+            for row in rows:
+                if settings.TOKEN_SIGNED_QR:
+                    items = [
+                        item for item in zip(row['item_foods'], row['item_meals'], row['item_counts'])
+                        if item[0] is not None
+                    ]
+                    row['qr_data'] = token_qr_data(row['id'], row['token_code'], row['date'], items)
+                row['date'] = date_field.to_representation(row['date'])
+                yield row
+
+        response = StreamingHttpResponse(
+            print_sheet(tokens(), columns=params['columns'], rows=params['rows']),
+            content_type='application/pdf',
+        )
+        response['Content-Disposition'] = 'inline; filename="tokens.pdf"'
+        return response
+
+    @action(detail=False, methods=['get'], permission_classes=[DeliveryDeskAccess], url_path='manifest')
+    @swagger_auto_schema(
+        operation_summary="Offline delivery manifest",
+        operation_description="Binary manifest of a date's pending token codes and portions, sorted by code for binary search, optionally followed by a Bloom filter. With since (generated_at of a previous manifest, unix ms) only tokens changed after it are returned, with their status. If a token of the date was deleted after since, the full manifest is returned instead (since = 0 in its header). The layout is documented in apps/tokens/manifest.py. Requires delivery_desk role.",
+        query_serializer=TokenManifestQuerySerializer,
+        responses={
+            200: openapi.Response(description='application/octet-stream manifest'),
+            304: 'Not modified',
+            400: 'Validation error'
+        },
+        tags=['Token Status']
+    )
+    def manifest(self, request):
+        """Compact manifest (or delta) of a day's tokens for offline desks"""
+        params = TokenManifestQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        data, etag = get_manifest(
+            params['date'],
+            since=params.get('since'),
+            bloom_error_rate=params['bloom_error_rate'] if params['bloom'] else None,
+            if_none_match=request.headers.get('If-None-Match', ''),
+        )
+        if data is None:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(data, content_type='application/octet-stream')
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
     @swagger_auto_schema(
         operation_summary="List issued tokens",
         operation_description="Retrieve all issued tokens. Requires token_issuer role.",
@@ -112,6 +251,77 @@ class TokenViewSet(viewsets.ModelViewSet):
         token = serializer.update_status()
         
         # Return token with updated status
-        response_serializer = TokenListSerializer(token)
+        response_serializer = TokenListSerializer(token, context={'request': request})
         return Response(response_serializer.data, status=status.HTTP_200_OK)
 
+
+    @action(detail=False, methods=['post'], permission_classes=[DeliveryDeskAccess], url_path='mark-received/batch')
+    @swagger_auto_schema(
+        operation_summary="Batch mark tokens as received",
+        operation_description="Apply buffered scanner uploads (token codes with scan timestamps) in one statement. Returns a result per scan: received, already_received or unknown. Replaying the same idempotency_key returns the stored results without changing any token. Requires delivery_desk role.",
+        request_body=TokenBatchReceiveSerializer,
+        responses={
+            200: TokenBatchReceiveResultSerializer(),
+            400: 'Validation error'
+        },
+        tags=['Token Status']
+    )
+    def mark_received_batch(self, request):
+        """Mark many tokens as received from one scanner upload"""
+        serializer = TokenBatchReceiveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results, replayed = serializer.save(user=request.user)
+
+        counts = {choice: 0 for choice in ('received', 'already_received', 'unknown')}
+        for row in results:
+            counts[row['result']] += 1
+        return Response({'replayed': replayed, **counts, 'results': results}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], permission_classes=[DeliveryDeskAccess], url_path='verify')
+    @swagger_auto_schema(
+        operation_summary="Verify signed QR payload",
+        operation_description="Check the HMAC of a signed token QR payload (TOKEN_SIGNED_QR) and return its contents: token id and code, date and items. Only the signature is checked; the token's status is not read. Requires delivery_desk role.",
+        request_body=TokenVerifySerializer,
+        responses={
+            200: openapi.Response(
+                description='Verified token contents',
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT)
+            ),
+            400: 'Invalid signature'
+        },
+        tags=['Token Status']
+    )
+    def verify(self, request):
+        """Verify a signed QR payload without touching the token"""
+        serializer = TokenVerifySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class TokenImageView(APIView):
+    """
+    Barcode/QR image of a token, rendered on first request and then served
+    from the image cache. Public like the stored media files it replaces.
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    @swagger_auto_schema(
+        operation_summary="Token barcode/QR image",
+        operation_description="Render the token's barcode or QR code as PNG or SVG. Responses carry a strong ETag and are cacheable for a year.",
+        responses={200: 'Image', 304: 'Not modified', 404: 'Token not found'},
+        tags=['Token Images']
+    )
+    def get(self, request, code, kind, fmt):
+        etag = image_etag(kind, fmt, code)
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        else:
+            try:
+                data = get_token_image(kind, fmt, code)
+            except Token.DoesNotExist:
+                raise Http404('توکن با این کد یافت نشد.')
+            response = HttpResponse(data, content_type=CONTENT_TYPES[fmt])
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=31536000, immutable=True)
+        return response
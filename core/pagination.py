@@ -0,0 +1,104 @@
+"""
+Pagination shared by the list endpoints.
+
+Lists keep the page-number pagination by default. Viewsets that set
+cursor_ordering also accept ?pagination=cursor, which switches to keyset
+pagination: no COUNT(*) and no OFFSET, each page is an index range scan
+starting right after the last row of the previous one, so page 10,000
+costs the same as page 1.
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, datetime
+import json
+
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetOrPageNumberPagination(PageNumberPagination):
+    """
+    PageNumberPagination with an opt-in keyset mode.
+
+    The viewset's cursor_ordering is (field, 'id') or ('-field', '-id');
+    the pair must be backed by a composite index. A cursor is the
+    (field, id) of the last row on the page.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    invalid_cursor_message = 'مکان‌نمای صفحه‌بندی نامعتبر است.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_ordering = getattr(view, 'cursor_ordering', None)
+        self.keyset = bool(self.cursor_ordering) and (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_query_param in request.query_params
+        )
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        field_name = self.cursor_ordering[0].lstrip('-')
+        self.descending = self.cursor_ordering[0].startswith('-')
+        self.field = queryset.model._meta.get_field(field_name)
+
+        queryset = queryset.order_by(*self.cursor_ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            value, pk = self._decode_cursor(cursor)
+            meta = queryset.model._meta
+            table = connection.ops.quote_name(meta.db_table)
+            columns = f'{table}.{connection.ops.quote_name(self.field.column)}, {table}.{connection.ops.quote_name(meta.pk.column)}'
+            comparison = '<' if self.descending else '>'
+            # A row comparison lets PostgreSQL start the index scan at the cursor
+            queryset = queryset.filter(RawSQL(
+                f'({columns}) {comparison} (%s, %s)',
+                [value, pk],
+                output_field=models.BooleanField(),
+            ))
+
+        page_size = self.get_page_size(request)
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page_rows = rows[:page_size]
+        return self.page_rows
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        last = self.page_rows[-1]
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, self._encode_cursor(last))
+
+    def _encode_cursor(self, row):
+        value = getattr(row, self.field.attname)
+        if hasattr(value, 'togregorian'):
+            value = value.togregorian()
+        payload = json.dumps([value.isoformat(), row.pk], separators=(',', ':'))
+        return urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def _decode_cursor(self, cursor):
+        try:
+            raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            value, pk = json.loads(raw)
+            if isinstance(self.field, models.DateTimeField):
+                value = datetime.fromisoformat(value)
+            else:
+                value = date.fromisoformat(value)
+            return value, int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
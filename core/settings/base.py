@@ -19,6 +19,9 @@ SECRET_KEY = os.environ.get('SECRET_KEY', 'django-insecure-change-this-in-produc
 
 # SECURITY WARNING: don't run with debug turned on in production!
 
+# Key for the reversible token/sale code encoding (apps/tokens/codes.py).
+# Changing it changes the code of every future id, so keep it stable.
+CODE_ENCODING_KEY = os.environ.get('CODE_ENCODING_KEY', SECRET_KEY)
 
 
 # Application definition
@@ -134,6 +137,35 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Token barcode/QR images are rendered on demand by /api/tokens/<code>/<kind>.<fmt>.
+# Set TOKEN_STORE_IMAGES=True to also keep PNG copies in MEDIA_ROOT (image worker).
+TOKEN_STORE_IMAGES = os.environ.get('TOKEN_STORE_IMAGES', 'False') == 'True'
+# Default on-demand format: 'png' (1-bit) or 'svg'; overridable per request with ?image_format=
+TOKEN_IMAGE_FORMAT = os.environ.get('TOKEN_IMAGE_FORMAT', 'png')
+TOKEN_IMAGE_MEMORY_CACHE_SIZE = int(os.environ.get('TOKEN_IMAGE_MEMORY_CACHE_SIZE', 512))
+# Put a signed payload (id, date, items, HMAC) in token QR codes instead of the bare code
+TOKEN_SIGNED_QR = os.environ.get('TOKEN_SIGNED_QR', 'False') == 'True'
+TOKEN_SIGNING_KEY = os.environ.get('TOKEN_SIGNING_KEY', SECRET_KEY)
+
+# Low-stock reorder point: the larger of an ingredient's warning amount and its average daily
+# consumption over the trailing window times the days a delivery takes (apps.ingredients.reorder)
+INVENTORY_REORDER_WINDOW_DAYS = int(os.environ.get('INVENTORY_REORDER_WINDOW_DAYS', 28))
+INVENTORY_REORDER_LEAD_DAYS = int(os.environ.get('INVENTORY_REORDER_LEAD_DAYS', 3))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'token_images': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('TOKEN_IMAGE_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'token_images')),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('TOKEN_IMAGE_CACHE_MAX_ENTRIES', 50000)),
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -151,7 +183,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetOrPageNumberPagination',
     'PAGE_SIZE': 20,
 }
 
@@ -0,0 +1,97 @@
+"""
+Helpers shared by the apps' test suites.
+"""
+from django.conf import settings
+
+from apps.accounts.models import User
+from apps.foods.models import Food
+
+
+PAGE_SIZE = settings.REST_FRAMEWORK['PAGE_SIZE']
+
+
+class ItemListTestsMixin:
+    """
+    Tests for a list/detail endpoint whose rows embed their items, mixed
+    into an APITestCase. The query counts stay flat however many rows and
+    items a page has, so an N+1 regression fails them, and the payloads are
+    checked against the database: newest rows first, each row's own items
+    in creation order, and the keyset cursor continuing where the previous
+    page stopped.
+
+    Subclasses set url and role, and create_rows(foods) returns the rows in
+    creation order, each with one item per food (related name items).
+    """
+    url = None
+    role = None
+    # COUNT(*), the page, the page's items with their foods
+    list_queries = 3
+    # Keyset pages skip COUNT(*)
+    cursor_queries = 2
+    # The row, its items with their foods
+    retrieve_queries = 2
+
+    # One full page and part of the next
+    ROWS = PAGE_SIZE + 5
+    ITEMS_PER_ROW = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username=f'{cls.role}_user', roles=[cls.role])
+        foods = [
+            Food.objects.create(
+                title=f'غذا {i}', category='normal', subcategory='staff',
+                meal_types=['lunch', 'dinner'], preparation_time=10, unit_price=100 + i,
+            )
+            for i in range(cls.ITEMS_PER_ROW)
+        ]
+        cls.rows = cls.create_rows(foods)
+
+    @classmethod
+    def create_rows(cls, foods):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def assertRows(self, results, rows):
+        """results are the payloads of rows, with their items"""
+        self.assertEqual([result['id'] for result in results], [row.id for row in rows])
+        for result, row in zip(results, rows):
+            self.assertEqual(
+                [
+                    (item['id'], item['food'], item['food_title'], item['meal_type'], item['count'])
+                    for item in result['items']
+                ],
+                [
+                    (item.id, item.food_id, item.food.title, item.meal_type, item.count)
+                    for item in row.items.select_related('food').order_by('id')
+                ],
+            )
+
+    def test_list(self):
+        with self.assertNumQueries(self.list_queries):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], self.ROWS)
+        self.assertRows(response.data['results'], self.rows[::-1][:PAGE_SIZE])
+
+    def test_cursor_pages(self):
+        newest = self.rows[::-1]
+        with self.assertNumQueries(self.cursor_queries):
+            response = self.client.get(self.url, {'pagination': 'cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertRows(response.data['results'], newest[:PAGE_SIZE])
+
+        with self.assertNumQueries(self.cursor_queries):
+            response = self.client.get(response.data['next'])
+        self.assertEqual(response.status_code, 200)
+        self.assertRows(response.data['results'], newest[PAGE_SIZE:])
+        self.assertIsNone(response.data['next'])
+
+    def test_retrieve(self):
+        row = self.rows[1]
+        with self.assertNumQueries(self.retrieve_queries):
+            response = self.client.get(f'{self.url}{row.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRows([response.data], [row])